@@ -0,0 +1,423 @@
+"""Content addressed backup store for the JSON cog's segmented database.
+
+Each backup is a small manifest listing, for every guild, a chunk per filing cabinet. Chunks are stored compressed
+under the SHA-256 of their contents, so a cabinet that hasn't changed since the previous backup costs nothing to back
+up again. Guilds whose segment file hasn't changed since the previous backup aren't even read.
+
+In journal mode the segments on disk are only as new as the last compaction, so the journal files are backed up along
+with them as raw chunks. Restoring a backup puts the journal back, and the JSON cog replays it when it loads.
+
+Layout of the store folder:
+    objects/ab/abcdef...    zlib compressed chunks, named after the hash of the uncompressed chunk
+    snapshots/<name>.json   one manifest per backup
+
+Old backups are pruned by a retention policy that keeps every backup from the last hour, and then the newest backup of
+each of the last few hours, days and weeks. Chunks that no remaining backup uses are deleted along with them.
+
+Usage:
+    python3 backup_store.py list
+    python3 backup_store.py backup [database folder]
+    python3 backup_store.py restore <backup name, date and time, or "latest"> <output folder> [--serializer pickle] [--journal database.journal]
+    python3 backup_store.py prune
+"""
+from __future__ import annotations
+
+import typing
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import shutil
+import argparse
+from datetime import datetime
+
+import serialization
+
+DEFAULT_STORE_PATH = "backup/store/"
+
+# The chunks are always stored as compact JSON, so a backup can be restored with any serializer.
+CHUNK_SERIALIZER = "json_compact"
+COMPRESSION_LEVEL = 9
+
+# Retention policy. Every backup from the last `KEEP_ALL` seconds is kept, along with the newest backup in each of the
+# last `KEEP_HOURLY` hours, `KEEP_DAILY` days and `KEEP_WEEKLY` weeks.
+KEEP_ALL = 60 * 60
+KEEP_HOURLY = 24
+KEEP_DAILY = 14
+KEEP_WEEKLY = 8
+
+META_NAME = "meta" # Name used in the manifests for everything in the index that isn't a guild.
+
+####################################################
+###############   FILE HELPERS   ###################
+####################################################
+
+def write_atomic(
+        file_path: str,
+        raw: bytes
+    ) -> None:
+    """Writes the given bytes into a temporary file and then renames it over the given path."""
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'wb') as outfile:
+        outfile.write(raw)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+
+    os.replace(temp_path, file_path)
+
+def get_object_path(
+        store_path: str,
+        chunk_hash: str
+    ) -> str:
+    """Returns the path of the object file for the given chunk hash."""
+    return os.path.join(store_path, "objects", chunk_hash[:2], chunk_hash)
+
+def store_chunk(
+        store_path: str,
+        data: typing.Any
+    ) -> tuple[str, bool]:
+    """Stores a chunk of data if it isn't in the store already.
+    Returns the hash of the chunk and a boolean for whether it had to be written."""
+    return store_raw_chunk(store_path, serialization.serialize(data, CHUNK_SERIALIZER))
+
+def store_raw_chunk(
+        store_path: str,
+        raw: bytes
+    ) -> tuple[str, bool]:
+    """Stores a chunk of bytes if it isn't in the store already.
+    Returns the hash of the chunk and a boolean for whether it had to be written."""
+    chunk_hash = hashlib.sha256(raw).hexdigest()
+
+    object_path = get_object_path(store_path, chunk_hash)
+    if os.path.exists(object_path):
+        return chunk_hash, False
+
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    write_atomic(object_path, zlib.compress(raw, COMPRESSION_LEVEL))
+    return chunk_hash, True
+
+def load_chunk(
+        store_path: str,
+        chunk_hash: str
+    ) -> typing.Any:
+    """Reads a chunk from the store."""
+    return serialization.deserialize(load_raw_chunk(store_path, chunk_hash), CHUNK_SERIALIZER)
+
+def load_raw_chunk(
+        store_path: str,
+        chunk_hash: str
+    ) -> bytes:
+    """Reads a chunk from the store as bytes."""
+    with open(get_object_path(store_path, chunk_hash), 'rb') as object_file:
+        return zlib.decompress(object_file.read())
+
+####################################################
+################   SNAPSHOTS   #####################
+####################################################
+
+def list_snapshots(store_path: str = DEFAULT_STORE_PATH) -> list[dict]:
+    """Returns the manifest of every backup in the store, oldest first."""
+    folder_path = os.path.join(store_path, "snapshots")
+    if not os.path.exists(folder_path):
+        return []
+
+    output = []
+    for file_name in os.listdir(folder_path):
+        if not file_name.endswith(".json"):
+            continue
+
+        with open(os.path.join(folder_path, file_name)) as manifest_file:
+            output.append(json.load(manifest_file))
+
+    output.sort(key=lambda manifest: manifest["created"])
+    return output
+
+def find_snapshot(
+        when: str,
+        store_path: str = DEFAULT_STORE_PATH
+    ) -> typing.Union[dict, None]:
+    """Finds a backup by name, or returns the newest backup made at or before the given date and time.
+    `when` can be a backup name, "latest", or anything `datetime.fromisoformat` understands, like "2024-05-01 14:00".
+    Returns None if there's no such backup."""
+    snapshots = list_snapshots(store_path)
+    if len(snapshots) == 0:
+        return None
+
+    if when == "latest":
+        return snapshots[-1]
+
+    for manifest in snapshots:
+        if manifest["name"] == when:
+            return manifest
+
+    try:
+        timestamp = datetime.fromisoformat(when).timestamp()
+    except ValueError:
+        return None
+
+    earlier = [manifest for manifest in snapshots if manifest["created"] <= timestamp]
+    if len(earlier) == 0:
+        return None
+
+    return earlier[-1]
+
+def create_snapshot(
+        segment_folder: str,
+        store_path: str = DEFAULT_STORE_PATH,
+        index_file_name: str = "index.json",
+        journal_paths: typing.Iterable[str] = ()
+    ) -> dict:
+    """Backs up the segmented database in the given folder into the store.
+    Guilds whose segment file is unchanged since the previous backup reuse its chunks without being read.
+    The given journal files, oldest first, are backed up too, with whatever changes they have that aren't in the
+    segments yet. Ones that don't exist are skipped.
+    Returns the manifest of the new backup, with `written` and `reused` chunk counts added."""
+    start = time.perf_counter()
+
+    with open(os.path.join(segment_folder, index_file_name), 'rb') as index_file:
+        index = serialization.deserialize(index_file.read())
+
+    segment_serializer = index.get("serializer", "json")
+    extension = serialization.get_extension(segment_serializer)
+
+    snapshots = list_snapshots(store_path)
+    previous = snapshots[-1]["guilds"] if len(snapshots) > 0 else dict()
+
+    written = 0
+    reused = 0
+
+    meta_hash, new_chunk = store_chunk(store_path, index["meta"])
+    written += new_chunk
+
+    guilds = dict()
+    for guild_id in index["guilds"]:
+        segment_path = os.path.join(segment_folder, guild_id + extension)
+        stat = os.stat(segment_path)
+        segment_stat = [stat.st_mtime_ns, stat.st_size]
+
+        previous_entry = previous.get(guild_id)
+        if previous_entry is not None and previous_entry["stat"] == segment_stat:
+            guilds[guild_id] = previous_entry
+            reused += len(previous_entry["cabinets"])
+            continue
+
+        with open(segment_path, 'rb') as segment_file:
+            vault = serialization.deserialize(segment_file.read(), segment_serializer)
+
+        cabinets = dict()
+        for cabinet_name, cabinet in vault.items():
+            cabinets[cabinet_name], new_chunk = store_chunk(store_path, cabinet)
+            if new_chunk:
+                written += 1
+            else:
+                reused += 1
+
+        guilds[guild_id] = {
+            "stat": segment_stat,
+            "cabinets": cabinets
+        }
+
+    # The journal is read after the segments, so it covers everything since them. If a record is being appended
+    # while it's read, the cut off line at the end is discarded when the journal is replayed.
+    journal = []
+    for journal_path in journal_paths:
+        try:
+            with open(journal_path, 'rb') as journal_file:
+                raw = journal_file.read()
+        except FileNotFoundError:
+            continue
+
+        if len(raw) == 0:
+            continue
+
+        chunk_hash, new_chunk = store_raw_chunk(store_path, raw)
+        journal.append(chunk_hash)
+        written += new_chunk
+        reused += not new_chunk
+
+    now = time.time()
+    name = datetime.fromtimestamp(now).strftime("%Y-%m-%d_%H-%M-%S")
+    manifest = {
+        "name": name,
+        "created": now,
+        META_NAME: meta_hash,
+        "guilds": guilds,
+        "journal": journal
+    }
+
+    folder_path = os.path.join(store_path, "snapshots")
+    os.makedirs(folder_path, exist_ok=True)
+    write_atomic(os.path.join(folder_path, f"{name}.json"), json.dumps(manifest, separators=(",", ":")).encode("utf-8"))
+
+    print("Backup {} created in {:.1f} ms, {} chunks written and {} reused.".format(
+        name, (time.perf_counter() - start) * 1000, written, reused
+    ))
+
+    manifest["written"] = written
+    manifest["reused"] = reused
+    return manifest
+
+def restore_snapshot(
+        manifest: dict,
+        output_folder: str,
+        store_path: str = DEFAULT_STORE_PATH,
+        serializer: str = "json_compact",
+        index_file_name: str = "index.json",
+        journal_path: typing.Optional[str] = None
+    ) -> None:
+    """Writes the database in the given backup into the given folder as a segmented database the JSON cog can load.
+    The folder is replaced as a whole, so it's never left half restored.
+    If the backup has a journal it's written to `journal_path`, for the JSON cog to replay on top of the segments.
+    Any journal already there is replaced, and removed if the backup doesn't have one."""
+    temp_folder = output_folder.rstrip("/") + ".restoring"
+    if os.path.exists(temp_folder):
+        shutil.rmtree(temp_folder)
+    os.makedirs(temp_folder)
+
+    extension = serialization.get_extension(serializer)
+    guild_index = dict()
+    for guild_id, entry in manifest["guilds"].items():
+        vault = {
+            cabinet_name: load_chunk(store_path, chunk_hash)
+            for cabinet_name, chunk_hash in entry["cabinets"].items()
+        }
+        guild_index[guild_id] = list(vault.keys())
+        write_atomic(os.path.join(temp_folder, guild_id + extension), serialization.serialize(vault, serializer))
+
+    index = {
+        "meta": load_chunk(store_path, manifest[META_NAME]),
+        "guilds": guild_index,
+        "serializer": serializer
+    }
+    write_atomic(os.path.join(temp_folder, index_file_name), serialization.serialize(index, "json_compact"))
+
+    if os.path.exists(output_folder):
+        shutil.rmtree(output_folder)
+    os.replace(temp_folder, output_folder)
+
+    if journal_path is None:
+        if len(manifest.get("journal", [])) > 0:
+            print("This backup has a journal, which wasn't restored since no path was given for it.")
+        return
+
+    # Backups from before journals were backed up don't list any.
+    journal = b"".join(load_raw_chunk(store_path, chunk_hash) for chunk_hash in manifest.get("journal", []))
+    if len(journal) > 0:
+        write_atomic(journal_path, journal)
+    elif os.path.exists(journal_path):
+        os.remove(journal_path)
+
+####################################################
+################   RETENTION   #####################
+####################################################
+
+def select_retained(
+        snapshots: list[dict],
+        now: typing.Optional[float] = None
+    ) -> set[str]:
+    """Returns the names of the backups the retention policy keeps, out of the given manifests (oldest first)."""
+    if len(snapshots) == 0:
+        return set()
+
+    if now is None:
+        now = time.time()
+
+    policies = [
+        (KEEP_HOURLY * 60 * 60, "%Y-%m-%d %H"),
+        (KEEP_DAILY * 24 * 60 * 60, "%Y-%m-%d"),
+        (KEEP_WEEKLY * 7 * 24 * 60 * 60, "%G-%V"),
+    ]
+
+    retained = {snapshots[-1]["name"]}
+    retained.update(manifest["name"] for manifest in snapshots if now - manifest["created"] <= KEEP_ALL)
+    for max_age, bucket_format in policies:
+        newest_in_bucket = dict()
+        for manifest in snapshots:
+            if now - manifest["created"] > max_age:
+                continue
+
+            # Later backups replace earlier ones, so this ends up with the newest in each bucket.
+            bucket = datetime.fromtimestamp(manifest["created"]).strftime(bucket_format)
+            newest_in_bucket[bucket] = manifest["name"]
+
+        retained.update(newest_in_bucket.values())
+
+    return retained
+
+def prune(
+        store_path: str = DEFAULT_STORE_PATH,
+        now: typing.Optional[float] = None
+    ) -> tuple[int, int]:
+    """Deletes the backups the retention policy doesn't keep, and then every chunk no remaining backup uses.
+    Returns the amount of backups and chunks deleted."""
+    snapshots = list_snapshots(store_path)
+    retained = select_retained(snapshots, now)
+
+    deleted_snapshots = 0
+    used = set()
+    for manifest in snapshots:
+        if manifest["name"] not in retained:
+            os.remove(os.path.join(store_path, "snapshots", f"{manifest['name']}.json"))
+            deleted_snapshots += 1
+            continue
+
+        used.add(manifest[META_NAME])
+        used.update(manifest.get("journal", []))
+        for entry in manifest["guilds"].values():
+            used.update(entry["cabinets"].values())
+
+    deleted_chunks = 0
+    objects_path = os.path.join(store_path, "objects")
+    if os.path.exists(objects_path):
+        for prefix in os.listdir(objects_path):
+            for chunk_hash in os.listdir(os.path.join(objects_path, prefix)):
+                if chunk_hash not in used:
+                    os.remove(os.path.join(objects_path, prefix, chunk_hash))
+                    deleted_chunks += 1
+
+    if deleted_snapshots or deleted_chunks:
+        print(f"Pruned {deleted_snapshots} backups and {deleted_chunks} chunks.")
+
+    return deleted_snapshots, deleted_chunks
+
+####################################################
+###################   CLI   ########################
+####################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the incremental database backups.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="path of the backup store")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    subparsers.add_parser("list", help="list every backup")
+
+    backup_parser = subparsers.add_parser("backup", help="back up a segmented database")
+    backup_parser.add_argument("database", nargs="?", default="database/")
+
+    restore_parser = subparsers.add_parser("restore", help="restore a backup into a folder")
+    restore_parser.add_argument("when", help='backup name, date and time, or "latest"')
+    restore_parser.add_argument("output")
+    restore_parser.add_argument("--serializer", default="json_compact", choices=serialization.SERIALIZERS)
+    restore_parser.add_argument("--journal", default=None, help="where to write the journal of the backup, if it has one")
+
+    subparsers.add_parser("prune", help="apply the retention policy")
+
+    arguments = parser.parse_args()
+
+    if arguments.action == "list":
+        for manifest in list_snapshots(arguments.store):
+            print(f"{manifest['name']}  {len(manifest['guilds'])} guilds")
+    elif arguments.action == "backup":
+        create_snapshot(arguments.database, arguments.store)
+    elif arguments.action == "restore":
+        manifest = find_snapshot(arguments.when, arguments.store)
+        if manifest is None:
+            print(f"No backup found for {arguments.when}.")
+            sys.exit(1)
+
+        restore_snapshot(manifest, arguments.output, arguments.store, arguments.serializer, journal_path=arguments.journal)
+        print(f"Restored {manifest['name']} into {arguments.output}.")
+    elif arguments.action == "prune":
+        prune(arguments.store)
@@ -13,6 +13,76 @@ import bread_cog
 bread_cog_ref = None
 
 
+class Inventory_Index:
+    """Index of the items in an account, so the items with a given attribute can be found without going through every
+    key in the account. Keys are kept in the same order as in the account's values."""
+
+    def __init__(
+            self: typing.Self,
+            account_values: dict
+        ) -> None:
+        self.items = dict() # key -> Emote, for every key in the account that's an item.
+        self.attributes = dict() # attribute -> {key -> Emote} of every item with that attribute.
+        self.totals = dict() # attribute -> total amount of the items with that attribute.
+
+        for key, value in account_values.items():
+            self.add(key, value)
+
+    @staticmethod
+    def amount(value: typing.Any) -> int:
+        """Returns how much a value counts towards the totals."""
+        return value if type(value) is int else 0
+
+    def add(
+            self: typing.Self,
+            key: str,
+            value: typing.Any
+        ) -> None:
+        """Adds a new key to the index, if it's an item."""
+        item = values.get_emote(key)
+        if item is None:
+            return
+        
+        self.items[key] = item
+        amount = self.amount(value)
+        for attribute in item.attributes:
+            self.attributes.setdefault(attribute, dict())[key] = item
+            self.totals[attribute] = self.totals.get(attribute, 0) + amount
+
+    def change(
+            self: typing.Self,
+            key: str,
+            old_value: typing.Any,
+            new_value: typing.Any
+        ) -> None:
+        """Updates the totals for a key that's already in the account getting a new value."""
+        item = self.items.get(key)
+        if item is None:
+            return
+        
+        difference = self.amount(new_value) - self.amount(old_value)
+        if difference == 0:
+            return
+        
+        for attribute in item.attributes:
+            self.totals[attribute] += difference
+
+    def remove(
+            self: typing.Self,
+            key: str,
+            old_value: typing.Any
+        ) -> None:
+        """Removes a key from the index."""
+        item = self.items.pop(key, None)
+        if item is None:
+            return
+        
+        amount = self.amount(old_value)
+        for attribute in item.attributes:
+            del self.attributes[attribute][key]
+            self.totals[attribute] -= amount
+
+
 class Bread_Account:
 
 
@@ -27,6 +97,21 @@ class Bread_Account:
     
     _can_salvage_cache: bool
 
+    # Copy-on-write. `values` starts out as the account's dict in the bread data itself, so reading an account doesn't
+    # copy anything. The first write copies it, and `commit` later writes back only the keys that were changed.
+    # Because of this, anything that changes `values` has to go through `set`, `increment`, `set_value`,
+    # `increment_value` or `delete` rather than writing into it directly.
+    _stored = None # The dict in the bread data that `values` was read from, or None if it isn't from there.
+    _changed = None # The keys written since `values` was read or committed, or None if there haven't been any.
+
+    # The inventory index, built the first time an item or category query needs it and kept up to date by every write
+    # after that. Whenever `values` is replaced as a whole this is set back to None.
+    _inventory = None
+
+    # While `trace_reads` is running, the set of keys read from `values` so far. None is added to it when something is
+    # read that can't be traced back to a key, like the inventory index or the map.
+    _reads = None
+
     default_values = {
         "total_dough" : 0,
         "lifetime_dough" : 0,
@@ -66,6 +151,9 @@ class Bread_Account:
         self.user_id = user_id
         self.json_interface = json_interface
         self._can_salvage_cache = None
+        self._stored = None
+        self._changed = None
+        self._inventory = None
 
     def reset_to_default(self: typing.Self) -> None:
         """Resets the account to default values."""
@@ -73,6 +161,8 @@ class Bread_Account:
         display_name = self.get("display_name")
         guild_id = self.get("guild_id")
         user_id = self.get("id")
+        self._stored = None # Replaced as a whole, so it has to be stored as a whole.
+        self._inventory = None
         self.values = {
             "total_dough" : 0,
             "earned_dough" : 0,
@@ -244,6 +334,9 @@ class Bread_Account:
         if isinstance(key, Emote):
             key = key.text
 
+        if self._reads is not None:
+            self._reads.add(key)
+
         if not key in self.values:
             return False
         
@@ -260,7 +353,7 @@ class Bread_Account:
         if isinstance(key, Emote):
             key = key.text
         
-        self.values[key] = self.get(key) + amount
+        self._store(key, self.get(key) + amount)
 
     def get(
             self: typing.Self,
@@ -268,6 +361,9 @@ class Bread_Account:
             default: typing.Any = 0
         ) -> typing.Any:
         """Gets a value from this account's values dict. If the account does not have it the default values will be returned, and, if all else fails, return the default."""
+        if self._reads is not None:
+            self._reads.add(key)
+
         if key in self.values.keys():
             return self.values[key]
         elif key in self.default_values.keys():
@@ -281,14 +377,77 @@ class Bread_Account:
             value: typing.Any
         ) -> None:
         """Sets a value in this account's values dict."""
+        self._store(key, value)
+
+    def delete(
+            self: typing.Self,
+            key: str
+        ) -> None:
+        """Removes a value from this account's values dict, if it's there."""
+        if key not in self.values:
+            return
+
+        self._prepare_write(key)
+        if self._inventory is not None:
+            self._inventory.remove(key, self.values[key])
+        del self.values[key]
+
+    def _store(
+            self: typing.Self,
+            key: str,
+            value: typing.Any
+        ) -> None:
+        """Writes a value into `values`, keeping the inventory index up to date. Every write goes through here."""
+        self._prepare_write(key)
+
+        inventory = self._inventory
+        if inventory is not None:
+            if key in self.values:
+                inventory.change(key, self.values[key], value)
+            else:
+                inventory.add(key, value)
+        
         self.values[key] = value
 
+    def _prepare_write(
+            self: typing.Self,
+            key: str
+        ) -> None:
+        """Copies `values` before the first write to it, so the bread data isn't changed until `commit` is called,
+        and records the given key as changed."""
+        if self._changed is None:
+            if self.values is self._stored:
+                self.values = self.values.copy()
+            self._changed = set()
+        
+        self._changed.add(key)
+
+    def trace_reads(
+            self: typing.Self,
+            function: typing.Callable,
+            *args
+        ) -> tuple[typing.Any, set]:
+        """Calls the given function, and returns what it returned along with the set of keys it read from this account.
+        Reads that can't be traced to a key add None to the set."""
+        previous = self._reads
+        self._reads = set()
+        try:
+            result = function(*args)
+            return result, self._reads
+        finally:
+            if previous is not None:
+                previous.update(self._reads)
+            self._reads = previous
+
     def boolean_is(
             self: typing.Self,
             value: str,
             default: bool = False
         ) -> bool:
         """The same as `.get()`, but used for booleans, and it won't use the default values dict."""
+        if self._reads is not None:
+            self._reads.add(value)
+
         if value in self.values.keys():
             return self.values[value]
         return default
@@ -434,6 +593,40 @@ class Bread_Account:
             value = stonk_count * stonk_value
             total_value += value
         return total_value
+
+    def invest_stonk(
+            self: typing.Self,
+            stonk: str,
+            amount: int,
+            stonk_value: int
+        ) -> int:
+        """Buys up to `amount` of a stonk at the given value each, or as many as this player can afford if that's less.
+        Returns the amount bought."""
+        amount = max(0, min(amount, self.get_dough() // stonk_value))
+        cost = amount * stonk_value
+
+        self.increment("total_dough", -cost)
+        self.increment(stonk, amount)
+        self.increment("investment_profit", -cost)
+
+        return amount
+
+    def divest_stonk(
+            self: typing.Self,
+            stonk: str,
+            amount: int,
+            stonk_value: int
+        ) -> int:
+        """Sells up to `amount` of a stonk at the given value each, or all of it if this player has less.
+        Returns the amount sold."""
+        amount = max(0, min(amount, self.get(stonk)))
+        profit = amount * stonk_value
+
+        self.increment("total_dough", profit)
+        self.increment(stonk, -amount)
+        self.increment("investment_profit", profit)
+
+        return amount
     
     def get_active_multirollers(self: typing.Self) -> int:
         """Returns the number of active multiroller this player has.
@@ -542,6 +735,16 @@ class Bread_Account:
         if self.get_space_level() == 0:
             return False
         
+        if self._reads is not None:
+            # Besides the trade hub data, which clears `store.shop_availability` when it's changed, this only depends
+            # on where the player is. Those are read here too so they're traced even when the result is cached.
+            self.get("guild_id")
+            self.get_prestige_level()
+            self.get("galaxy_move_count")
+            self.get("galaxy_xpos")
+            self.get("galaxy_ypos")
+            self.get_system_location()
+
         if self._can_salvage_cache is not None:
             return self._can_salvage_cache
         
@@ -586,7 +789,7 @@ class Bread_Account:
             item: Emote
         ) -> int:
         """Returns the amount of extra dough this player gets from the Gambit Shop for the given item."""
-        boosts_file = self.values.get("dough_boosts", dict())
+        boosts_file = self.get("dough_boosts", dict())
         if item.text in boosts_file.keys():
             return boosts_file[item.text]
         else:
@@ -600,7 +803,7 @@ class Bread_Account:
         """Sets an item's dough boost for this player to the given value."""
         boosts_file = self.values.get("dough_boosts", dict())
         boosts_file[item.text] = boost
-        self.values["dough_boosts"] = boosts_file
+        self.set("dough_boosts", boosts_file)
 
     def get_chessatron_dough_amount(
             self: typing.Self,
@@ -662,13 +865,10 @@ class Bread_Account:
         ) -> list[Emote]:
         """Returns a list of values.Emote objects that this player has."""
         items = []
+        attributes = self.get_inventory().attributes
         # we try with both the name and the name minus its last letter, in case there's an 's' at the end
         for category_name in [category, category[:-1]]:
-            for item_name in self.values.keys():
-                item = values.get_emote(item_name)
-                if item is not None:
-                    if category_name.lower() in item.attributes:
-                        items.append(item)
+            items.extend(attributes.get(category_name.lower(), dict()).values())
         return items
 
     ##############################################################
@@ -762,46 +962,47 @@ class Bread_Account:
 
     ##############################################################
 
+    def get_inventory(self: typing.Self) -> Inventory_Index:
+        """Returns the inventory index of this account, building it if needed."""
+        if self._reads is not None:
+            self._reads.add(None)
+
+        if self._inventory is None:
+            self._inventory = Inventory_Index(self.values)
+        
+        return self._inventory
+
     #gets all items
     def get_all_items(self: typing.Self) -> list[Emote]:
         """Gets a list of every item this player has."""
-        items = []
-        for key in self.values.keys():
-            item = values.get_emote(key)
-            if item is not None:
-                items.append(item)
-        return items
+        return list(self.get_inventory().items.values())
 
     def get_all_items_with_attribute(
             self: typing.Self,
             attribute: str
         ) -> list[Emote]:
         """Gets a list of every item this player has, that has the given attribute."""
-        items = []
-        for key in self.values.keys():
-            item = values.get_emote(key)
-            if item is not None:
-                if attribute in item.attributes:
-                    items.append(item)
-        return items
+        return list(self.get_inventory().attributes.get(attribute, dict()).values())
 
-    def get_all_items_with_attribute_unrolled(
+    def get_attribute_total(
             self: typing.Self,
             attribute: str
-        ) -> list[Emote]:
-        """Same as `.get_all_items_with_attribute()`, but each item is in the list an amount of times equal to the amount the player has.
-        
-        On some accounts this will completely freeze the bot."""
-        items = []
-        for key in self.values.keys():
-            item = values.get_emote(key)
-            if item is not None:
-                if attribute in item.attributes:
-                    # append repeatedly for each item
-                    for i in range(self.get(key)):
-                        items.append(item)
-                    #items.append(item)
-        return items
+        ) -> int:
+        """Returns the total amount of items with the given attribute this player has."""
+        return self.get_inventory().totals.get(attribute, 0)
+
+    def get_items_counted(
+            self: typing.Self,
+            attribute: str
+        ) -> utility.Multiset:
+        """Same as `.get_all_items_with_attribute()`, but as a multiset with the amount the player has of each item.
+        Items the player has none of are left out."""
+        output = utility.Multiset()
+        for key, item in self.get_inventory().attributes.get(attribute, dict()).items():
+            amount = self.get(key)
+            if type(amount) is int:
+                output.add(item, amount)
+        return output
 
     # output the number of times a value exists, as text
     def write_number_of_times(
@@ -838,6 +1039,9 @@ class Bread_Account:
             name: str
         ) -> typing.Any:
         """Stricter version of `.get()`, this doesn't refer to the default values dict, and returns None if the player does not have the stat."""
+        if self._reads is not None:
+            self._reads.add(name)
+
         if name in self.values.keys():
             return self.values[name]
         return None
@@ -848,6 +1052,9 @@ class Bread_Account:
             name: str
         ) -> typing.Any:
         """Slightly different version of `.get()`, this one returns 0 if the key is not found, but does not refer to the default values dict at all."""
+        if self._reads is not None:
+            self._reads.add(name)
+
         if name in self.values.keys():
             return self.values[name]
         return 0
@@ -859,7 +1066,7 @@ class Bread_Account:
         ) -> None:
         """Same as `.set()`, sets a value in this account's values dict."""
         #if name in self.values.keys():
-        self.values[name] = amount
+        self.set(name, amount)
 
     def increment_value(
             self: typing.Self,
@@ -867,9 +1074,7 @@ class Bread_Account:
             amount: int
         ) -> None:
         """Similar to `.increment()`, but this sets the stat to 0 if the player doesn't have it, and this doesn't refer to the default values dict."""
-        if name not in self.values.keys():
-            self.values[name] = 0
-        self.values[name] += amount
+        self._store(name, self.values.get(name, 0) + amount)
 
     ##############################################################
     ######  INPUT / OUTPUT
@@ -880,16 +1085,53 @@ class Bread_Account:
             entry: dict,
             json_interface: bread_cog.JSON_interface
         ) -> Bread_Account:
-        """Converts a dictionary and account id into a new Bread_Account object and returns said object."""
+        """Converts a dictionary and account id into a new Bread_Account object and returns said object.
+        The dictionary isn't copied, the account only copies it once something is written to it."""
         account = Bread_Account(account_id, json_interface)
-        account.values = entry.copy()
+        account.values = entry
+        account._stored = entry
         #if "lifetime_dough" not in account.values.keys() \
         #        and "total_dough" in account.values.keys():
         #    account.values["lifetime_dough"] = entry["total_dough"]
         if "earned_dough" not in account.values.keys():
-            account.values["earned_dough"] = account.values["total_dough"]
+            account.set("earned_dough", account.values["total_dough"])
         return account
 
     def to_dict(self: typing.Self) -> dict:
-        """Converts this account to a dict. This is just returning the `values` attribute."""
+        """Converts this account to a dict. This is just returning the `values` attribute, which may be the dict in the
+        bread data itself, so it shouldn't be modified."""
         return self.values
+
+    def get_copy(self: typing.Self) -> Bread_Account:
+        """Returns a copy of this account for trying out changes on, like checking later levels of a store item
+        without buying them. Writing to the copy doesn't change this account."""
+        account = Bread_Account.from_dict(self.user_id, self.values, self.json_interface)
+        account._can_salvage_cache = self._can_salvage_cache
+        return account
+
+    def commit(
+            self: typing.Self,
+            stored: typing.Optional[dict]
+        ) -> dict:
+        """Writes the changes made to this account into the given dict from the bread data, and returns the dict that
+        should be stored in the bread data from now on.
+        If this account was read from that dict only the changed keys are written, otherwise this account's values
+        replace it as a whole. Either way, the account then reads from the returned dict again."""
+        if stored is None or self._stored is not stored:
+            output = self.values
+        elif self._changed is not None and self.values is not stored:
+            for key in self._changed:
+                if key in self.values:
+                    stored[key] = self.values[key]
+                else:
+                    stored.pop(key, None)
+            
+            output = stored
+        else:
+            output = stored
+        
+        self.values = output
+        self._stored = output
+        self._changed = None
+        self._inventory = None # Other changes may have been committed to the stored dict in the meantime.
+        return output
@@ -7,7 +7,6 @@ import itertools
 import typing
 import random
 import abc
-import time
 
 import bread.account as account
 import bread.values as values
@@ -126,17 +125,18 @@ class GameBoard():
     def populate(
             self: typing.Self,
             options: typing.List[typing.Any],
-            weights: typing.List[int]
+            weights: typing.List[int],
+            rng: random.Random = random
         ) -> None:
         """Populates the board with the given options and weights."""
         # Generate a list of options based on the weights.
-        flattened = random.choices(list(options), weights=list(weights), k=self.rows * self.columns)
+        flattened = rng.choices(list(options), weights=list(weights), k=self.rows * self.columns)
         
         # If any options are lists choose a random item from them.
         # If any options are an Emote get the text representation.
         for index, item in enumerate(flattened):
             if isinstance(item, (list, tuple)):
-                flattened[index] = random.choice(item)
+                flattened[index] = rng.choice(item)
             elif isinstance(item, values.Emote):
                 flattened[index] = item.text
         
@@ -193,6 +193,7 @@ class GameBoard():
 
 class Game(abc.ABC):
     board_size = (4, 4)
+    tick_length = 1.5 # Seconds between ticks.
     option_data: dict[typing.Any, float | int ] = {
         values.horsey.text: 25,
         values.brick.text: 50,
@@ -203,7 +204,8 @@ class Game(abc.ABC):
             self: typing.Self,
             wager: int | tuple[str | values.Emote, int] | values.Emote | typing.Any,
             json_interface: bread_cog.JSON_interface,
-            ctx: commands.Context
+            ctx: commands.Context,
+            rng: random.Random = random
         ) -> None:
         """Base gambling game that can be subclassed. Not intended to be used directly.
 
@@ -211,6 +213,7 @@ class Game(abc.ABC):
             wager (int | tuple[str  |  values.Emote, int] | typing.Any): Information about the given wager. Different games will handle this differently.
             json_interface (bread_cog.JSON_interface): The Bread Cog's JSON interface.
             ctx (commands.Context): The context of the command that started the game.
+            rng (random.Random, optional): Where the game draws its random results from. Defaults to the random module.
         """
         
         # This is kind of ugly, but unfortunately it is how you provide documentation to variables in Python.
@@ -227,6 +230,9 @@ class Game(abc.ABC):
         self.wager = wager
         """The wager as given to `__init__`. Different games will handle this differently."""
         
+        self.rng = rng
+        """Where the game draws its random results from. A seeded `random.Random` makes the game replayable."""
+        
         self.tick = 0
         """The number of times the game has ticked, can be used to coordinate certain things, like alternating movements."""
         
@@ -234,15 +240,23 @@ class Game(abc.ABC):
     
     async def setup(self: typing.Self) -> None:
         """Run when the game is created, can be used to configure settings and remove the initial wager."""
-        self.board = GameBoard(*self.board_size)
-        self.board.populate(self.option_data.keys(), self.option_data.values())
+        await self.deal(None)
         
         # Now that things have been setup, send and store the initial message.
         self.message = await self.ctx.reply(self.board.format_board())
     
+    async def deal(
+            self: typing.Self,
+            user_account: account.Bread_Account
+        ) -> None:
+        """Sets up the board and decides the outcome, without sending anything.
+        Everything random about the game should happen here, so it can be replayed offline."""
+        self.board = GameBoard(*self.board_size)
+        self.board.populate(self.option_data.keys(), self.option_data.values(), rng=self.rng)
+    
     @abc.abstractmethod
     async def run_tick(self: typing.Self) -> None:
-        """Run every 1.5 seconds to update the game state."""
+        """Run every `tick_length` seconds to update the game state."""
         raise NotImplementedError("run_tick() must be implemented in subclasses.")
     
     @abc.abstractmethod
@@ -289,31 +303,38 @@ class BaseGame(Game):
     
     async def setup(self: typing.Self) -> None:
         """Run when the game is created, can be used to configure settings and remove the initial wager."""
-        self.board = GameBoard(*self.board_size)
-        
         user_account = self.json_interface.get_account(self.ctx.author.id, self.ctx.guild.id) # type: account.Bread_Account
         user_account.increment("total_dough", -self.wager)
         self.json_interface.set_account(self.ctx.author.id, user_account, self.ctx.guild.id)
         
-        brick_troll = user_account.get("brick_troll_percentage") >= random.randint(1,100)
+        await self.deal(user_account)
+        
+        # Now that things have been setup, send and store the initial message.
+        self.message = await self.ctx.reply(self.board.format_board())
+    
+    async def deal(
+            self: typing.Self,
+            user_account: account.Bread_Account
+        ) -> None:
+        """Sets up the board and decides the winning tile, without sending anything."""
+        self.board = GameBoard(*self.board_size)
+        
+        brick_troll = user_account.get("brick_troll_percentage") >= self.rng.randint(1,100)
         
         if brick_troll:
-            self.board.populate([values.all_bricks_weighted], [100])
+            self.board.populate([values.all_bricks_weighted], [100], rng=self.rng)
         else:
-            self.board.populate(self.option_data.keys(), self.option_data.values())
+            self.board.populate(self.option_data.keys(), self.option_data.values(), rng=self.rng)
             
-        self.winning_x = random.randrange(self.board_size[0])
-        self.winning_y = random.randrange(self.board_size[1])
+        self.winning_x = self.rng.randrange(self.board_size[0])
+        self.winning_y = self.rng.randrange(self.board_size[1])
         self.winning_item = values.get_emote(self.board.get_cell(self.winning_y, self.winning_x))
         
         self.column_remove = [(False, i) for i in range(self.board_size[0]) if i != self.winning_x]
         self.row_remove = [(True, i) for i in range(self.board_size[1]) if i != self.winning_y]
         
         self.remove = self.column_remove + self.row_remove
-        random.shuffle(self.remove)
-        
-        # Now that things have been setup, send and store the initial message.
-        self.message = await self.ctx.reply(self.board.format_board())
+        self.rng.shuffle(self.remove)
     
     async def run_tick(self: typing.Self) -> None:
         remove = self.remove.pop(0)
@@ -439,6 +460,22 @@ class LasersGame(Game):
         """Run when the game is created, can be used to configure settings and remove the initial wager."""
         self.winning_item = None
         
+        user_account = self.json_interface.get_account(self.ctx.author.id, self.ctx.guild.id) # type: account.Bread_Account
+        user_account.increment(self.wager, -1)
+        self.json_interface.set_account(self.ctx.author.id, user_account, self.ctx.guild.id)
+        
+        await self.deal(user_account)
+        
+        ##############################
+        
+        self.message = await self.ctx.reply(self.board.format_board())
+    
+    async def deal(
+            self: typing.Self,
+            user_account: account.Bread_Account
+        ) -> None:
+        """Sets up the board and decides the winning tile, without sending anything.
+        This plays the whole game out on a fake board first to find out which tile is left at the end."""
         self.board = LasersBoard(*self.board_size)
         self.fake_board = LasersBoard(*self.board_size)
         
@@ -473,16 +510,12 @@ class LasersGame(Game):
             self.fake_board.shift_right: self.fake_board.shift_left
         }
         
-        user_account = self.json_interface.get_account(self.ctx.author.id, self.ctx.guild.id) # type: account.Bread_Account
-        user_account.increment(self.wager, -1)
-        self.json_interface.set_account(self.ctx.author.id, user_account, self.ctx.guild.id)
-        
         try:
             self.active_catalyst = user_account.get_active_catalyst().name
         except AttributeError:
             self.active_catalyst = None
         
-        self.random_seed = time.time()# * user_account.get("earned_dough")
+        self.random_seed = self.rng.getrandbits(64)# * user_account.get("earned_dough")
         self.random_obj = random.Random(self.random_seed)
         
         equal_weight = {i.text: 1 for i in filler_items}
@@ -498,7 +531,7 @@ class LasersGame(Game):
         else:
             raise KeyError(f"Unable to find item {self.wager} in the salvage weights list.")
         
-        self.board.populate(equal_weight.keys(), equal_weight.values())
+        self.board.populate(equal_weight.keys(), equal_weight.values(), rng=self.rng)
         
         for column in range(self.board_size[0]):
             for row in range(self.board_size[1]):
@@ -530,14 +563,14 @@ class LasersGame(Game):
         # The winning tile will *always* be chosen from the wager-specific item list, and a random amount of other tiles will be as well.
         
         if len(items) >= 2:
-            amount = round(random.normalvariate(self.board_size[0] * self.board_size[1] / 2, self.board_size[0] * self.board_size[1] / 6))
+            amount = round(self.rng.normalvariate(self.board_size[0] * self.board_size[1] / 2, self.board_size[0] * self.board_size[1] / 6))
             
             print(f"[Salvage] Replacing {amount} items on the board.")
             
             # Limit the bounds of the amount to be within a reasonable range.
             amount = min(max(amount, 5), self.board_size[0] * self.board_size[1])
             
-            items_add = random.choices(list(items.keys()), weights=list(items.values()), k=amount)
+            items_add = self.rng.choices(list(items.keys()), weights=list(items.values()), k=amount)
             
             for index, item in enumerate(items_add):
                 if self.active_catalyst == store.Aquila.name and item == values.gem_white.text:
@@ -549,21 +582,17 @@ class LasersGame(Game):
                     self.board.set_cell(*winning_coordinates, item)
                     continue
                 
-                column = random.randrange(self.board_size[0])
-                row = random.randrange(self.board_size[1])
+                column = self.rng.randrange(self.board_size[0])
+                row = self.rng.randrange(self.board_size[1])
                 
                 self.board.set_cell(row, column, item)
         else:
-            self.board.populate(items.keys(), items.values())
+            self.board.populate(items.keys(), items.values(), rng=self.rng)
             
         self.winning_item = values.get_emote(self.board.get_cell(*winning_coordinates))
             
         print(user_account.get("username"), f"is salvaging a {self.wager} and will win a {self.winning_item}.")
         
-        ##############################
-        
-        self.message = await self.ctx.reply(self.board.format_board())
-        
     
     async def run_tick(self: typing.Self) -> None:
         action = self.tick % 3
@@ -648,6 +677,13 @@ class LasersGame(Game):
             
         self.tick += 1
     
+    def roll_out_amount(self: typing.Self) -> int:
+        """Returns how many of the winning item the salvage machine extracts."""
+        if self.active_catalyst == store.Gemini.name and self.rng.randint(1, 4) == 1:
+            return 2
+        
+        return 1
+    
     async def finish(
             self: typing.Self,
             footer: str = None
@@ -665,10 +701,7 @@ class LasersGame(Game):
             user_account.increment(self.wager.text, 1)
             user_account.increment("salvagez_remaining", 1)
         else:
-            out_amount = 1
-            
-            if self.active_catalyst == store.Gemini.name and random.randint(1, 4) == 1:
-                out_amount = 2
+            out_amount = self.roll_out_amount()
                 
             send_text = f"The salvage machine has managed to extract {out_amount} {self.winning_item.text} from the {self.wager.text}"
             
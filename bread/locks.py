@@ -0,0 +1,160 @@
+"""Keyed locks for commands that shouldn't run more than once at a time for the same thing.
+
+Keys are usually user ids, so a player can't have two rolls or gambles going at once, but any hashable key works,
+like `("trade_hub", guild_id, ascension, x, y)` for a Trade Hub.
+
+A command that finds its key locked is normally dropped, like spamming `$bread roll` always has been. Commands that
+read the player's account after locking can instead ask to be queued, in which case a single follow-up command waits
+for the current one to finish and then runs. Anything more than that one follow-up is still dropped.
+
+Locks that are held for longer than `hold_timeout` are treated as abandoned (from a command that errored before
+releasing, for example) and are broken by the next command that wants them.
+"""
+from __future__ import annotations
+
+import typing
+import asyncio
+import time
+
+class Keyed_Lock_Manager:
+    """Hands out one lock per key, with optional queueing of a single follow-up and metrics on contention."""
+
+    def __init__(
+            self: typing.Self,
+            hold_timeout: float = 10 * 60,
+            wait_timeout: float = 90
+        ) -> None:
+        self.hold_timeout = hold_timeout # Seconds after which a held lock is considered abandoned.
+        self.wait_timeout = wait_timeout # Seconds a queued follow-up waits before giving up.
+
+        self.held = dict() # key -> time.monotonic() of when it was locked
+        self.waiters = dict() # key -> future of the queued follow-up, resolved when the lock is handed to it
+        self.reset_metrics()
+
+    def reset_metrics(self: typing.Self) -> None:
+        """Resets the contention metrics."""
+        self.metrics = {
+            "acquired": 0, # Locks taken, whether straight away or after waiting.
+            "contended": 0, # Attempts that found the key already locked.
+            "dropped": 0, # Attempts that gave up without the lock because it was locked and they couldn't queue.
+            "queued": 0, # Attempts that waited for the lock.
+            "timed_out": 0, # Queued attempts that gave up waiting.
+            "expired": 0, # Abandoned locks that were broken.
+            "total_wait": 0.0, # Seconds spent waiting by queued attempts that got the lock.
+            "max_wait": 0.0,
+        }
+
+    def is_locked(
+            self: typing.Self,
+            key: typing.Hashable
+        ) -> bool:
+        """Returns a boolean for whether the given key is currently locked. Abandoned locks are broken here."""
+        locked_at = self.held.get(key)
+        if locked_at is None:
+            return False
+
+        if time.monotonic() - locked_at >= self.hold_timeout:
+            self.metrics["expired"] += 1
+            self.release(key)
+            return key in self.held # It may have been handed to a queued follow-up.
+
+        return True
+
+    async def acquire(
+            self: typing.Self,
+            key: typing.Hashable,
+            queue: bool = False
+        ) -> bool:
+        """Locks the given key, and returns a boolean for whether it was locked.
+        If the key is already locked and `queue` is True this waits for it, unless another follow-up is already
+        waiting or `wait_timeout` passes first."""
+        if not self.is_locked(key):
+            self.held[key] = time.monotonic()
+            self.metrics["acquired"] += 1
+            return True
+
+        self.metrics["contended"] += 1
+
+        if not queue or key in self.waiters:
+            self.metrics["dropped"] += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[key] = future
+        self.metrics["queued"] += 1
+
+        start = time.monotonic()
+        # Don't wait past the point where the current holder counts as abandoned.
+        timeout = min(self.wait_timeout, self.held[key] + self.hold_timeout - start)
+
+        try:
+            await asyncio.wait_for(future, max(timeout, 0))
+        except asyncio.TimeoutError:
+            if self.waiters.get(key) is future:
+                del self.waiters[key]
+
+            # If the holder was abandoned take the lock over, otherwise give up.
+            if not self.is_locked(key):
+                self.held[key] = time.monotonic()
+            else:
+                self.metrics["timed_out"] += 1
+                return False
+        except asyncio.CancelledError:
+            if self.waiters.get(key) is future:
+                del self.waiters[key]
+            elif future.done() and not future.cancelled():
+                # The lock was handed over just as this got cancelled, so pass it on.
+                self.release(key)
+            raise
+
+        waited = time.monotonic() - start
+        self.metrics["acquired"] += 1
+        self.metrics["total_wait"] += waited
+        self.metrics["max_wait"] = max(self.metrics["max_wait"], waited)
+        return True
+
+    def release(
+            self: typing.Self,
+            key: typing.Hashable
+        ) -> None:
+        """Unlocks the given key, handing it straight to the queued follow-up if there is one.
+        Releasing a key that isn't locked does nothing."""
+        if key not in self.held:
+            return
+
+        waiter = self.waiters.pop(key, None)
+        if waiter is not None and not waiter.done():
+            self.held[key] = time.monotonic()
+            waiter.set_result(True)
+            return
+
+        del self.held[key]
+
+    def expire_stale(self: typing.Self) -> int:
+        """Breaks every abandoned lock, and returns how many there were."""
+        now = time.monotonic()
+        stale = [key for key, locked_at in self.held.items() if now - locked_at >= self.hold_timeout]
+
+        for key in stale:
+            self.metrics["expired"] += 1
+            self.release(key)
+
+        return len(stale)
+
+    def clear(self: typing.Self) -> None:
+        """Unlocks everything. Queued follow-ups are given their locks, since they've already been waiting."""
+        for key in list(self.held.keys()):
+            self.release(key)
+
+    def describe(self: typing.Self) -> str:
+        """Returns a description of the current locks and the metrics."""
+        metrics = self.metrics
+        queued_acquired = metrics["queued"] - metrics["timed_out"]
+        average_wait = metrics["total_wait"] / queued_acquired if queued_acquired > 0 else 0.0
+
+        return "\n".join([
+            f"Locked: {len(self.held)}, waiting: {len(self.waiters)}",
+            f"Acquired: {metrics['acquired']}, contended: {metrics['contended']}, dropped: {metrics['dropped']}",
+            f"Queued: {metrics['queued']}, timed out: {metrics['timed_out']}, expired: {metrics['expired']}",
+            f"Average wait: {average_wait:.2f}s, longest wait: {metrics['max_wait']:.2f}s",
+        ])
@@ -2940,7 +2940,7 @@ class Stonk_Exchange(Project):
         data = json_interface.bread_cog.get_highest_lifetime_dough(guild)
         
         space_data["lifetime_highest"] = data
-        json_interface.set_custom_file("space", space_data, guild=guild)
+        json_interface.set_custom_file("space", space_data, guild=guild, keys=["lifetime_highest"])
             
         return data.get(ascension, 10_000_000)
         
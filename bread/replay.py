@@ -0,0 +1,303 @@
+"""Seeded random number streams for commands, so rolls, purchases and gambles can be replayed exactly.
+
+Every roll, random purchase and gambling game gets its own `random.Random`, seeded from the system's randomness
+instead of the global `random` module. The seed is printed along with the command, its arguments and a fingerprint
+of the stats of the player's account that change with nearly every command, like:
+    [Seed] {"command": "roll", "guild": "123", "user": "456", "seed": 789, "arguments": {...}, "account": "0a1b..."}
+
+Since the results only depend on the seed and the bread data, a logged command can be run again offline against a
+database snapshot (an SQLite database, database.json or segmented database folder) and give the same results:
+    python3 -m bread.replay bread.sqlite3 '[Seed] {"command": "roll", ...}'
+
+A log file can be given instead of a single line, in which case every command in it is replayed and timed, which is
+useful for profiling real traffic:
+    python3 -m cProfile -s cumtime -m bread.replay bread.sqlite3 bot.log
+
+If the account in the snapshot doesn't match the fingerprint, the player's account has changed since the snapshot
+and the results can differ from the original ones. The fingerprint only covers a few stats, so it can miss changes
+that don't touch any of them.
+"""
+from __future__ import annotations
+
+import typing
+import random
+import collections
+import asyncio
+import hashlib
+import sqlite3
+import json
+import time
+import sys
+import os
+
+import bread.account as account
+import bread.values as values
+import bread.rolls as rolls
+import bread.store as store
+import bread.gamble as gamble
+import bread.storage as storage
+import bread_cog
+
+LOG_PREFIX = "[Seed]"
+
+# The stats that go into account fingerprints. Between them they change with nearly every command.
+FINGERPRINT_STATS = (
+    "total_dough", "earned_dough", "total_rolls", "daily_rolls", "max_daily_rolls", "daily_gambles",
+    "lifetime_gambles", "salvage_remaining", "lifetime_salvages", "prestige_level", "active_catalyst"
+)
+
+class Command_Log:
+    """Hands out seeded random number streams to commands, and keeps the most recent ones."""
+
+    def __init__(
+            self: typing.Self,
+            max_length: int = 1000
+        ) -> None:
+        self.entries = collections.deque(maxlen=max_length)
+        self.system_random = random.SystemRandom()
+
+    def seed_command(
+            self: typing.Self,
+            command: str,
+            guild_id: typing.Union[int, str],
+            user_id: typing.Union[int, str],
+            arguments: dict,
+            user_account: account.Bread_Account
+        ) -> random.Random:
+        """Logs a command with a new seed, and returns a `random.Random` seeded with it for the command to use.
+        `arguments` should have everything besides the account that's needed to replay the command."""
+        entry = {
+            "command": command,
+            "guild": str(guild_id),
+            "user": str(user_id),
+            "seed": self.system_random.getrandbits(64),
+            "arguments": arguments,
+            "account": get_account_fingerprint(user_account),
+            "time": time.time()
+        }
+
+        self.entries.append(entry)
+        print(LOG_PREFIX, json.dumps(entry))
+
+        return random.Random(entry["seed"])
+
+    def get_entries(
+            self: typing.Self,
+            user_id: typing.Union[int, str] = None
+        ) -> list[dict]:
+        """Returns the kept entries, oldest first, optionally only those of the given user."""
+        if user_id is None:
+            return list(self.entries)
+
+        return [entry for entry in self.entries if entry["user"] == str(user_id)]
+
+command_log = Command_Log()
+
+def get_account_fingerprint(user_account: account.Bread_Account) -> str:
+    """Returns a short hash of the stats in `FINGERPRINT_STATS` and how many stats the account has.
+    Hashing the whole account takes too long to do for every command."""
+    data = [user_account.values.get(stat) for stat in FINGERPRINT_STATS]
+    data.append(len(user_account.values))
+    return hashlib.blake2b(repr(data).encode("utf-8"), digest_size=8).hexdigest()
+
+def parse_log_line(line: str) -> typing.Optional[dict]:
+    """Returns the entry logged in the given line, or None if it doesn't have one."""
+    if LOG_PREFIX not in line:
+        return None
+
+    return json.loads(line.split(LOG_PREFIX, 1)[1])
+
+####################################################
+###############   REPLAYING   ######################
+####################################################
+
+def is_sqlite_file(path: str) -> bool:
+    """Returns a boolean for whether the given path is an SQLite database."""
+    if not os.path.isfile(path):
+        return False
+
+    with open(path, "rb") as database_file:
+        return database_file.read(16) == b"SQLite format 3\x00"
+
+def load_snapshot(path: str) -> bread_cog.JSON_interface:
+    """Returns a JSON interface with the bread data from a database snapshot. The data is copied into memory, so
+    nothing done with the interface changes the snapshot."""
+    backend = storage.SQLite_Storage(":memory:")
+
+    if is_sqlite_file(path):
+        source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            source.backup(backend.connection)
+        finally:
+            source.close()
+    else:
+        storage.import_json_database(storage.read_json_database(path), backend)
+
+    json_interface = bread_cog.JSON_interface()
+    json_interface.storage_backend = backend.name
+    json_interface.active_storage = backend
+    return json_interface
+
+def replay_roll(
+        entry: dict,
+        user_account: account.Bread_Account,
+        json_interface: bread_cog.JSON_interface,
+        rng: random.Random
+    ) -> str:
+    """Replays `rolls.bread_roll`, and returns the roll messages and results."""
+    arguments = entry["arguments"]
+
+    message_filter = None
+    if arguments.get("black_hole", False):
+        message_filter = rolls.Black_Hole_Filter(user_account.get("black_hole_conditions"))
+
+    result = rolls.bread_roll(
+        roll_luck = arguments["roll_luck"],
+        roll_count = arguments["roll_count"],
+        user_account = user_account,
+        json_interface = json_interface,
+        message_filter = message_filter,
+        rng = rng
+    )
+
+    lines = result["roll_messages"] + [result["commentary"] or "", f"Value: {result['value']}"]
+    return "\n".join(lines)
+
+def replay_buy(
+        entry: dict,
+        user_account: account.Bread_Account,
+        json_interface: bread_cog.JSON_interface,
+        rng: random.Random
+    ) -> str:
+    """Replays the `do_purchase` of a store item, and returns the purchase text."""
+    arguments = entry["arguments"]
+
+    for item in store.all_store_items:
+        if item.name == arguments["item"]:
+            break
+    else:
+        raise KeyError(f"Unable to find store item {arguments['item']}.")
+
+    return item.do_purchase(user_account, amount=arguments["amount"], rng=rng)
+
+def replay_gamble(
+        entry: dict,
+        user_account: account.Bread_Account,
+        json_interface: bread_cog.JSON_interface,
+        rng: random.Random
+    ) -> str:
+    """Replays the setup of a gamble, and returns the board and the winning item."""
+    game = gamble.BaseGame(
+        wager = entry["arguments"]["wager"],
+        json_interface = json_interface,
+        ctx = None,
+        rng = rng
+    )
+    asyncio.run(game.deal(user_account))
+
+    return f"{game.board.format_board()}\nWinning item: {game.winning_item.text}"
+
+def replay_salvage(
+        entry: dict,
+        user_account: account.Bread_Account,
+        json_interface: bread_cog.JSON_interface,
+        rng: random.Random
+    ) -> str:
+    """Replays the setup of a salvage, and returns the boards and what was won, along with what the catalyst did."""
+    catalyst = user_account.get_active_catalyst()
+    active_catalyst = None if catalyst is None else catalyst.name
+
+    # This follows the order the salvage command draws from the stream in.
+    hydra = active_catalyst == store.Hydra.name and rng.randint(1, 4) == 1
+    if hydra:
+        game_rngs = [random.Random(rng.getrandbits(64)), random.Random(rng.getrandbits(64))]
+    else:
+        game_rngs = [rng]
+
+    lines = []
+    for game_rng in game_rngs:
+        game = gamble.LasersGame(
+            wager = values.get_emote(entry["arguments"]["item"]),
+            json_interface = json_interface,
+            ctx = None,
+            rng = game_rng
+        )
+        asyncio.run(game.deal(user_account))
+
+        lines.append(f"{game.board.format_board()}\nWinning item: {game.roll_out_amount()} {game.winning_item.text}")
+
+    if hydra:
+        lines.append("Hydra: two games.")
+    elif active_catalyst == store.Sagitta.name:
+        lines.append(f"Sagitta: {'salvaging again' if rng.randint(1, 2) == 1 else 'no second salvage'}.")
+
+    return "\n".join(lines)
+
+replayers = {
+    "roll": replay_roll,
+    "buy": replay_buy,
+    "gamble": replay_gamble,
+    "salvage": replay_salvage
+}
+
+def replay_entry(
+        entry: dict,
+        json_interface: bread_cog.JSON_interface
+    ) -> dict:
+    """Runs a logged command again with its seed, and returns a dict with the text of the results ("output"), whether
+    the account matched the logged fingerprint ("account_matches") and how long it took in seconds ("duration")."""
+    user_account = json_interface.get_account(entry["user"], entry["guild"])
+    account_matches = get_account_fingerprint(user_account) == entry["account"]
+
+    start = time.perf_counter()
+    output = replayers[entry["command"]](entry, user_account, json_interface, random.Random(entry["seed"]))
+    duration = time.perf_counter() - start
+
+    return {
+        "output": output,
+        "account_matches": account_matches,
+        "duration": duration
+    }
+
+def replay_log(
+        snapshot_path: str,
+        log: str
+    ) -> list[dict]:
+    """Replays a single logged line, or every command in a log file, against a database snapshot.
+    Returns the results of `replay_entry` for each command, with the entry added as "entry"."""
+    json_interface = load_snapshot(snapshot_path)
+
+    if os.path.isfile(log):
+        with open(log, "r", encoding="utf-8") as log_file:
+            entries = [parse_log_line(line) for line in log_file]
+    else:
+        entries = [parse_log_line(log if LOG_PREFIX in log else f"{LOG_PREFIX} {log}")]
+
+    results = []
+    for entry in entries:
+        if entry is None:
+            continue
+
+        result = replay_entry(entry, json_interface)
+        result["entry"] = entry
+        results.append(result)
+
+    return results
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    if len(arguments) != 2:
+        print("Usage: python3 -m bread.replay [database snapshot path] [logged line or log file path]")
+        sys.exit(1)
+
+    results = replay_log(*arguments)
+
+    for result in results:
+        entry = result["entry"]
+        print(f"{entry['command']} by {entry['user']} in {entry['guild']} (seed {entry['seed']}), {result['duration'] * 1000:.2f} ms")
+        if not result["account_matches"]:
+            print("The account has changed since this command, so the results may differ.")
+        print(result["output"])
+        print()
+
+    print(f"Replayed {len(results)} commands in {sum(result['duration'] for result in results) * 1000:.2f} ms.")
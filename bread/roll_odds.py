@@ -0,0 +1,187 @@
+"""Exact expected results of rolling, worked out from the odds instead of by rolling many times.
+
+Everything here comes from the same loaf tables the rolls themselves are drawn from (see `rolls.Loaf_Table`), so it
+always matches what rolling actually does. To see what a roll is worth for an account:
+    odds = roll_odds.get_account_odds(user_account, json_interface)
+    print(odds.describe())
+
+To answer questions like "is another Loaf Converter or another daily roll better":
+    roll_odds.compare_upgrades(user_account, json_interface, {"loaf_converter": 1}, {"max_daily_rolls": 1})
+
+The first catch bonus is left out, since it only applies to the first few special items a player ever finds.
+"""
+from __future__ import annotations
+
+import typing
+import copy
+
+import bread.values as values
+import bread.account as account
+import bread.rolls as rolls
+import bread.utility as utility
+import bread_cog
+
+# Chance that a roll that isn't a lottery is 11 or more loaves.
+LARGE_ROLL_CHANCE = 1 / 512
+
+# Loaf counts of rolls that aren't lotteries, as (mean, mean of the square).
+# 1 to 10 loaves, equally likely.
+SMALL_ROLL_MOMENTS = (5.5, 38.5)
+# 10 plus a geometric number of coin flips (at least 1), so a mean of 12 and a variance of 2.
+LARGE_ROLL_MOMENTS = (12.0, 146.0)
+
+class Roll_Odds:
+    """The expected results of a single roll for some roll context.
+    All the counts and values are per roll, and don't include the ascension multiplier unless noted."""
+
+    def __init__(
+            self: typing.Self,
+            context: rolls.Roll_Context
+        ) -> None:
+        self.context = context
+
+        lottery_chance = 0.0 if context.disable_lotteries else 1 / context.lottery_chance
+        normal_chance = 1 - lottery_chance
+
+        lottery_loaves = context.get_lottery_loaf_count()
+
+        mean = (1 - LARGE_ROLL_CHANCE) * SMALL_ROLL_MOMENTS[0] + LARGE_ROLL_CHANCE * LARGE_ROLL_MOMENTS[0]
+        square = (1 - LARGE_ROLL_CHANCE) * SMALL_ROLL_MOMENTS[1] + LARGE_ROLL_CHANCE * LARGE_ROLL_MOMENTS[1]
+
+        # Each kind of roll as (chance, loaf table, mean loaf count, loaf count variance, base profit).
+        self.roll_kinds = [
+            (normal_chance, context.get_loaf_table(lottery=False), mean, square - mean ** 2, 0),
+            (lottery_chance, context.get_loaf_table(lottery=True), lottery_loaves, 0, max(0, 1000 - lottery_loaves)),
+        ]
+        self.roll_kinds = [kind for kind in self.roll_kinds if kind[0] > 0]
+
+        self.lottery_chance = lottery_chance
+        self.loaves_per_roll = sum(chance * loaves for chance, _, loaves, _, _ in self.roll_kinds)
+
+        ##### Dough.
+        # A roll is its base profit plus a random amount of loaves, so for each kind of roll
+        # E[value] = base + E[N] * E[loaf] and Var[value] = E[N] * Var[loaf] + Var[N] * E[loaf]^2.
+
+        self.value_per_roll = 0.0
+        value_square = 0.0
+
+        for chance, table, loaves, loaves_variance, base in self.roll_kinds:
+            loaf_mean, loaf_variance = get_loaf_moments(table)
+
+            kind_mean = base + loaves * loaf_mean
+            kind_variance = loaves * loaf_variance + loaves_variance * loaf_mean ** 2
+
+            self.value_per_roll += chance * kind_mean
+            value_square += chance * (kind_variance + kind_mean ** 2)
+
+        self.value_variance = value_square - self.value_per_roll ** 2
+
+        # Per loaf, over every loaf rolled, so lottery loaves count as much as any other loaf.
+        self.value_per_loaf = self.value_per_roll / self.loaves_per_roll
+
+        ##### Items.
+        # The amount of an item in a roll is a sum of E[N] loaves that are that item with chance p, so for each kind
+        # of roll E[count] = E[N] * p and Var[count] = E[N] * p * (1 - p) + Var[N] * p^2.
+
+        self.item_counts = dict() # emote -> expected amount per roll
+        item_squares = dict()
+
+        for chance, table, loaves, loaves_variance, base in self.roll_kinds:
+            for emote, item_chance in zip(table.emotes, table.chances):
+                kind_mean = loaves * item_chance
+                kind_variance = loaves * item_chance * (1 - item_chance) + loaves_variance * item_chance ** 2
+
+                self.item_counts[emote] = self.item_counts.get(emote, 0.0) + chance * kind_mean
+                item_squares[emote] = item_squares.get(emote, 0.0) + chance * (kind_variance + kind_mean ** 2)
+
+        self.item_variances = {
+            emote: item_squares[emote] - count ** 2
+            for emote, count in self.item_counts.items()
+        }
+
+        self.attribute_counts = dict() # attribute -> expected amount per roll
+        for emote, count in self.item_counts.items():
+            for attribute in emote.attributes:
+                self.attribute_counts[attribute] = self.attribute_counts.get(attribute, 0.0) + count
+
+    def get_item_count(
+            self: typing.Self,
+            item: values.Emote
+        ) -> float:
+        """Returns the expected amount of the given item per roll."""
+        return self.item_counts.get(item, 0.0)
+
+    def get_daily_value(
+            self: typing.Self,
+            include_prestige: bool = True
+        ) -> float:
+        """Returns the expected dough from a full day of rolls, with the ascension multiplier by default."""
+        value = self.value_per_roll * self.context.max_daily_rolls
+        if include_prestige:
+            value *= self.context.user_account.get_prestige_multiplier()
+        return value
+
+    def describe(self: typing.Self) -> str:
+        """Returns a summary of the odds."""
+        lines = [
+            f"Expected dough per roll: {self.value_per_roll:,.3f} (standard deviation {self.value_variance ** 0.5:,.3f})",
+            f"Expected dough per loaf: {self.value_per_loaf:,.3f}",
+            f"Expected loaves per roll: {self.loaves_per_roll:,.3f}",
+            f"Expected dough per day: {utility.smart_number(round(self.get_daily_value()))}",
+            "",
+            "Expected items per roll:"
+        ]
+
+        for emote, count in sorted(self.item_counts.items(), key=lambda pair: -pair[1]):
+            lines.append(f"{emote.name}: {count:.6g} (standard deviation {self.item_variances[emote] ** 0.5:.4g})")
+
+        return "\n".join(lines)
+
+def get_loaf_moments(table: rolls.Loaf_Table) -> tuple[float, float]:
+    """Returns the mean and variance of the value of a single loaf drawn from the given table."""
+    mean = sum(chance * value for chance, value in zip(table.chances, table.loaf_values))
+    square = sum(chance * value ** 2 for chance, value in zip(table.chances, table.loaf_values))
+    return mean, square - mean ** 2
+
+def get_context_odds(
+        context: rolls.Roll_Context,
+        overrides: dict[str, typing.Any] = None
+    ) -> Roll_Odds:
+    """Returns the odds for a roll context. `overrides` can replace any value of the context, like planet modifiers:
+    `{"chess_piece_multiplier": 1.5, "corruption_chance": 0.02}`. The given context isn't modified."""
+    if overrides:
+        context = copy.copy(context)
+        for name, value in overrides.items():
+            setattr(context, name, value)
+        context.loaf_tables = dict()
+
+    return Roll_Odds(context)
+
+def get_account_odds(
+        user_account: account.Bread_Account,
+        json_interface: bread_cog.JSON_interface = None,
+        overrides: dict[str, typing.Any] = None
+    ) -> Roll_Odds:
+    """Returns the odds of a roll for the given account, with its current upgrades and location.
+    The json interface is only needed for accounts that have been to space."""
+    roll_luck = user_account.get("loaf_converter") + 1
+    context = rolls.Roll_Context(roll_luck, user_account, json_interface)
+    return get_context_odds(context, overrides)
+
+def compare_upgrades(
+        user_account: account.Bread_Account,
+        json_interface: bread_cog.JSON_interface = None,
+        *changes: dict[str, int]
+    ) -> list[tuple[dict[str, int], float]]:
+    """Returns the expected dough per day for the given account after each of the given changes to its stats, like
+    `{"loaf_converter": 1}` for one more Loaf Converter. Changes are added on to the current stats, and the account
+    itself isn't changed. The results are sorted from best to worst."""
+    results = []
+    for change in changes:
+        changed_account = account.Bread_Account.from_dict(user_account.user_id, user_account.values, user_account.json_interface)
+        for stat, amount in change.items():
+            changed_account.increment(stat, amount)
+
+        results.append((change, get_account_odds(changed_account, json_interface).get_daily_value()))
+
+    return sorted(results, key=lambda result: -result[1])
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import typing
 import random
+import math
+import numpy as np
 import bread.values as values
 import bread.account as account
 import bread.utility as utility
@@ -10,13 +13,765 @@ import bread_cog
 
 CURRENT_ROLL_RECORD = 25 # By prockpj.
 
+# Multirolls of at least this many rolls are done with `bread_roll_numpy` instead of one loaf at a time.
+NUMPY_ROLL_THRESHOLD = 32
+
+# Account stats the roll context depends on. If any of these change the context is worked out again.
+ROLL_CONTEXT_STATS = (
+    "max_daily_rolls",
+    "chess_piece_equalizer",
+    "moak_booster",
+    "LC_booster",
+    "space_level",
+    "prestige_level",
+    "corruption_negation",
+    "advanced_exploration", # store.Advanced_Exploration.name, which can't be used here since store imports this module.
+    "galaxy_move_count",
+    "galaxy_xpos",
+    "galaxy_ypos",
+    "system_xpos",
+    "system_ypos",
+)
+
+class Roll_Context:
+    """The values that stay the same across every roll in a multiroll, worked out from an account once."""
+
+    def __init__(
+            self: typing.Self,
+            roll_luck: int,
+            user_account: account.Bread_Account,
+            json_interface: bread_cog.JSON_interface
+        ) -> None:
+        self.user_account = user_account
+        self.max_daily_rolls = user_account.get("max_daily_rolls")
+
+        ######################
+        # Ephemeral booleans.
+        
+        self.disable_lotteries = False # Pathfinder.
+        self.swap_moak_booster_usage = False # Phoenix.
+        self.disable_gem_rr = False # Ingenuity.
+
+        ##### Static values.
+        # These are values that are static across all rolls in a multiroll.
+
+        self.moak_rarity_multiplier = round(self.max_daily_rolls / 10)
+        self.gem_boost = user_account.get_shadow_gold_gem_boost_count()
+        self.white_piece_chance = store.chess_piece_distribution_levels[user_account.get("chess_piece_equalizer")]
+        self.moak_booster_multiplier = store.moak_booster_multipliers[user_account.get("moak_booster")]
+
+        self.lottery_chance = 4096
+        self.lottery_luck_multiplier = 4
+        
+        self.lc_booster = user_account.get("LC_booster")
+        if self.lc_booster > 0:
+            self.lc_boost = 2 ** self.lc_booster
+        else:
+            self.lc_boost = 1
+
+        self.corruption_chance = user_account.get_corruption_chance(json_interface=json_interface)
+        self.anarchy_corruption_chance = user_account.get_anarchy_corruption_chance(json_interface=json_interface)
+        
+        # If the user has access to space.
+        if user_account.get_space_level() >= 1:
+            # If the user has been to space, then check their current location and adjust the chance multipliers accordingly.
+
+            self.anarchy_piece_luck = round(user_account.get_anarchy_piece_luck(roll_luck * self.lc_boost))
+            self.space_gem_luck = round(user_account.get_space_gem_luck(roll_luck * self.lc_boost))
+
+            #### Planet-based roll modifiers.
+
+            system_tile = user_account.get_system_tile(json_interface)
+            day_seed = json_interface.get_day_seed(guild=user_account.get("guild_id"))
+
+            rarity_modifiers = space.get_planet_modifiers(
+                user_account = user_account,
+                json_interface = json_interface,
+                ascension = user_account.get_prestige_level(),
+                guild = user_account.get("guild_id"),
+                day_seed = day_seed,
+                tile = system_tile
+            )
+
+            self.space_gem_multiplier = rarity_modifiers.get(values.gem_pink)
+            self.moak_multiplier = rarity_modifiers.get(values.anarchy_chess)
+            self.gem_gold_multiplier = rarity_modifiers.get(values.gem_gold)
+            self.gem_green_multiplier = rarity_modifiers.get(values.gem_green)
+            self.gem_purple_multiplier = rarity_modifiers.get(values.gem_purple)
+            self.gem_blue_multiplier = rarity_modifiers.get(values.gem_blue)
+            self.gem_red_multiplier = rarity_modifiers.get(values.gem_red)
+            self.anarchy_piece_multiplier = rarity_modifiers.get(values.anarchy_black_pawn)
+            self.chess_piece_multiplier = rarity_modifiers.get(values.black_pawn)
+            self.rare_bread_multiplier = rarity_modifiers.get(values.waffle)
+            self.special_bread_multiplier = rarity_modifiers.get(values.croissant)
+        else:
+            # If the user has not been to space, set all the multipliers to 1 to not adjust the rarities at all.
+            # In addition, set the anarchy piece luck to -1 to make it impossible to roll.
+
+            self.anarchy_piece_luck = -1 # With a negative number it's impossible to roll.
+            self.space_gem_luck = -1 # With a negative number it's impossible to roll.
+
+            self.space_gem_multiplier = 1
+            self.moak_multiplier = 1
+            self.gem_gold_multiplier = 1
+            self.gem_green_multiplier = 1
+            self.gem_purple_multiplier = 1
+            self.gem_blue_multiplier = 1
+            self.gem_red_multiplier = 1
+            self.anarchy_piece_multiplier = 1
+            self.chess_piece_multiplier = 1
+            self.rare_bread_multiplier = 1
+            self.special_bread_multiplier = 1
+
+        if user_account.get_ephemeral_upgrade(store.Viking.name):
+            # Viking: Increase luck by 10% but MoaKs become unrollable.
+            roll_luck = round(roll_luck * 1.1)
+            self.anarchy_piece_luck = round(self.anarchy_piece_luck * 1.1)
+            self.space_gem_luck = round(self.space_gem_luck * 1.1)
+            self.moak_multiplier = 0
+
+        if user_account.get_ephemeral_upgrade(store.Pathfinder.name):
+            # Pathfinder: Doubles your maximum daily rolls, but you can no longer roll any lotteries.
+            # The maximum daily roll doubling part is implemented in bread_cog.py.
+            self.disable_lotteries = True
+
+        if user_account.get_ephemeral_upgrade(store.Sojourner.name):
+            # Sojourner: You get 50% more anarchy pieces, but Chess Piece Equalizer is effectively 2 levels lower. (With 20% and 15% below 0.)
+            self.anarchy_piece_multiplier *= 1.5
+            self.white_piece_chance = ([15, 20] + store.chess_piece_distribution_levels)[user_account.get("chess_piece_equalizer")]
+
+        if user_account.get_ephemeral_upgrade(store.Curiosity.name):
+            # Curiosity: Doubles the chance of rolling a lottery, but removes the 4x luck multiplier inside of them.
+            self.lottery_chance = 2048
+            self.lottery_luck_multiplier = 1
+
+        if user_account.get_ephemeral_upgrade(store.Phoenix.name):
+            # Phoenix: MoaK Booster affects gems instead of MoaKs.
+            self.swap_moak_booster_usage = True
+            self.space_gem_luck = round(self.space_gem_luck * self.moak_booster_multiplier)
+
+        if user_account.get_ephemeral_upgrade(store.Perseverance.name):
+            # Perseverance: Doubles the chance of rolling space gems, but cuts the chance of rolling Anarchy Pieces in half.
+            self.anarchy_piece_multiplier /= 2
+            self.space_gem_multiplier *= 2
+
+        if user_account.get_ephemeral_upgrade(store.Ingenuity.name):
+            # Ingenuity: Increase your MoaK chance by 25%, but Recipe Refinement no longer applies to gems.
+            self.moak_multiplier *= 1.25
+            self.disable_gem_rr = True
+
+        self.roll_luck = roll_luck
+
+        self.loaf_tables = dict() # lottery -> Loaf_Table, made when first needed.
+
+    def get_lottery_loaf_count(self: typing.Self) -> int:
+        """Returns the amount of loaves in a lottery roll."""
+        # if you have more than 100 max daily rolls, you'll get extra rolls on the lottery
+        return max(100, self.max_daily_rolls)
+
+    def get_loaf_arguments(
+            self: typing.Self,
+            lottery: bool = False
+        ) -> dict:
+        """Returns the keyword arguments for `loaf_roll` for loaves in a roll, which depend on whether it's a lottery."""
+
+        ### Roll-only values:
+        # These are values that are the same for each loaf in this roll, but may change on a different roll.        
+
+        out_luck = self.roll_luck
+        if lottery:
+            out_luck = max(self.roll_luck * self.lottery_luck_multiplier, 16) # extra lucky
+
+        if self.swap_moak_booster_usage:
+            moak_luck = out_luck
+            gem_luck = round(out_luck + self.gem_boost * self.moak_booster_multiplier)
+        else:
+            moak_luck = round(out_luck * self.moak_booster_multiplier)
+            gem_luck = out_luck + self.gem_boost
+
+        if self.lc_booster > 0:
+            out_luck = (out_luck - 1) * self.lc_boost + 1
+            
+            if not self.disable_gem_rr:
+                gem_luck = (gem_luck - 1) * self.lc_boost + 1
+
+        return {
+            "luck": out_luck,
+            "user_account": self.user_account,
+            
+            "white_piece_chance": self.white_piece_chance,
+
+            "moak_rarity_multiplier": self.moak_rarity_multiplier,
+            "moak_luck": moak_luck,
+
+            "gem_luck": gem_luck,
+
+            "corruption_chance": self.corruption_chance,
+            "anarchy_corruption_chance": self.anarchy_corruption_chance,
+            "anarchy_piece_luck": self.anarchy_piece_luck,
+            "space_gem_luck": self.space_gem_luck,
+
+            "space_gem_multiplier": self.space_gem_multiplier,
+            "moak_multiplier": self.moak_multiplier,
+            "gem_gold_multiplier": self.gem_gold_multiplier,
+            "gem_green_multiplier": self.gem_green_multiplier,
+            "gem_purple_multiplier": self.gem_purple_multiplier,
+            "gem_blue_multiplier": self.gem_blue_multiplier,
+            "gem_red_multiplier": self.gem_red_multiplier,
+            "anarchy_piece_multiplier": self.anarchy_piece_multiplier,
+            "chess_piece_multiplier": self.chess_piece_multiplier,
+            "rare_bread_multiplier": self.rare_bread_multiplier,
+            "special_bread_multiplier": self.special_bread_multiplier
+        }
+
+    def get_loaf_table(
+            self: typing.Self,
+            lottery: bool = False
+        ) -> Loaf_Table:
+        """Returns the table of loaf outcomes for loaves in a roll, which depends on whether it's a lottery."""
+        if lottery not in self.loaf_tables:
+            self.loaf_tables[lottery] = Loaf_Table(self.get_loaf_arguments(lottery))
+
+        return self.loaf_tables[lottery]
+
+def get_roll_context_key(
+        roll_luck: int,
+        user_account: account.Bread_Account,
+        json_interface: bread_cog.JSON_interface
+    ) -> tuple:
+    """Returns everything a roll context depends on, other than Trade Hubs, as a tuple that can be compared."""
+    day_seed = None
+    if user_account.get_space_level() >= 1:
+        day_seed = json_interface.get_day_seed(guild=user_account.get("guild_id"))
+
+    return (
+        roll_luck,
+        day_seed,
+        tuple(user_account.get(stat) for stat in ROLL_CONTEXT_STATS),
+        user_account.get_shadow_gold_gem_boost_count(),
+        tuple(user_account.get_ephemeral_file()),
+        tuple(user_account.values.get("dough_boosts", dict()).items()),
+    )
+
+class Roll_Context_Cache:
+    """The roll context of the last roll of each player, so rolling again doesn't have to work it out from scratch.
+    
+    A context is used again as long as the player's luck, location, upgrades and the day seed are the same. Trade
+    Hubs affect the context too, so whenever the `space` file of a guild is set `invalidate` has to be called."""
+
+    def __init__(self: typing.Self) -> None:
+        self.contexts = dict() # (guild id, user id) -> (key, Roll_Context)
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+            self: typing.Self,
+            roll_luck: int,
+            user_account: account.Bread_Account,
+            json_interface: bread_cog.JSON_interface
+        ) -> Roll_Context:
+        """Returns the roll context for the given account, making a new one if needed."""
+        cache_key = (str(user_account.get("guild_id")), str(user_account.user_id))
+        key = get_roll_context_key(roll_luck, user_account, json_interface)
+
+        cached = self.contexts.get(cache_key)
+        if cached is not None and cached[0] == key:
+            self.hits += 1
+            context = cached[1]
+            # Everything the context depends on is the same, so it can be given the new account object.
+            context.user_account = user_account
+            return context
+        
+        self.misses += 1
+        context = Roll_Context(roll_luck, user_account, json_interface)
+        self.contexts[cache_key] = (key, context)
+        return context
+
+    def invalidate(
+            self: typing.Self,
+            guild: typing.Union[int, str] = None,
+            user_id: typing.Union[int, str] = None
+        ) -> int:
+        """Forgets the roll contexts of the given guild and/or user, or every context if neither is given.
+        Returns the amount of contexts forgotten."""
+        if guild is None and user_id is None:
+            amount = len(self.contexts)
+            self.contexts.clear()
+            return amount
+        
+        remove = [
+            cache_key
+            for cache_key in self.contexts
+            if (guild is None or cache_key[0] == str(guild)) and (user_id is None or cache_key[1] == str(user_id))
+        ]
+        for cache_key in remove:
+            del self.contexts[cache_key]
+        
+        return len(remove)
+
+roll_contexts = Roll_Context_Cache()
+
+def randint_chance(
+        upper: int,
+        threshold: float
+    ) -> float:
+    """Returns the chance that `random.randint(1, upper) <= threshold`."""
+    return min(max(math.floor(threshold), 0), upper) / upper
+
+def random_chance(threshold: float) -> float:
+    """Returns the chance that `random.random() < threshold`."""
+    return min(max(threshold, 0.0), 1.0)
+
+class Loaf_Table:
+    """Every possible outcome of `loaf_roll` with the given arguments, and the chance of each.
+    
+    The chances are worked out from the same cascade of checks `loaf_roll` goes through, so drawing an outcome from
+    this table is statistically the same as calling `loaf_roll`. Drawing uses an alias table (Vose's alias method),
+    so it takes a single random number no matter how many outcomes there are, where `loaf_roll` takes up to twelve."""
+
+    def __init__(
+            self: typing.Self,
+            loaf_arguments: dict
+        ) -> None:
+        self.loaf_arguments = loaf_arguments
+        user_account = loaf_arguments["user_account"]
+
+        chances = dict() # emote -> chance
+        commentaries = dict() # emote -> commentary
+
+        def add(emote: values.Emote, chance: float, commentary: str) -> None:
+            if chance <= 0:
+                return
+            chances[emote] = chances.get(emote, 0.0) + chance
+            commentaries[emote] = commentary
+
+        def add_choice(emotes: list[values.Emote], chance: float, commentary: str) -> None:
+            # Same as random.choice, so items that are in the list more than once are more likely.
+            for emote in emotes:
+                add(emote, chance / len(emotes), commentary)
+        
+        white_chance = randint_chance(100, loaf_arguments["white_piece_chance"])
+        anarchy_corruption_chance = random_chance(loaf_arguments["anarchy_corruption_chance"])
+        luck = loaf_arguments["luck"]
+        gem_luck = loaf_arguments["gem_luck"]
+
+        remaining = 1.0 # The chance of getting this far down the cascade.
+
+        # Anarchy pieces.
+        chance = remaining * randint_chance(2**13, loaf_arguments["anarchy_piece_luck"] * loaf_arguments["anarchy_piece_multiplier"])
+        add(values.corrupted_bread, chance * anarchy_corruption_chance, "")
+        add_choice(values.anarchy_pieces_white_biased, chance * (1 - anarchy_corruption_chance) * white_chance, "Your Karma has been increased by 20 points.")
+        add_choice(values.anarchy_pieces_black_biased, chance * (1 - anarchy_corruption_chance) * (1 - white_chance), "Your Karma has been increased by 10 points.")
+        remaining -= chance
+
+        # Space Gems.
+        chance = remaining * randint_chance(2**21, loaf_arguments["space_gem_luck"] * loaf_arguments["space_gem_multiplier"])
+        add(values.corrupted_bread, chance * anarchy_corruption_chance, "")
+        add_choice(values.all_very_shinies, chance * (1 - anarchy_corruption_chance), "Extraordinarily shiny!")
+        remaining -= chance
+
+        # Corrupted bread.
+        chance = remaining * random_chance(loaf_arguments["corruption_chance"])
+        add(values.corrupted_bread, chance, "")
+        remaining -= chance
+
+        # MoaKs.
+        chance = remaining * randint_chance(loaf_arguments["moak_rarity_multiplier"] * 2**15, loaf_arguments["moak_luck"] * loaf_arguments["moak_multiplier"])
+        add(values.anarchy_chess, chance, "That sure is pretty rare!")
+        remaining -= chance
+
+        # Gems.
+        for emote, upper, multiplier, commentary in [
+                (values.gem_gold, 2**22, "gem_gold_multiplier", "The fabled gold gem!"),
+                (values.gem_green, 2**19, "gem_green_multiplier", "Incredibly shiny!"),
+                (values.gem_purple, 2**18, "gem_purple_multiplier", "So very shiny."),
+                (values.gem_blue, 2**17, "gem_blue_multiplier", "Very shiny."),
+                (values.gem_red, 2**16, "gem_red_multiplier", "Shiny."),
+            ]:
+            chance = remaining * randint_chance(upper, gem_luck * loaf_arguments[multiplier])
+            add(emote, chance, commentary)
+            remaining -= chance
+
+        # Chess pieces.
+        chance = remaining * randint_chance(2**11, luck * loaf_arguments["chess_piece_multiplier"])
+        add_choice(values.chess_pieces_white_biased, chance * white_chance, "Your Elo has been increased by 20 points.")
+        add_choice(values.chess_pieces_black_biased, chance * (1 - white_chance), "Your Elo has been increased by 10 points.")
+        remaining -= chance
+
+        # Rare bread.
+        chance = remaining * randint_chance(2**9, luck * loaf_arguments["rare_bread_multiplier"])
+        add_choice(values.all_rare_breads, chance, "Tasty!")
+        remaining -= chance
+
+        # Special bread.
+        chance = remaining * randint_chance(2**7, luck * loaf_arguments["special_bread_multiplier"])
+        add_choice(values.all_special_breads, chance, "Tasty.")
+        remaining -= chance
+
+        # Bread.
+        add(values.normal_bread, remaining, "")
+
+        self.emotes = list(chances.keys())
+        self.commentaries = [commentaries[emote] for emote in self.emotes]
+        self.texts = [emote.text for emote in self.emotes]
+
+        total = sum(chances.values())
+        self.chances = [chances[emote] / total for emote in self.emotes]
+
+        self.extra_profits = [
+            user_account.get("max_daily_rolls") * 10 if emote == values.anarchy_chess else 0 # between 10 and 10,000 extra
+            for emote in self.emotes
+        ]
+        self.gambit_bonuses = [user_account.get_dough_boost_for_item(emote) for emote in self.emotes]
+        self.loaf_values = [
+            emote.value + extra_profit + gambit_bonus
+            for emote, extra_profit, gambit_bonus in zip(self.emotes, self.extra_profits, self.gambit_bonuses)
+        ]
+
+        self.build_alias_table()
+
+    def __len__(self: typing.Self) -> int:
+        return len(self.emotes)
+
+    def build_alias_table(self: typing.Self) -> None:
+        """Splits the outcomes into equally likely columns of at most two outcomes each.
+        Column `i` is outcome `i` with a chance of `alias_chances[i]`, and outcome `aliases[i]` otherwise."""
+        count = len(self.chances)
+        scaled = [chance * count for chance in self.chances]
+
+        self.alias_chances = [1.0] * count
+        self.aliases = list(range(count))
+
+        small = [index for index, chance in enumerate(scaled) if chance < 1.0]
+        large = [index for index, chance in enumerate(scaled) if chance >= 1.0]
+
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+
+            self.alias_chances[less] = scaled[less]
+            self.aliases[less] = more
+
+            # The larger outcome fills the rest of the smaller one's column.
+            scaled[more] = (scaled[more] + scaled[less]) - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # Whatever is left over is only off from 1 because of rounding.
+        for index in small + large:
+            self.alias_chances[index] = 1.0
+        
+        self.alias_chances_array = np.array(self.alias_chances)
+        self.aliases_array = np.array(self.aliases, dtype=np.int64)
+
+    def sample(
+            self: typing.Self,
+            rng: random.Random = random
+        ) -> int:
+        """Draws a single outcome, and returns its index in this table."""
+        position = rng.random() * len(self.alias_chances)
+        column = int(position)
+        if position - column < self.alias_chances[column]:
+            return column
+        return self.aliases[column]
+
+    def sample_many(
+            self: typing.Self,
+            rng: np.random.Generator,
+            size: int
+        ) -> np.ndarray:
+        """Draws the given amount of outcomes, and returns their indexes in this table."""
+        position = rng.random(size) * len(self.alias_chances)
+        columns = position.astype(np.int64)
+        return np.where(position - columns < self.alias_chances_array[columns], columns, self.aliases_array[columns])
+
+    def get_loaf(
+            self: typing.Self,
+            index: int
+        ) -> dict:
+        """Returns the outcome at the given index, in the same format `loaf_roll` uses."""
+        return {
+            "emote": self.emotes[index],
+            "commentary": self.commentaries[index],
+            "extra_profit": self.extra_profits[index],
+            "gambit_bonus": self.gambit_bonuses[index],
+        }
+
+def describe_loaf_count(
+        loaf_count: int,
+        output: dict
+    ) -> str:
+    """Adds the stats for a roll with the given amount of loaves to the output, and returns the commentary for it.
+    Lotteries aren't handled here."""
+    count_commentary = ""
+
+    if loaf_count == 1:
+        count_commentary = "Better luck next time."
+        output = utility.increment(output, "natural_1", 1)
+    elif loaf_count == 10:
+        count_commentary = "Congratulations! You found all 10 loaves."
+        output = utility.increment(output, "ten_breads", 1)
+        output["highest_roll"] = loaf_count
+    elif loaf_count == 11:
+        # an eleven bread roll?? in the bread game?? how queer!! ive never seen such a thing- i must inquire about this further with my supervisor post-haste!!
+        count_commentary = "Eleven breads? How strange."
+        output = utility.increment(output, "eleven_breads", 1)
+        output["highest_roll"] = loaf_count
+    elif loaf_count == 12:
+        # i guess we doin twelve breads now
+        count_commentary = "TWELVE BREADS??"
+        output = utility.increment(output, "twelve_breads", 1)
+        output["highest_roll"] = loaf_count
+    elif loaf_count == 13:
+        count_commentary = "NANI????!? THIRTEEN BUREADOS!?!?"
+        output = utility.increment(output, "thirteen_breads", 1)
+        output["highest_roll"] = loaf_count
+    elif loaf_count == 14:
+        count_commentary = "Fourteen breads? That's a lot of breads. Like really a lot."
+        output = utility.increment(output, "fourteen_or_higher", 1)
+        output = utility.increment(output, "fourteen_breads", 1)
+        output["highest_roll"] = loaf_count
+    elif loaf_count == 15:
+        count_commentary = "Woah! Fifteen breads! It really do be like that."
+        output = utility.increment(output, "fourteen_or_higher", 1)
+        output = utility.increment(output, "fifteen_breads", 1)
+        output["highest_roll"] = loaf_count
+    elif loaf_count == 16:
+        count_commentary = "Surely that's not possible. Sixteen breads?!"
+        output = utility.increment(output, "fourteen_or_higher", 1)
+        output = utility.increment(output, "sixteen_breads", 1)
+        output["highest_roll"] = loaf_count
+    elif loaf_count == 17:
+        count_commentary = "Seventeen breads? You're a wizard, Harry."
+        output = utility.increment(output, "fourteen_or_higher", 1)
+        output = utility.increment(output, "seventeen_breads", 1)
+        output["highest_roll"] = loaf_count
+    elif loaf_count == 18:
+        count_commentary = "A historical occurence! Eighteen breads!"
+        output = utility.increment(output, "fourteen_or_higher", 1)
+        output = utility.increment(output, "eighteen_breads", 1)
+        output["highest_roll"] = loaf_count
+    elif loaf_count == 19:
+        count_commentary = "Nineteen breads. I have no words for such a confluence of events."
+        output = utility.increment(output, "fourteen_or_higher", 1)
+        output = utility.increment(output, "nineteen_breads", 1)
+        output["highest_roll"] = loaf_count
+    elif loaf_count > CURRENT_ROLL_RECORD and loaf_count < 100:
+        stat = utility.name_amount(loaf_count)
+
+        count_commentary = f"Holy crap! That's a new record of {loaf_count} breads!"
+        output["highest_roll"] = loaf_count
+        output = utility.increment(output, "fourteen_or_higher", 1)
+        output = utility.increment(output, "loaf_records", 1)
+        output = utility.increment(output, stat, 1)
+    elif loaf_count > 19 and loaf_count < 100:
+        stat = utility.name_amount(loaf_count)
+
+        count_commentary = f"Holy hell! {loaf_count} breads!"
+        output["highest_roll"] = loaf_count
+        output = utility.increment(output, "fourteen_or_higher", 1)
+        output = utility.increment(output, stat, 1)
+    
+    return count_commentary
+
+def is_better_count_commentary(
+        loaf_count: int,
+        count_commentary: str,
+        best_value: int
+    ) -> bool:
+    """Returns a boolean for whether the count commentary of a roll should replace the one of the best roll so far."""
+    # If the highest so far is lower than the current roll then set the highest to the current.
+    # However, if the highest is a new record and the current roll is a lottery then don't set it, the record takes priority.
+    # If the highest is a lottery and the current roll is a new record then do set it for the same reason.
+    return (loaf_count > best_value) and (count_commentary != "") and \
+        not(loaf_count > 99 and best_value > CURRENT_ROLL_RECORD) or \
+        (best_value > 99 and loaf_count > CURRENT_ROLL_RECORD)
+
+def format_roll_messages(
+        texts: list[str],
+        lottery: bool
+    ) -> list[str]:
+    """Returns the roll messages for a single roll with the given emote texts, 50 loaves per message."""
+    # 5 loaves per line, or 10 for a lottery
+    per_line = 10 if lottery else 5
+    messages = []
+
+    for start in range(0, len(texts), 50):
+        chunk = texts[start:start + 50]
+        lines = [" ".join(chunk[i:i + per_line]) + " " for i in range(0, len(chunk), per_line)]
+        message = "\n".join(lines)
+        if len(chunk) % per_line == 0:
+            message += "\n"
+        messages.append(message)
+    
+    return messages
+
+class Black_Hole_Filter:
+    """Decides which roll messages are shown when the black hole is on.
+    
+    A message is shown if it has any of the black hole conditions in it, if "14+" is a condition and it has 14 to 49
+    loaves in it, or if "lottery_win" is a condition and it has 50 loaves in it. Since that can be worked out from a
+    roll before making its messages, rolls with no messages that would be shown are skipped entirely."""
+
+    def __init__(
+            self: typing.Self,
+            conditions: list[str]
+        ) -> None:
+        self.conditions = list(conditions)
+        self.show_large = "14+" in self.conditions
+        self.show_lotteries = ("lottery_win" in self.conditions) or (":fingers_crossed:" in self.conditions)
+
+        # Conditions are checked against whole messages, so one with a space in it could match across two loaves.
+        # Those can't be checked one loaf at a time, so every roll has its messages made.
+        self.check_every_roll = any(len(condition.split()) != 1 for condition in self.conditions)
+
+        self.notable_texts = dict() # emote text -> whether a condition is in it
+
+    def is_notable(
+            self: typing.Self,
+            text: str
+        ) -> bool:
+        """Returns a boolean for whether any of the conditions is in the given emote text."""
+        notable = self.notable_texts.get(text)
+        if notable is None:
+            notable = any(condition in text for condition in self.conditions)
+            self.notable_texts[text] = notable
+        return notable
+
+    def may_show_roll(
+            self: typing.Self,
+            texts: list[str]
+        ) -> bool:
+        """Returns a boolean for whether any message of a roll with the given emote texts could be shown."""
+        if self.check_every_roll:
+            return True
+        
+        loaf_count = len(texts)
+        if self.show_large and loaf_count >= 14:
+            return True
+        
+        if self.show_lotteries and loaf_count >= 50:
+            return True
+        
+        return any(self.is_notable(text) for text in set(texts))
+
+    def wants_message(
+            self: typing.Self,
+            message: str
+        ) -> bool:
+        """Returns a boolean for whether the given roll message should be shown."""
+        loaf_count = len(message.split())
+        return any(item in message for item in self.conditions) or \
+            (self.show_large and loaf_count >= 14 and loaf_count < 50) or \
+            (self.show_lotteries and loaf_count >= 50)
+
+    def filter_roll(
+            self: typing.Self,
+            texts: list[str],
+            lottery: bool
+        ) -> list[str]:
+        """Returns the messages for a roll with the given emote texts that should be shown."""
+        if not self.may_show_roll(texts):
+            return []
+        
+        return [message for message in format_roll_messages(texts, lottery) if self.wants_message(message)]
+
+def finish_roll_output(
+        output: dict,
+        roll_count: int,
+        highest_roll: int,
+        gambit_shop_bonus: int,
+        roll_messages: list[str],
+        count_commentary: str,
+        loaf_commentary: str,
+        profit: int
+    ) -> dict:
+    """Sets the values every roll engine works out at the end on the output, and returns it."""
+    # now we set all the calculated output values
+    output["highest_roll"] = highest_roll
+
+    if gambit_shop_bonus > 0:
+        output["gambit_shop_bonus"] = gambit_shop_bonus
+
+    # output all the roll messages
+    output["roll_messages"] = roll_messages
+
+
+    output["commentary"] = ""
+
+    if roll_count > 1:
+        output["commentary"] += f"Multiroll of {utility.smart_number(roll_count)} complete."
+
+    # it's not better luck next time if you got something nice
+    if count_commentary == "Better luck next time.":
+        if loaf_commentary != "":
+            count_commentary = ""
+
+    # add count commentary
+    if count_commentary != "":
+        if output["commentary"] != "": # add newlines to separate
+            output["commentary"] += "\n\n"
+        output["commentary"] += count_commentary
+
+    if loaf_commentary != "":
+        if output["commentary"] != "": # add newlines to separate
+            output["commentary"] += "\n\n"
+        output["commentary"] += loaf_commentary
+    
+    if output["commentary"] == "":
+        output["commentary"] = None
+
+    # add profit to the output
+    # output["lifetime_dough"] = output_profit
+    # output["total_dough"] = output_profit
+    output["value"] = profit
+
+    return output
+
 def bread_roll(
         roll_luck = 1,
         roll_count = 1,
         user_account: account.Bread_Account = None,
-        json_interface: bread_cog.JSON_interface = None
+        json_interface: bread_cog.JSON_interface = None,
+        engine: str = None,
+        message_filter: Black_Hole_Filter = None,
+        rng: random.Random = random
+    ) -> dict:
+    """Calculates an entire set of bread rolls.
+    
+    `engine` can be "python" to roll one loaf at a time or "numpy" to roll everything at once. Both give the same
+    output with the same odds. By default large multirolls use "numpy".
+
+    If a `message_filter` is given only the roll messages it wants are made, and the rest of the rolls are only
+    counted. The other outputs are the same either way.
+
+    Everything random is drawn from `rng`, so a seeded `random.Random` always gives the same rolls. The NumPy engine
+    is seeded from it as well."""
+    context = roll_contexts.get(roll_luck, user_account, json_interface)
+
+    if engine is None:
+        engine = "numpy" if roll_count >= NUMPY_ROLL_THRESHOLD else "python"
+
+    if engine == "numpy":
+        return bread_roll_numpy(
+            context,
+            roll_count,
+            rng = utility.get_numpy_rng(rng),
+            message_filter = message_filter
+        )
+    
+    return bread_roll_python(context, roll_count, message_filter=message_filter, rng=rng)
+
+def bread_roll_python(
+        context: Roll_Context,
+        roll_count: int = 1,
+        message_filter: Black_Hole_Filter = None,
+        rng: random.Random = random
     ) -> dict:
-    """Calculates an entire set of bread rolls."""
+    """Calculates an entire set of bread rolls one loaf at a time, drawing each loaf from the loaf tables of the roll context."""
+    user_account = context.user_account
 
     first_catch_remaining = user_account.get("first_catch_remaining")
 
@@ -37,129 +792,6 @@ def bread_roll(
 
     output["individual_values"] = list()
     output["first_catch_found"] = list()
-    
-    ######################
-    # Ephemeral booleans.
-    
-    disable_lotteries = False # Pathfinder.
-    swap_moak_booster_usage = False # Phoenix.
-    disable_gem_rr = False # Ingenuity.
-
-    ##### Static values.
-    # These are values that are static across all rolls in a multiroll.
-
-    moak_rarity_multiplier = round(user_account.get("max_daily_rolls") / 10)
-    gem_boost = user_account.get_shadow_gold_gem_boost_count()
-    white_piece_chance = store.chess_piece_distribution_levels[user_account.get("chess_piece_equalizer")]
-    moak_booster_multiplier = store.moak_booster_multipliers[user_account.get("moak_booster")]
-
-    lottery_chance = 4096
-    lottery_luck_multiplier = 4
-    
-    lc_booster = user_account.get("LC_booster")
-    if lc_booster > 0:
-        lc_boost = 2 ** lc_booster
-    else:
-        lc_boost = 1
-
-    corruption_chance = user_account.get_corruption_chance(json_interface=json_interface)
-    anarchy_corruption_chance = user_account.get_anarchy_corruption_chance(json_interface=json_interface)
-    
-    # If the user has access to space.
-    if user_account.get_space_level() >= 1:
-        # If the user has been to space, then check their current location and adjust the chance multipliers accordingly.
-
-        anarchy_piece_luck = round(user_account.get_anarchy_piece_luck(roll_luck * lc_boost))
-        space_gem_luck = round(user_account.get_space_gem_luck(roll_luck * lc_boost))
-
-        #### Planet-based roll modifiers.
-
-        system_tile = user_account.get_system_tile(json_interface)
-        day_seed = json_interface.get_day_seed(guild=user_account.get("guild_id"))
-
-        rarity_modifiers = space.get_planet_modifiers(
-            user_account = user_account,
-            json_interface = json_interface,
-            ascension = user_account.get_prestige_level(),
-            guild = user_account.get("guild_id"),
-            day_seed = day_seed,
-            tile = system_tile
-        )
-
-        space_gem_multiplier = rarity_modifiers.get(values.gem_pink)
-        moak_multiplier = rarity_modifiers.get(values.anarchy_chess)
-        gem_gold_multiplier = rarity_modifiers.get(values.gem_gold)
-        gem_green_multiplier = rarity_modifiers.get(values.gem_green)
-        gem_purple_multiplier = rarity_modifiers.get(values.gem_purple)
-        gem_blue_multiplier = rarity_modifiers.get(values.gem_blue)
-        gem_red_multiplier = rarity_modifiers.get(values.gem_red)
-        anarchy_piece_multiplier = rarity_modifiers.get(values.anarchy_black_pawn)
-        chess_piece_multiplier = rarity_modifiers.get(values.black_pawn)
-        rare_bread_multiplier = rarity_modifiers.get(values.waffle)
-        special_bread_multiplier = rarity_modifiers.get(values.croissant)
-    else:
-        # If the user has not been to space, set all the multipliers to 1 to not adjust the rarities at all.
-        # In addition, set the anarchy piece luck to -1 to make it impossible to roll.
-
-        anarchy_piece_luck = -1 # With a negative number it's impossible to roll.
-        space_gem_luck = -1 # With a negative number it's impossible to roll.
-
-        space_gem_multiplier = 1
-        moak_multiplier = 1
-        gem_gold_multiplier = 1
-        gem_green_multiplier = 1
-        gem_purple_multiplier = 1
-        gem_blue_multiplier = 1
-        gem_red_multiplier = 1
-        anarchy_piece_multiplier = 1
-        chess_piece_multiplier = 1
-        rare_bread_multiplier = 1
-        special_bread_multiplier = 1
-
-    if user_account.get_ephemeral_upgrade(store.Viking.name):
-        print("[Rolls]: Viking activated.")
-        # Viking: Increase luck by 10% but MoaKs become unrollable.
-        roll_luck = round(roll_luck * 1.1)
-        anarchy_piece_luck = round(anarchy_piece_luck * 1.1)
-        space_gem_luck = round(space_gem_luck * 1.1)
-        moak_multiplier = 0
-
-    if user_account.get_ephemeral_upgrade(store.Pathfinder.name):
-        print("[Rolls]: Viking activated.")
-        # Pathfinder: Doubles your maximum daily rolls, but you can no longer roll any lotteries.
-        # The maximum daily roll doubling part is implemented in bread_cog.py.
-        disable_lotteries = True
-
-    if user_account.get_ephemeral_upgrade(store.Sojourner.name):
-        print("[Rolls]: Sojourner activated.")
-        # Sojourner: You get 50% more anarchy pieces, but Chess Piece Equalizer is effectively 2 levels lower. (With 20% and 15% below 0.)
-        anarchy_piece_multiplier *= 1.5
-        white_piece_chance = ([15, 20] + store.chess_piece_distribution_levels)[user_account.get("chess_piece_equalizer")]
-
-    if user_account.get_ephemeral_upgrade(store.Curiosity.name):
-        print("[Rolls]: Curiosity activated.")
-        # Curiosity: Doubles the chance of rolling a lottery, but removes the 4x luck multiplier inside of them.
-        lottery_chance = 2048
-        lottery_luck_multiplier = 1
-
-    if user_account.get_ephemeral_upgrade(store.Phoenix.name):
-        print("[Rolls]: Phoenix activated.")
-        # Phoenix: MoaK Booster affects gems instead of MoaKs.
-        swap_moak_booster_usage = True
-        space_gem_luck = round(space_gem_luck * moak_booster_multiplier)
-
-    if user_account.get_ephemeral_upgrade(store.Perseverance.name):
-        print("[Rolls]: Perseverance activated.")
-        # Perseverance: Doubles the chance of rolling space gems, but cuts the chance of rolling Anarchy Pieces in half.
-        anarchy_piece_multiplier /= 2
-        space_gem_multiplier *= 2
-
-    if user_account.get_ephemeral_upgrade(store.Ingenuity.name):
-        print("[Rolls]: Ingenuity activated.")
-        # Ingenuity: Increase your MoaK chance by 25%, but Recipe Refinement no longer applies to gems.
-        moak_multiplier *= 1.25
-        disable_gem_rr = True
-
 
     # what we'll do, is we'll have one commentary message, and a bunch of roll messages
     # each roll message will have up to 20 emotes in it
@@ -170,120 +802,37 @@ def bread_roll(
         count_commentary = ""
 
         #roll 1-10 (or 11 or more) breads, each one has a chance to be something different
-        loaf_count = random.randint(1,10)
+        loaf_count = rng.randint(1,10)
 
-        out_luck = roll_luck
         lottery = False
 
-        if (not disable_lotteries) and random.randint(1, lottery_chance) == 1: #lottery win
-            # if you have more than 100 max daily rolls, you'll get extra rolls on the lottery
-            loaf_count = max(100, user_account.get("max_daily_rolls"))
+        if (not context.disable_lotteries) and rng.randint(1, context.lottery_chance) == 1: #lottery win
+            loaf_count = context.get_lottery_loaf_count()
             # but the base profit goes down to compensate
             profit = max(0, 1000-loaf_count)
-            out_luck = max(roll_luck*lottery_luck_multiplier, 16) # extra lucky
             count_commentary = "You won the lottery!!!! Congratulations!!!"
             output = utility.increment(output, "lottery_win", 1)
             lottery = True
             #lottery
         
         # this section does 11 and higher breads
-        elif random.randint(1,512) == 1: # normally 512\
+        elif rng.randint(1,512) == 1: # normally 512\
             loaf_count = 11
-            while random.randint(1,2) == 1:
+            while rng.randint(1,2) == 1:
                 loaf_count += 1
 
         # print (f"roll_count: {roll_count}")
 
-        if loaf_count == 1:
-            count_commentary = "Better luck next time."
-            output = utility.increment(output, "natural_1", 1)
-        elif loaf_count == 10:
-            count_commentary = "Congratulations! You found all 10 loaves."
-            output = utility.increment(output, "ten_breads", 1)
-            output["highest_roll"] = loaf_count
-        elif loaf_count == 11:
-            # an eleven bread roll?? in the bread game?? how queer!! ive never seen such a thing- i must inquire about this further with my supervisor post-haste!!
-            count_commentary = "Eleven breads? How strange."
-            output = utility.increment(output, "eleven_breads", 1)
-            output["highest_roll"] = loaf_count
-        elif loaf_count == 12:
-            # i guess we doin twelve breads now
-            count_commentary = "TWELVE BREADS??"
-            output = utility.increment(output, "twelve_breads", 1)
-            output["highest_roll"] = loaf_count
-        elif loaf_count == 13:
-            count_commentary = "NANI????!? THIRTEEN BUREADOS!?!?"
-            output = utility.increment(output, "thirteen_breads", 1)
-            output["highest_roll"] = loaf_count
-        elif loaf_count == 14:
-            count_commentary = "Fourteen breads? That's a lot of breads. Like really a lot."
-            output = utility.increment(output, "fourteen_or_higher", 1)
-            output = utility.increment(output, "fourteen_breads", 1)
-            output["highest_roll"] = loaf_count
-        elif loaf_count == 15:
-            count_commentary = "Woah! Fifteen breads! It really do be like that."
-            output = utility.increment(output, "fourteen_or_higher", 1)
-            output = utility.increment(output, "fifteen_breads", 1)
-            output["highest_roll"] = loaf_count
-        elif loaf_count == 16:
-            count_commentary = "Surely that's not possible. Sixteen breads?!"
-            output = utility.increment(output, "fourteen_or_higher", 1)
-            output = utility.increment(output, "sixteen_breads", 1)
-            output["highest_roll"] = loaf_count
-        elif loaf_count == 17:
-            count_commentary = "Seventeen breads? You're a wizard, Harry."
-            output = utility.increment(output, "fourteen_or_higher", 1)
-            output = utility.increment(output, "seventeen_breads", 1)
-            output["highest_roll"] = loaf_count
-        elif loaf_count == 18:
-            count_commentary = "A historical occurence! Eighteen breads!"
-            output = utility.increment(output, "fourteen_or_higher", 1)
-            output = utility.increment(output, "eighteen_breads", 1)
-            output["highest_roll"] = loaf_count
-        elif loaf_count == 19:
-            count_commentary = "Nineteen breads. I have no words for such a confluence of events."
-            output = utility.increment(output, "fourteen_or_higher", 1)
-            output = utility.increment(output, "nineteen_breads", 1)
-            output["highest_roll"] = loaf_count
-        elif loaf_count > CURRENT_ROLL_RECORD and loaf_count < 100:
-            stat = utility.name_amount(loaf_count)
-
-            count_commentary = f"Holy crap! That's a new record of {loaf_count} breads!"
-            output["highest_roll"] = loaf_count
-            output = utility.increment(output, "fourteen_or_higher", 1)
-            output = utility.increment(output, "loaf_records", 1)
-            output = utility.increment(output, stat, 1)
-        elif loaf_count > 19 and loaf_count < 100:
-            stat = utility.name_amount(loaf_count)
-
-            count_commentary = f"Holy hell! {loaf_count} breads!"
-            output["highest_roll"] = loaf_count
-            output = utility.increment(output, "fourteen_or_higher", 1)
-            output = utility.increment(output, stat, 1)
-        elif count_commentary is None:
-            count_commentary = ""
+        if not lottery:
+            count_commentary = describe_loaf_count(loaf_count, output)
 
         # set the highest roll if it's not 100
         if loaf_count < 100:
             output_highest_roll = max(output_highest_roll, loaf_count)
 
-        emote_output = ""
+        roll_texts = []
 
-        ### Roll-only values:
-        # These are values that are the same for each loaf in this roll, but may change on a different roll.        
-
-        if swap_moak_booster_usage:
-            moak_luck = out_luck
-            gem_luck = round(out_luck + gem_boost * moak_booster_multiplier)
-        else:
-            moak_luck = round(out_luck * moak_booster_multiplier)
-            gem_luck = out_luck + gem_boost
-
-        if lc_booster > 0:
-            out_luck = (out_luck - 1) * lc_boost + 1
-            
-            if not disable_gem_rr:
-                gem_luck = (gem_luck - 1) * lc_boost + 1
+        loaf_table = context.get_loaf_table(lottery)
 
         for i in range(1,loaf_count+1):
 
@@ -291,51 +840,26 @@ def bread_roll(
             ######
             ############################################################
 
-            roll = loaf_roll(
-                luck = out_luck,
-                user_account = user_account,
-                
-                white_piece_chance = white_piece_chance,
-
-                moak_rarity_multiplier = moak_rarity_multiplier,
-                moak_luck = moak_luck,
-
-                gem_luck = gem_luck,
-
-                corruption_chance = corruption_chance,
-                anarchy_corruption_chance = anarchy_corruption_chance,
-                anarchy_piece_luck = anarchy_piece_luck,
-                space_gem_luck = space_gem_luck,
-
-                space_gem_multiplier = space_gem_multiplier,
-                moak_multiplier = moak_multiplier,
-                gem_gold_multiplier = gem_gold_multiplier,
-                gem_green_multiplier = gem_green_multiplier,
-                gem_purple_multiplier = gem_purple_multiplier,
-                gem_blue_multiplier = gem_blue_multiplier,
-                gem_red_multiplier = gem_red_multiplier,
-                anarchy_piece_multiplier = anarchy_piece_multiplier,
-                chess_piece_multiplier = chess_piece_multiplier,
-                rare_bread_multiplier = rare_bread_multiplier,
-                special_bread_multiplier = special_bread_multiplier
-            )
+            # The same as `loaf_roll`, but with a single random number.
+            outcome = loaf_table.sample(rng)
+            emote = loaf_table.emotes[outcome]
 
             ############################################################
             ######
 
-            value = roll["emote"].value + roll["extra_profit"] + roll["gambit_bonus"]
+            value = loaf_table.loaf_values[outcome]
 
             if first_catch_remaining > 0:
-                if roll["emote"] != values.normal_bread and roll["emote"] != values.corrupted_bread:
-                    output["first_catch_found"].append((roll["emote"], value * 3)) # This is added to the regular amount, so 3 means it'll be 4x.
+                if emote != values.normal_bread and emote != values.corrupted_bread:
+                    output["first_catch_found"].append((emote, value * 3)) # This is added to the regular amount, so 3 means it'll be 4x.
                     first_catch_remaining -= 1
             
-            gambit_shop_bonus += roll["gambit_bonus"]
-            # emote_text = roll["emote"].get_representation(None)
-            emote_text = roll["emote"].text
+            gambit_shop_bonus += loaf_table.gambit_bonuses[outcome]
+            # emote_text = emote.get_representation(None)
+            emote_text = emote.text
             profit += value
             # profit += roll["extra_profit"]
-            emote_output += emote_text + " "
+            roll_texts.append(emote_text)
 
             if emote_text in output.keys():
                 output[emote_text] += 1
@@ -343,41 +867,25 @@ def bread_roll(
                 output[emote_text] = 1
 
             # add all attributes in
-            for attribute in roll["emote"].attributes:
+            for attribute in emote.attributes:
                 if attribute in output.keys():
                     output[attribute] += 1
                 else:
                     output[attribute] = 1
 
-            # add newlines
-            if lottery == False: #user_account.get("compound_roller") == 0:
-                if i % 5 == 0:
-                    emote_output += "\n"
-            else:
-                if i % 10 == 0:
-                    emote_output += "\n"
-
-            # split into multiple messages if it's too long
-            if i % 50 == 0:
-                output_roll_messages.append(emote_output)
-                emote_output = ""
-
             # make sure to only include the commentary for the most significant piece
             if value > output_loaf_commentary_value:
-                output_loaf_commentary = roll["commentary"]
+                output_loaf_commentary = loaf_table.commentaries[outcome]
                 output_loaf_commentary_value = value
 
-        #add rest of emote output
-        if emote_output != "":
-            output_roll_messages.append(emote_output)
+        # the messages are only made once the roll is done, so the black hole can skip the ones it won't show
+        if message_filter is None:
+            output_roll_messages.extend(format_roll_messages(roll_texts, lottery))
+        else:
+            output_roll_messages.extend(message_filter.filter_roll(roll_texts, lottery))
 
         # if the commentary is of a higher value than the previous one, replace it
-        if (loaf_count > output_count_commentary_value) and (count_commentary != "") and \
-            not(loaf_count > 99 and output_count_commentary_value > CURRENT_ROLL_RECORD) or \
-            (output_count_commentary_value > 99 and loaf_count > CURRENT_ROLL_RECORD):
-            # If the highest so far is lower than the current roll then set the highest to the current.
-            # However, if the highest is a new record and the current roll is a lottery then don't set it, the record takes priority.
-            # If the highest is a lottery and the current roll is a new record then do set it for the same reason.
+        if is_better_count_commentary(loaf_count, count_commentary, output_count_commentary_value):
             output_count_commentary = count_commentary
             output_count_commentary_value = loaf_count
         
@@ -397,51 +905,163 @@ def bread_roll(
         #     output["commentary"] = loaf_commentary
         # else:
         #     output["commentary"] = None
-        # output["emote_text"] = emote_output
+        # output["emote_text"] = roll_texts
         
         # output["lifetime_dough"] = profit
         # output["total_dough"] = profit
 
-    # now we set all the calculated output values
-    output["highest_roll"] = output_highest_roll
+    return finish_roll_output(
+        output = output,
+        roll_count = roll_count,
+        highest_roll = output_highest_roll,
+        gambit_shop_bonus = gambit_shop_bonus,
+        roll_messages = output_roll_messages,
+        count_commentary = output_count_commentary,
+        loaf_commentary = output_loaf_commentary,
+        profit = output_profit
+    )
+
+def bread_roll_numpy(
+        context: Roll_Context,
+        roll_count: int = 1,
+        rng: np.random.Generator = None,
+        message_filter: Black_Hole_Filter = None
+    ) -> dict:
+    """Calculates an entire set of bread rolls at once with NumPy.
+    The loaf counts of every roll and the outcome of every loaf are drawn in batches, from the loaf tables of the
+    roll context. The output is the same as `bread_roll_python`, with the same odds."""
+    if rng is None:
+        rng = np.random.default_rng()
+    
+    user_account = context.user_account
+    output = dict()
 
-    if gambit_shop_bonus > 0:
-        output["gambit_shop_bonus"] = gambit_shop_bonus
+    ##### Loaf counts.
 
-    # output all the roll messages
-    output["roll_messages"] = output_roll_messages
+    if context.disable_lotteries:
+        lotteries = np.zeros(roll_count, dtype=bool)
+    else:
+        lotteries = rng.integers(1, context.lottery_chance, size=roll_count, endpoint=True) == 1
+    
+    # this section does 11 and higher breads
+    large = ~lotteries & (rng.integers(1, 512, size=roll_count, endpoint=True) == 1)
 
+    #roll 1-10 (or 11 or more) breads, each one has a chance to be something different
+    loaf_counts = rng.integers(1, 10, size=roll_count, endpoint=True)
+    # 11, plus one more for every coin flip in a row
+    loaf_counts[large] = 10 + rng.geometric(0.5, size=np.count_nonzero(large))
+    loaf_counts[lotteries] = context.get_lottery_loaf_count()
 
-    output["commentary"] = ""
+    ##### Loaf outcomes.
+    # The normal and lottery tables are put one after the other, so every loaf can be an index into both.
 
-    if roll_count > 1:
-        output["commentary"] += f"Multiroll of {utility.smart_number(roll_count)} complete."
+    normal_table = context.get_loaf_table(lottery=False)
+    lottery_table = context.get_loaf_table(lottery=True)
 
-    # it's not better luck next time if you got something nice
-    if output_count_commentary == "Better luck next time.":
-        if output_loaf_commentary != "":
-            output_count_commentary = ""
+    loaf_lotteries = np.repeat(lotteries, loaf_counts)
+    outcomes = np.empty(len(loaf_lotteries), dtype=np.int64)
+    outcomes[~loaf_lotteries] = normal_table.sample_many(rng, len(loaf_lotteries) - np.count_nonzero(loaf_lotteries))
+    outcomes[loaf_lotteries] = lottery_table.sample_many(rng, np.count_nonzero(loaf_lotteries)) + len(normal_table)
 
-    # add count commentary
-    if output_count_commentary != "":
-        if output["commentary"] != "": # add newlines to separate
-            output["commentary"] += "\n\n"
-        output["commentary"] += output_count_commentary
+    emotes = normal_table.emotes + lottery_table.emotes
+    texts = normal_table.texts + lottery_table.texts
+    commentaries = normal_table.commentaries + lottery_table.commentaries
+    loaf_values = np.array(normal_table.loaf_values + lottery_table.loaf_values, dtype=np.int64)
+    gambit_bonuses = np.array(normal_table.gambit_bonuses + lottery_table.gambit_bonuses, dtype=np.int64)
 
-    if output_loaf_commentary != "":
-        if output["commentary"] != "": # add newlines to separate
-            output["commentary"] += "\n\n"
-        output["commentary"] += output_loaf_commentary
+    ##### Stats.
+
+    lottery_count = int(np.count_nonzero(lotteries))
+    if lottery_count > 0:
+        output["lottery_win"] = lottery_count
+
+    count_commentary = ""
+    count_commentary_value = 0
+
+    # Rolls of 2 to 9 loaves have no stats or commentary, so only the rest need to be looked at.
+    for roll_index in np.flatnonzero((loaf_counts == 1) | (loaf_counts >= 10)).tolist():
+        loaf_count = int(loaf_counts[roll_index])
+
+        if lotteries[roll_index]:
+            roll_commentary = "You won the lottery!!!! Congratulations!!!"
+        else:
+            roll_commentary = describe_loaf_count(loaf_count, output)
+        
+        if is_better_count_commentary(loaf_count, roll_commentary, count_commentary_value):
+            count_commentary = roll_commentary
+            count_commentary_value = loaf_count
     
-    if output["commentary"] == "":
-        output["commentary"] = None
+    # set the highest roll if it's not 100
+    below_100 = loaf_counts[loaf_counts < 100]
+    highest_roll = int(below_100.max()) if len(below_100) > 0 else 0
 
-    # add profit to the output
-    # output["lifetime_dough"] = output_profit
-    # output["total_dough"] = output_profit
-    output["value"] = output_profit
+    outcome_counts = np.bincount(outcomes, minlength=len(emotes))
+    for index in np.flatnonzero(outcome_counts).tolist():
+        amount = int(outcome_counts[index])
+        emote = emotes[index]
+        output = utility.increment(output, emote.text, amount)
 
-    return output
+        # add all attributes in
+        for attribute in emote.attributes:
+            output = utility.increment(output, attribute, amount)
+
+    ##### Values.
+
+    values_per_loaf = loaf_values[outcomes]
+
+    # the lottery base profit goes down to compensate for the extra loaves
+    roll_starts = np.concatenate(([0], np.cumsum(loaf_counts)[:-1]))
+    individual_values = np.add.reduceat(values_per_loaf, roll_starts) + np.where(lotteries, np.maximum(0, 1000 - loaf_counts), 0)
+
+    output["individual_values"] = individual_values.tolist()
+
+    # the first few special items found get a bonus
+    first_catch_remaining = user_account.get("first_catch_remaining")
+    output["first_catch_found"] = list()
+    if first_catch_remaining > 0:
+        not_bread = np.array([emote != values.normal_bread and emote != values.corrupted_bread for emote in emotes])
+        for loaf_index in np.flatnonzero(not_bread[outcomes])[:first_catch_remaining].tolist():
+            output["first_catch_found"].append((emotes[outcomes[loaf_index]], int(values_per_loaf[loaf_index]) * 3)) # This is added to the regular amount, so 3 means it'll be 4x.
+    
+    # make sure to only include the commentary for the most significant piece
+    loaf_commentary = ""
+    best_loaf = int(np.argmax(values_per_loaf))
+    if values_per_loaf[best_loaf] > 0:
+        loaf_commentary = commentaries[outcomes[best_loaf]]
+
+    ##### Messages.
+
+    shown = np.ones(roll_count, dtype=bool)
+    if message_filter is not None and not message_filter.check_every_roll:
+        # only make the messages of rolls the black hole might show
+        notable = np.array([message_filter.is_notable(text) for text in texts])
+        shown = np.logical_or.reduceat(notable[outcomes], roll_starts)
+        if message_filter.show_large:
+            shown |= loaf_counts >= 14
+        if message_filter.show_lotteries:
+            shown |= loaf_counts >= 50
+
+    roll_messages = []
+    for roll_index in np.flatnonzero(shown).tolist():
+        roll_start = int(roll_starts[roll_index])
+        roll_texts = [texts[index] for index in outcomes[roll_start:roll_start + loaf_counts[roll_index]].tolist()]
+        lottery = bool(lotteries[roll_index])
+
+        if message_filter is None:
+            roll_messages.extend(format_roll_messages(roll_texts, lottery))
+        else:
+            roll_messages.extend(message_filter.filter_roll(roll_texts, lottery))
+
+    return finish_roll_output(
+        output = output,
+        roll_count = roll_count,
+        highest_roll = highest_roll,
+        gambit_shop_bonus = int(gambit_bonuses[outcomes].sum()),
+        roll_messages = roll_messages,
+        count_commentary = count_commentary,
+        loaf_commentary = loaf_commentary,
+        profit = int(individual_values.sum())
+    )
 
 def loaf_roll(
         luck: int = 1,
@@ -469,46 +1089,50 @@ def loaf_roll(
         anarchy_piece_multiplier: float = 1,
         chess_piece_multiplier: float = 1,
         rare_bread_multiplier: float = 1,
-        special_bread_multiplier: float = 1
+        special_bread_multiplier: float = 1,
+        rng: random.Random = random
     ) -> dict:
-    """Calculates a single loaf in a bread roll."""
+    """Calculates a single loaf in a bread roll.
+    
+    Rolls use `Loaf_Table`, which gives the same odds as this with a single random number, but this stays as the
+    reference for what those odds are. Any change here has to be made in `Loaf_Table` as well."""
 
     output = {}
     output["extra_profit"] = 0
 
-    if random.randint(1, 2**13) <= (anarchy_piece_luck * anarchy_piece_multiplier):
-        if random.random() < anarchy_corruption_chance:
+    if rng.randint(1, 2**13) <= (anarchy_piece_luck * anarchy_piece_multiplier):
+        if rng.random() < anarchy_corruption_chance:
             output["commentary"] = ""
             output["emote"] = values.corrupted_bread
         else:
             # anarchy piece
 
-            if random.randint(1, 100) <= white_piece_chance:
+            if rng.randint(1, 100) <= white_piece_chance:
                 # White anarchy piece
-                output["emote"] = random.choice(values.anarchy_pieces_white_biased)
+                output["emote"] = rng.choice(values.anarchy_pieces_white_biased)
                 output["commentary"] = "Your Karma has been increased by 20 points."
             else:
                 # Black anarchy piece
-                output["emote"] = random.choice(values.anarchy_pieces_black_biased)
+                output["emote"] = rng.choice(values.anarchy_pieces_black_biased)
                 output["commentary"] = "Your Karma has been increased by 10 points."
 
     # Space Gems.
-    elif random.randint(1, 2**21) <= (space_gem_luck * space_gem_multiplier):
-        if random.random() < anarchy_corruption_chance:
+    elif rng.randint(1, 2**21) <= (space_gem_luck * space_gem_multiplier):
+        if rng.random() < anarchy_corruption_chance:
             output["commentary"] = ""
             output["emote"] = values.corrupted_bread
         else:
-            output["emote"] = random.choice(values.all_very_shinies)
+            output["emote"] = rng.choice(values.all_very_shinies)
             output["commentary"] = "Extraordinarily shiny!"
 
 
 
-    elif random.random() < corruption_chance: # Corrupted bread :|
+    elif rng.random() < corruption_chance: # Corrupted bread :|
         output["commentary"] = ""
         output["emote"] = values.corrupted_bread
 
     # MoaKs
-    elif random.randint(1, moak_rarity_multiplier * 2**15) <= (moak_luck * moak_multiplier):
+    elif rng.randint(1, moak_rarity_multiplier * 2**15) <= (moak_luck * moak_multiplier):
         # one-of-a-kind
         # output["emote"] = random.choice([
         #                                     #values.holy_hell, 
@@ -520,70 +1144,70 @@ def loaf_roll(
         output["commentary"] = "That sure is pretty rare!"
         output["extra_profit"] = user_account.get("max_daily_rolls") * 10 # between 10 and 10,000 extra
 
-    elif random.randint(1, 2**22) <= (gem_luck * gem_gold_multiplier):
+    elif rng.randint(1, 2**22) <= (gem_luck * gem_gold_multiplier):
         # gold gem
         output["emote"] = values.gem_gold
         output["commentary"] = "The fabled gold gem!"
 
     # 32768 -> green gem worth 2000
-    elif random.randint(1, 2**19) <= (gem_luck * gem_green_multiplier):
+    elif rng.randint(1, 2**19) <= (gem_luck * gem_green_multiplier):
         # green gem
         output["emote"] = values.gem_green
         output["commentary"] = "Incredibly shiny!"
 
     # 16384 -> purple gem worth 1000
-    elif random.randint(1, 2**18) <= (gem_luck * gem_purple_multiplier):
+    elif rng.randint(1, 2**18) <= (gem_luck * gem_purple_multiplier):
         # purple gem
         output["emote"] = values.gem_purple
         output["commentary"] = "So very shiny."
 
     # 8192 -> blue gem worth 500
-    elif random.randint(1, 2**17) <= (gem_luck * gem_blue_multiplier):
+    elif rng.randint(1, 2**17) <= (gem_luck * gem_blue_multiplier):
         # blue gem
         output["emote"] = values.gem_blue
         output["commentary"] = "Very shiny."
 
     # 4096 -> red gem, worth 250
-    elif random.randint(1, 2**16) <= (gem_luck * gem_red_multiplier):
+    elif rng.randint(1, 2**16) <= (gem_luck * gem_red_multiplier):
         # red gem
         output["emote"] = values.gem_red
         output["commentary"] = "Shiny."
 
-    elif random.randint(1, 2**11) <= (luck * chess_piece_multiplier):
+    elif rng.randint(1, 2**11) <= (luck * chess_piece_multiplier):
         #chess piece
-        # user_chess_pieces = user_account.get_all_items_with_attribute_unrolled("chess_pieces")
+        # user_chess_pieces = user_account.get_items_counted("chess_pieces")
 
-        if random.randint(1,100) <= white_piece_chance: # white pieces
-            # unfound_white_pieces = utility.array_subtract(values.chess_pieces_white_biased, user_chess_pieces)
-            # if len(unfound_white_pieces) > 0:
-            #     awarded_piece = random.choice(unfound_white_pieces)
+        if rng.randint(1,100) <= white_piece_chance: # white pieces
+            # unfound_white_pieces = utility.Multiset.from_list(values.chess_pieces_white_biased) - user_chess_pieces
+            # if unfound_white_pieces:
+            #     awarded_piece = unfound_white_pieces.choice()
             #     #pprint.pprint(f"awarded white piece: {awarded_piece}, of choices: {str(unfound_white_pieces)}")
             # else:
             #     awarded_piece = random.choice(values.chess_pieces_white_biased)
                 #print("all white pieces found, awarded random white piece")
             #output["emote"] = awarded_piece
-            output["emote"] = random.choice(values.chess_pieces_white_biased)
+            output["emote"] = rng.choice(values.chess_pieces_white_biased)
             output["commentary"] = "Your Elo has been increased by 20 points."
         else: # black pieces
-            # unfound_black_pieces = utility.array_subtract(values.chess_pieces_black_biased, user_chess_pieces)
-            # if len(unfound_black_pieces) > 0:
-            #     awarded_piece = random.choice(unfound_black_pieces)
+            # unfound_black_pieces = utility.Multiset.from_list(values.chess_pieces_black_biased) - user_chess_pieces
+            # if unfound_black_pieces:
+            #     awarded_piece = unfound_black_pieces.choice()
             #     #pprint.pprint(f"awarded black piece: {awarded_piece}, of choices: {str(unfound_black_pieces)}")
             # else:
             #     awarded_piece = random.choice(values.chess_pieces_black_biased)
             #     #print("all black pieces found, awarded random black piece")
             # #output["emote"] = awarded_piece
-            output["emote"] = random.choice(values.chess_pieces_black_biased)
+            output["emote"] = rng.choice(values.chess_pieces_black_biased)
             output["commentary"] = "Your Elo has been increased by 10 points."
         
-    elif random.randint(1, 2**9) <= (luck * rare_bread_multiplier):
+    elif rng.randint(1, 2**9) <= (luck * rare_bread_multiplier):
         #rare bread
-        output["emote"]= random.choice(values.all_rare_breads)
+        output["emote"]= rng.choice(values.all_rare_breads)
         output["commentary"] = "Tasty!"
         
-    elif random.randint(1, 2**7) <= (luck * special_bread_multiplier):
+    elif rng.randint(1, 2**7) <= (luck * special_bread_multiplier):
         #special bread
-        output["emote"] = random.choice(values.all_special_breads)
+        output["emote"] = rng.choice(values.all_special_breads)
         output["commentary"] = "Tasty."
         
     else:
@@ -601,23 +1225,126 @@ def loaf_roll(
     return output
 
 
-def bread_roll_test_average(roll_luck, roll_count, iterations):
+def bread_roll_test_average(
+        user_account: account.Bread_Account,
+        roll_count: int,
+        iterations: int,
+        json_interface: bread_cog.JSON_interface = None
+    ) -> float:
+    """Returns the average dough from rolling `roll_count` times, over the given amount of iterations.
+    For the exact expected value use `roll_odds` instead, this is for checking it."""
+    roll_luck = user_account.get("loaf_converter") + 1
+
     total_profit = 0
     for i in range(iterations):
-        total_profit += bread_roll(roll_luck, roll_count, include_moaks=True)["total_dough"]
+        total_profit += bread_roll(roll_luck, roll_count, user_account, json_interface)["value"]
     
     average = total_profit / iterations
     #print(f"For {roll_luck-1} LCs and {roll_count} daily rolls, average profit is {average}")
     return average
 
-def bread_roll_test_suite(max_luck, max_rolls, iterations):
+def bread_roll_test_suite(
+        user_account: account.Bread_Account,
+        max_luck: int,
+        max_rolls: int,
+        json_interface: bread_cog.JSON_interface = None
+    ) -> None:
+    """Prints the expected dough from a full day of rolls for every amount of Loaf Converters below `max_luck` (rows)
+    and every amount of daily rolls from 10 to below `max_rolls` (columns), for an account like the given one."""
+    import bread.roll_odds as roll_odds
+    
     max_rolls = max(max_rolls, 10)
     for luck in range(1,max_luck):
         print(f"\n{luck}, ", end = ' ')
         for rolls in range(10,max_rolls):
-            print(f"{bread_roll_test_average(luck, rolls, iterations)}, ", end = ' ', flush = True)
+            odds = roll_odds.compare_upgrades(
+                user_account,
+                json_interface,
+                {"loaf_converter": luck - 1 - user_account.get("loaf_converter"), "max_daily_rolls": rolls - user_account.get("max_daily_rolls")}
+            )
+            print(f"{odds[0][1]:.1f}, ", end = ' ', flush = True)
     print()
 
+def bread_roll_engine_test(
+        user_account: account.Bread_Account,
+        json_interface: bread_cog.JSON_interface = None,
+        roll_luck: int = 1,
+        roll_count: int = 256,
+        iterations: int = 200
+    ) -> bool:
+    """Checks that `bread_roll_python` and `bread_roll_numpy` give the same results, by rolling with both many times
+    and comparing the average of every stat. Prints every stat that differs by more than 4 standard errors,
+    and returns a boolean for whether there weren't any."""
+    context = Roll_Context(roll_luck, user_account, json_interface)
+
+    def collect(engine) -> dict[str, list]:
+        samples = dict()
+        for i in range(iterations):
+            result = engine(context, roll_count)
+            result["loaves"] = sum(len(message.split()) for message in result["roll_messages"])
+            result["first_catches"] = len(result["first_catch_found"])
+            for key, value in result.items():
+                if type(value) is int:
+                    samples.setdefault(key, [0] * iterations)[i] = value
+        return samples
+
+    python_samples = collect(bread_roll_python)
+    numpy_samples = collect(bread_roll_numpy)
+
+    passed = True
+    for key in sorted(python_samples.keys() | numpy_samples.keys()):
+        a = np.array(python_samples.get(key, [0] * iterations), dtype=float)
+        b = np.array(numpy_samples.get(key, [0] * iterations), dtype=float)
+        error = math.sqrt((a.var(ddof=1) + b.var(ddof=1)) / iterations)
+        if error == 0:
+            if a.mean() != b.mean():
+                print(f"{key}: always {a.mean()} with python, but always {b.mean()} with numpy")
+                passed = False
+            continue
+        
+        z = (a.mean() - b.mean()) / error
+        if abs(z) > 4:
+            print(f"{key}: {a.mean():.3f} with python, {b.mean():.3f} with numpy (z = {z:.1f})")
+            passed = False
+    
+    return passed
+
+def loaf_table_chi_squared_test(
+        loaf_arguments: dict,
+        samples: int = 200000
+    ) -> tuple[float, int, float]:
+    """Checks that drawing from a `Loaf_Table` gives the same odds as `loaf_roll` with the same arguments,
+    with a chi-squared test of the outcomes of both against each other.
+    Returns the chi-squared statistic, the degrees of freedom and the p-value. A p-value below 0.001 means they differ."""
+    table = Loaf_Table(loaf_arguments)
+
+    cascade_counts = dict()
+    for i in range(samples):
+        emote = loaf_roll(**loaf_arguments)["emote"]
+        cascade_counts[emote] = cascade_counts.get(emote, 0) + 1
+    
+    table_counts = dict()
+    for i in range(samples):
+        emote = table.emotes[table.sample()]
+        table_counts[emote] = table_counts.get(emote, 0) + 1
+
+    # Outcomes the cascade can give but the table doesn't have are counted too, so they fail the test.
+    statistic = 0.0
+    degrees_of_freedom = -1
+    for emote in cascade_counts.keys() | table_counts.keys():
+        observed = cascade_counts.get(emote, 0)
+        expected = table_counts.get(emote, 0)
+        statistic += (observed - expected) ** 2 / (observed + expected)
+        degrees_of_freedom += 1
+
+    # Wilson-Hilferty approximation of the chi-squared distribution, to avoid needing scipy.
+    if degrees_of_freedom < 1:
+        return statistic, degrees_of_freedom, 1.0
+    
+    z = ((statistic / degrees_of_freedom) ** (1 / 3) - (1 - 2 / (9 * degrees_of_freedom))) / math.sqrt(2 / (9 * degrees_of_freedom))
+    p_value = 0.5 * math.erfc(z / math.sqrt(2))
+    return statistic, degrees_of_freedom, p_value
+
 def test_account():
     test_account = account.Bread_Account()
 
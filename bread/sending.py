@@ -0,0 +1,270 @@
+"""Queued sending of the bot's messages, one queue per channel, so commands don't have to send and sleep on their own.
+
+Commands that send a run of messages, like roll results, chessatron animations and gifts, put them in their channel's
+queue and carry on, so they return (and release the player's interaction lock) straight away instead of holding it
+while the messages trickle out. Each channel with something queued has a single worker that sends its queue in order.
+
+Instead of a fixed sleep after every message, the worker keeps to Discord's rate limit for sending in a channel with a
+bucket of `rate_limit` messages per `rate_period` seconds, so messages go out as fast as Discord allows and no faster.
+Messages queued with `coalesce` are packed into the message before them, up to Discord's 2000 character limit, as long
+as they're going to the same place. Animations that are meant to play out can still give a `pause` for a message,
+which is the least time since the previous message in the channel before it's sent.
+
+Queue depths and how long messages waited to be sent are kept as metrics, shown by `$bread admin sends`.
+"""
+from __future__ import annotations
+
+import typing
+import asyncio
+import collections
+import traceback
+import time
+
+from discord.ext import commands
+
+MAX_MESSAGE_LENGTH = 2000
+
+class Queued_Message:
+    """A message waiting in a channel's queue."""
+
+    def __init__(
+            self: typing.Self,
+            ctx: commands.Context,
+            content: str,
+            reply: bool,
+            coalesce: bool,
+            pause: float
+        ) -> None:
+        self.ctx = ctx
+        self.content = content
+        self.reply = reply # Whether to reply to the command, rather than just sending in the channel.
+        self.coalesce = coalesce # Whether this can be packed into the message before it.
+        self.pause = pause
+        self.queued_at = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future() # Resolved with the sent message, or None.
+
+    def can_follow(
+            self: typing.Self,
+            previous: Queued_Message,
+            length: int,
+            max_length: int
+        ) -> bool:
+        """Returns a boolean for whether this can be packed onto the end of a message of the given length that ends
+        with `previous`."""
+        return (
+            self.coalesce
+            and self.pause <= 0
+            and self.ctx is previous.ctx
+            and self.reply == previous.reply
+            and length + 1 + len(self.content) <= max_length
+        )
+
+class Channel_Queue:
+    """The queue of a single channel, along with when its recent messages were sent."""
+
+    def __init__(
+            self: typing.Self,
+            rate_limit: int
+        ) -> None:
+        self.messages = collections.deque()
+        self.sent_times = collections.deque(maxlen=rate_limit) # time.monotonic() of the most recent sends
+        self.worker = None # The task sending the queue, or None if nothing is being sent.
+
+class Send_Queue_Manager:
+    """Keeps a queue of outgoing messages for each channel and sends them in order, packed and paced."""
+
+    def __init__(
+            self: typing.Self,
+            rate_limit: int = 5,
+            rate_period: float = 5.0,
+            max_length: int = MAX_MESSAGE_LENGTH
+        ) -> None:
+        self.rate_limit = rate_limit # Messages that can be sent in a channel in `rate_period` seconds.
+        self.rate_period = rate_period
+        self.max_length = max_length
+
+        # Called with the context and the error when a message can't be sent. Errors are printed if this is None.
+        self.error_handler: typing.Optional[typing.Callable[[commands.Context, Exception], typing.Awaitable]] = None
+
+        self.channels = dict() # channel id -> Channel_Queue
+        self.reset_metrics()
+
+    def reset_metrics(self: typing.Self) -> None:
+        """Resets the metrics."""
+        self.metrics = {
+            "queued": 0, # Messages put in a queue.
+            "sent": 0, # Messages actually sent to Discord, after packing.
+            "coalesced": 0, # Queued messages that were packed into the one before them.
+            "failed": 0, # Sends that raised an error.
+            "rate_limited": 0, # Sends that had to wait for the channel's rate limit.
+            "total_latency": 0.0, # Seconds between being queued and sent, over every queued message that was sent.
+            "max_latency": 0.0,
+            "max_depth": 0, # The most messages that have been waiting in one channel's queue.
+        }
+
+    def send(
+            self: typing.Self,
+            ctx: commands.Context,
+            content: str,
+            reply: bool = True,
+            coalesce: bool = False,
+            pause: float = 0.0
+        ) -> asyncio.Future:
+        """Queues a message to be sent in the context's channel, as a reply to the command unless `reply` is False.
+
+        With `coalesce` the message can be packed into the one before it, if that's going to the same place and there's
+        room. `pause` is the least amount of seconds to leave after the previous message in the channel.
+
+        Returns a future for the sent message, which is None if it couldn't be sent. It can be awaited to wait until
+        the message has been sent, or ignored to carry on straight away."""
+        channel_id = ctx.channel.id
+        queue = self.channels.get(channel_id)
+        if queue is None:
+            queue = Channel_Queue(self.rate_limit)
+            self.channels[channel_id] = queue
+
+        message = Queued_Message(ctx, content, reply, coalesce, pause)
+        queue.messages.append(message)
+
+        self.metrics["queued"] += 1
+        self.metrics["max_depth"] = max(self.metrics["max_depth"], len(queue.messages))
+
+        if queue.worker is None:
+            queue.worker = asyncio.create_task(self.run_channel(channel_id, queue))
+
+        return message.future
+
+    async def flush(
+            self: typing.Self,
+            ctx: commands.Context
+        ) -> None:
+        """Waits until everything queued so far in the context's channel has been sent."""
+        queue = self.channels.get(ctx.channel.id)
+        if queue is None or len(queue.messages) == 0:
+            return
+
+        await asyncio.shield(queue.messages[-1].future)
+
+    def get_depth(
+            self: typing.Self,
+            channel_id: int = None
+        ) -> int:
+        """Returns the amount of messages waiting to be sent in the given channel, or in every channel."""
+        if channel_id is not None:
+            queue = self.channels.get(channel_id)
+            return 0 if queue is None else len(queue.messages)
+
+        return sum(len(queue.messages) for queue in self.channels.values())
+
+    def take_batch(
+            self: typing.Self,
+            queue: Channel_Queue
+        ) -> list[Queued_Message]:
+        """Takes the next message from the queue, along with every message after it that can be packed into it."""
+        batch = [queue.messages.popleft()]
+        length = len(batch[0].content)
+
+        while len(queue.messages) > 0 and queue.messages[0].can_follow(batch[-1], length, self.max_length):
+            message = queue.messages.popleft()
+            length += 1 + len(message.content)
+            batch.append(message)
+
+        return batch
+
+    def get_wait(
+            self: typing.Self,
+            queue: Channel_Queue,
+            message: Queued_Message
+        ) -> tuple[float, bool]:
+        """Returns how many seconds to wait before sending the given message in the given channel, and whether that's
+        because of the rate limit."""
+        if len(queue.sent_times) == 0:
+            return 0.0, False
+
+        now = time.monotonic()
+        pause_wait = queue.sent_times[-1] + message.pause - now
+
+        rate_wait = 0.0
+        if len(queue.sent_times) == queue.sent_times.maxlen:
+            # The oldest of the last `rate_limit` sends has to be out of the period.
+            rate_wait = queue.sent_times[0] + self.rate_period - now
+
+        return max(pause_wait, rate_wait, 0.0), rate_wait > 0 and rate_wait >= pause_wait
+
+    async def run_channel(
+            self: typing.Self,
+            channel_id: int,
+            queue: Channel_Queue
+        ) -> None:
+        """Sends everything in a channel's queue, then stops."""
+        try:
+            while len(queue.messages) > 0:
+                batch = self.take_batch(queue)
+                first = batch[0]
+
+                wait, rate_limited = self.get_wait(queue, first)
+                if wait > 0:
+                    if rate_limited:
+                        self.metrics["rate_limited"] += 1
+                    await asyncio.sleep(wait)
+
+                content = "\n".join(message.content for message in batch)
+
+                try:
+                    if first.reply:
+                        sent = await first.ctx.reply(content)
+                    else:
+                        sent = await first.ctx.send(content)
+                except Exception as error:
+                    sent = None
+                    self.metrics["failed"] += 1
+
+                    if self.error_handler is None:
+                        traceback.print_exception(error)
+                    else:
+                        try:
+                            await self.error_handler(first.ctx, error)
+                        except Exception as handler_error:
+                            traceback.print_exception(handler_error)
+
+                now = time.monotonic()
+                queue.sent_times.append(now)
+
+                self.metrics["sent"] += 1
+                self.metrics["coalesced"] += len(batch) - 1
+
+                for message in batch:
+                    latency = now - message.queued_at
+                    self.metrics["total_latency"] += latency
+                    self.metrics["max_latency"] = max(self.metrics["max_latency"], latency)
+
+                    if not message.future.done():
+                        message.future.set_result(sent)
+        finally:
+            queue.worker = None
+
+            # Anything left over (if this got cancelled) won't be sent.
+            while len(queue.messages) > 0:
+                message = queue.messages.popleft()
+                if not message.future.done():
+                    message.future.set_result(None)
+
+            # Channels that haven't sent anything in a while don't need to be kept around.
+            if self.channels.get(channel_id) is queue and (
+                    len(queue.sent_times) == 0 or time.monotonic() - queue.sent_times[-1] >= self.rate_period
+                ):
+                del self.channels[channel_id]
+
+    def describe(self: typing.Self) -> str:
+        """Returns a description of the current queues and the metrics."""
+        metrics = self.metrics
+        delivered = metrics["queued"] - self.get_depth()
+        average_latency = metrics["total_latency"] / delivered if delivered > 0 else 0.0
+        busiest = max((len(queue.messages) for queue in self.channels.values()), default=0)
+
+        return "\n".join([
+            f"Waiting: {self.get_depth()} in {len(self.channels)} channels, busiest channel: {busiest}, most ever: {metrics['max_depth']}",
+            f"Queued: {metrics['queued']}, sent: {metrics['sent']}, coalesced: {metrics['coalesced']}, failed: {metrics['failed']}",
+            f"Rate limited: {metrics['rate_limited']}",
+            f"Average latency: {average_latency:.2f}s, longest latency: {metrics['max_latency']:.2f}s",
+        ])
@@ -3243,7 +3243,7 @@ def create_trade_hub(
 
     space_data[f"ascension_{user_account.get_prestige_level()}"] = ascension_data
 
-    json_interface.set_custom_file("space", space_data, guild=guild_id)
+    json_interface.set_custom_file("space", space_data, guild=guild_id, keys=[f"ascension_{user_account.get_prestige_level()}"])
 
 def get_trade_hub_project_categories(
         day_seed: str,
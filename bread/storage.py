@@ -0,0 +1,358 @@
+"""Storage backends for the bread data.
+
+The JSON interface keeps every guild's bread cabinet in memory as a dict of files, where each file is either an
+account (keyed by user id) or a custom file like `space`, `stonks` or `guild_info`. A storage backend decides how
+those files are kept between restarts.
+
+To convert an existing database.json (or segmented database/ folder) into an SQLite database:
+    python3 -m bread.storage database.json bread.sqlite3
+"""
+from __future__ import annotations
+
+import typing
+import sqlite3
+import sys
+import os
+import abc
+import time
+
+import serialization
+
+####################################################
+##############   BASE BACKEND   ####################
+####################################################
+
+class Storage_Backend(abc.ABC):
+    """Base class for places the bread data can be stored.
+    Backends hand out each guild's bread data as a dict of files, and may load it lazily and drop it again later,
+    so the dicts they return shouldn't be held on to."""
+
+    name = "base"
+
+    def load(self: typing.Self) -> None:
+        """Called when the bread data is (re)loaded. Anything cached from before is discarded."""
+        pass
+
+    @abc.abstractmethod
+    def list_guilds(self: typing.Self) -> list[str]:
+        """Returns the ids of every guild that has bread data, without loading any of it."""
+        pass
+
+    @abc.abstractmethod
+    def get_guild(
+            self: typing.Self,
+            guild_id: str
+        ) -> dict:
+        """Returns the bread data of a guild, loading it if needed. Guilds without any data get an empty dict."""
+        pass
+
+    def write_file(
+            self: typing.Self,
+            guild_id: str,
+            label: str,
+            file_data: typing.Any,
+            keys: typing.Optional[list[str]] = None
+        ) -> None:
+        """Called whenever a single file in a guild's bread data is set.
+        `keys` is the top-level keys of the file that changed, if it's known that the rest didn't."""
+        pass
+
+    def delete_file(
+            self: typing.Self,
+            guild_id: str,
+            label: str
+        ) -> None:
+        """Called whenever a single file in a guild's bread data is removed."""
+        pass
+
+    @abc.abstractmethod
+    def save(self: typing.Self) -> None:
+        """Saves everything that hasn't been saved by `write_file` already."""
+        pass
+
+    async def save_async(
+            self: typing.Self,
+            scheduled: bool = False
+        ) -> None:
+        """Same as `save`, for backends that can save without blocking the event loop.
+        `scheduled` is True when called by the hourly save."""
+        self.save()
+
+    def evict_idle(
+            self: typing.Self,
+            max_idle: float
+        ) -> int:
+        """Drops the data of guilds that haven't been used in `max_idle` seconds from memory.
+        Returns the amount of guilds dropped."""
+        return 0
+
+    def close(self: typing.Self) -> None:
+        """Releases anything the backend is holding on to."""
+        pass
+
+####################################################
+##############   JSON BACKEND   ####################
+####################################################
+
+class JSON_Storage(Storage_Backend):
+    """Stores the bread data as the `bread` filing cabinet of each guild vault in the JSON cog.
+    The JSON cog takes care of loading and unloading vaults, so nothing is cached here."""
+
+    name = "json"
+
+    def __init__(
+            self: typing.Self,
+            bot
+        ) -> None:
+        self.bot = bot
+
+    def get_json_cog(self: typing.Self):
+        """Returns the JSON cog."""
+        return self.bot.get_cog("JSON")
+
+    def load(self: typing.Self) -> None:
+        self.get_json_cog().load_all_data()
+
+    def list_guilds(self: typing.Self) -> list[str]:
+        return self.get_json_cog().get_list_of_guilds_with_cabinet("bread")
+
+    def get_guild(
+            self: typing.Self,
+            guild_id: str
+        ) -> dict:
+        return self.get_json_cog().get_filing_cabinet("bread", guild=guild_id, create_if_nonexistent=True)
+
+    def write_file(
+            self: typing.Self,
+            guild_id: str,
+            label: str,
+            file_data: typing.Any,
+            keys: typing.Optional[list[str]] = None
+        ) -> None:
+        JSON_cog = self.get_json_cog()
+        if JSON_cog is None:
+            return
+
+        JSON_cog.journal_file_change("bread", label, file_data, guild=guild_id, keys=keys)
+
+    def save(
+            self: typing.Self,
+            JSON_cog = None
+        ) -> None:
+        if JSON_cog is None:
+            JSON_cog = self.get_json_cog()
+
+        JSON_cog.save_all_data()
+
+    async def save_async(
+            self: typing.Self,
+            scheduled: bool = False
+        ) -> None:
+        JSON_cog = self.get_json_cog()
+
+        if scheduled:
+            await JSON_cog.scheduled_save()
+        else:
+            await JSON_cog.save_all_data_async()
+
+####################################################
+#############   SQLITE BACKEND   ###################
+####################################################
+
+class SQLite_Storage(Storage_Backend):
+    """Stores the bread data in an SQLite database, with one row per account and per custom file.
+
+    Rows are written in their own transaction as soon as they're set, so saving only has to write the custom files,
+    which are often changed in place without being set again. Guilds are read the first time they're asked for."""
+
+    name = "sqlite"
+
+    # Rows are stored as text, so this has to be one of the JSON based serializers.
+    serializer = "orjson"
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS bread_files (
+            guild_id TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (guild_id, file_name)
+        ) WITHOUT ROWID
+    """
+
+    def __init__(
+            self: typing.Self,
+            file_path: str = "bread.sqlite3"
+        ) -> None:
+        self.file_path = file_path
+        self.guilds = dict()
+        self.last_access = dict()
+
+        self.connection = sqlite3.connect(file_path)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute(self.schema)
+        self.connection.commit()
+
+    def is_empty(self: typing.Self) -> bool:
+        """Returns a boolean for whether the database has no files in it."""
+        return self.connection.execute("SELECT 1 FROM bread_files LIMIT 1").fetchone() is None
+
+    def load(self: typing.Self) -> None:
+        self.guilds.clear()
+        self.last_access.clear()
+
+    def list_guilds(self: typing.Self) -> list[str]:
+        output = [row[0] for row in self.connection.execute("SELECT DISTINCT guild_id FROM bread_files")]
+        output.extend(guild_id for guild_id in self.guilds if guild_id not in output)
+        return output
+
+    def get_guild(
+            self: typing.Self,
+            guild_id: str
+        ) -> dict:
+        guild_id = str(guild_id)
+        self.last_access[guild_id] = time.time()
+
+        if guild_id in self.guilds:
+            return self.guilds[guild_id]
+        
+        rows = self.connection.execute("SELECT file_name, data FROM bread_files WHERE guild_id = ?", (guild_id,))
+        data = {file_name: serialization.deserialize(file_data, self.serializer) for file_name, file_data in rows}
+        
+        self.guilds[guild_id] = data
+        return data
+
+    def write_file(
+            self: typing.Self,
+            guild_id: str,
+            label: str,
+            file_data: typing.Any,
+            keys: typing.Optional[list[str]] = None
+        ) -> None:
+        # Files are stored as a single value, so the whole file is written either way.
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO bread_files (guild_id, file_name, data) VALUES (?, ?, ?)",
+                (str(guild_id), str(label), serialization.serialize(file_data, self.serializer).decode("utf-8"))
+            )
+
+    def delete_file(
+            self: typing.Self,
+            guild_id: str,
+            label: str
+        ) -> None:
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM bread_files WHERE guild_id = ? AND file_name = ?",
+                (str(guild_id), str(label))
+            )
+
+    def write_guilds(
+            self: typing.Self,
+            data: dict[str, dict],
+            custom_files_only: bool = False
+        ) -> int:
+        """Writes the files of every given guild in a single transaction, and returns how many were written.
+        If `custom_files_only` is True the accounts are skipped."""
+        rows = []
+        for guild_id, cabinet in data.items():
+            for file_name, file_data in cabinet.items():
+                if custom_files_only and str(file_name).isdigit():
+                    continue
+
+                rows.append((str(guild_id), str(file_name), serialization.serialize(file_data, self.serializer).decode("utf-8")))
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO bread_files (guild_id, file_name, data) VALUES (?, ?, ?)",
+                rows
+            )
+
+        return len(rows)
+
+    def save(self: typing.Self) -> None:
+        # Accounts are written by `write_file` whenever they're set, but custom files are
+        # often edited in place, so those are written every time.
+        self.write_guilds(self.guilds, custom_files_only=True)
+
+    def evict_idle(
+            self: typing.Self,
+            max_idle: float
+        ) -> int:
+        now = time.time()
+        idle = {
+            guild_id: data
+            for guild_id, data in self.guilds.items()
+            if now - self.last_access.get(guild_id, 0) >= max_idle
+        }
+
+        # Write out anything that was changed in place before forgetting about it.
+        self.write_guilds(idle, custom_files_only=True)
+
+        for guild_id in idle:
+            del self.guilds[guild_id]
+            self.last_access.pop(guild_id, None)
+        
+        return len(idle)
+
+    def close(self: typing.Self) -> None:
+        self.connection.close()
+
+####################################################
+###############   IMPORTING   ######################
+####################################################
+
+def import_json_database(
+        cabinets: typing.Iterable[tuple[str, dict]],
+        storage: SQLite_Storage
+    ) -> int:
+    """Copies the given `(guild id, bread cabinet)` pairs into the given SQLite storage.
+    Returns the amount of files imported."""
+    return storage.write_guilds(dict(cabinets))
+
+def read_json_database(json_path: str) -> typing.Iterator[tuple[str, dict]]:
+    """Reads the bread cabinet of every guild from a JSON cog database, one guild at a time.
+    The path can either be an old style database.json file or a segmented database folder."""
+    if os.path.isdir(json_path):
+        with open(os.path.join(json_path, "index.json"), 'rb') as index_file:
+            index = serialization.deserialize(index_file.read())
+
+        segment_serializer = index.get("serializer", "json")
+        for guild_id, cabinet_names in index["guilds"].items():
+            if "bread" not in cabinet_names:
+                continue
+
+            with open(os.path.join(json_path, guild_id + serialization.get_extension(segment_serializer)), 'rb') as segment_file:
+                yield guild_id, serialization.deserialize(segment_file.read(), segment_serializer)["bread"]
+        
+        return
+
+    with open(json_path, 'rb') as json_file:
+        database = serialization.deserialize(json_file.read())
+    
+    for guild_id, vault in database.items():
+        if not str(guild_id).isdigit() or not isinstance(vault, dict):
+            continue
+
+        if "bread" in vault:
+            yield str(guild_id), vault["bread"]
+
+def import_json_file(
+        json_path: str = "database.json",
+        sqlite_path: str = "bread.sqlite3"
+    ) -> int:
+    """Imports the bread data in a JSON cog database into an SQLite database. Returns the amount of files imported."""
+    storage = SQLite_Storage(sqlite_path)
+    try:
+        return import_json_database(read_json_database(json_path), storage)
+    finally:
+        storage.close()
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    if len(arguments) > 2:
+        print("Usage: python3 -m bread.storage [database.json or database folder path] [sqlite database path]")
+        sys.exit(1)
+
+    imported = import_json_file(*arguments)
+    print(f"Imported {imported} files.")
@@ -3,7 +3,7 @@ from __future__ import annotations
 import typing
 import random 
 import math
-import numpy as np
+import copy
 
 import bread.account as account
 import bread.values as values
@@ -25,6 +25,9 @@ square_root_of_2 = 1.4142135623730950488
 
 ascension_token_levels = [50, 150, 450, 1000, 1660]
 
+# daily roll levels that come with an introductory discount
+daily_rolls_introductory_prices = {11: 32, 12: 64, 13: 96}
+
 # daily_rolls_discount_prices = [128, 124, 120, 116, 112, 108, 104, 100]
 # loaf_converter_discount_prices = [256, 244, 232, 220, 208, 196, 184, 172]
 chess_piece_distribution_levels = [25, 33, 42, 50]
@@ -39,6 +42,9 @@ trade_hub_squared = [n ** 2 for n in trade_hub_distances]
 
 trade_hub_projects = [0, 3, 3, 4, 4, 5, 5]
 
+# The most of an item that `Store_Item.solve_purchase` will buy at once, for items with no limit.
+MAX_PURCHASE_AMOUNT = 2 ** 63
+
 class Store_Item:
     name = "generic_item"
     display_name = "Generic Item" # did you just say "generic excuse"??
@@ -48,6 +54,14 @@ class Store_Item:
     """Whether to show the "The __ shop item is now available." message when this item is bought.
     This can be used to disable it on shop items that have their own version, and shop items where it isn't needed or would be kind of a mess."""
 
+    uses_rng = False
+    """Whether `do_purchase` takes an `rng` argument to draw its random results from.
+    The buy command passes one seeded per purchase, so the purchase can be replayed with `bread.replay`."""
+
+    batch_purchase = False
+    """Whether `do_purchase` can buy any amount of this item at once, paying the price from `get_total_cost`.
+    The buy command then works out how many can be bought with `solve_purchase` instead of buying them one by one."""
+
     @classmethod
     def cost(
             cls,
@@ -113,15 +127,111 @@ class Store_Item:
             amount: int = 1
         ) -> None:
         """Purchases this store item for the given account."""
-        level = user_account.get(cls.name) + 1
-
-        # then we can purchase it
+        # if the total price can be worked out all at once, it can be paid all at once
+        total_cost = cls.get_total_cost(user_account, amount)
+        if total_cost is not None:
+            for cost_type, cost_amount in total_cost.items():
+                user_account.increment(cost_type, -cost_amount)
+            user_account.increment(cls.name, amount)
+            return None
 
-        # this must be a loop as certain items' prices aren't constant; you can't multiply
+        # otherwise this must be a loop as certain items' prices aren't constant; you can't multiply
         # by amount here.
         for i in range(amount):
             user_account.increment("total_dough", -cls.cost(user_account))
-            user_account.increment(cls.name, amount)
+            user_account.increment(cls.name, 1)
+
+    @classmethod
+    def get_total_cost(
+            cls,
+            user_account: account.Bread_Account,
+            amount: int
+        ) -> typing.Optional[dict[str, int]]:
+        """The total cost of buying the given amount of this item at once, as a dict of each item in the cost to the
+        amount of it. Returns None if it can't be worked out without buying them one at a time.
+        Items with prices that change with each level can override this with a closed form."""
+        return None
+
+    @classmethod
+    def get_purchase_limit(
+            cls,
+            user_account: account.Bread_Account
+        ) -> typing.Optional[int]:
+        """How many more of this item the given account is allowed to buy right now, whether or not it can afford
+        them. Returns None if there's no limit."""
+        if not cls.can_be_purchased(user_account):
+            return 0
+
+        max_level = cls.max_level(user_account)
+        if max_level is None:
+            return None
+
+        return max(0, max_level - user_account.get(cls.name))
+
+    @classmethod
+    def count_purchasable_levels(
+            cls,
+            user_account: account.Bread_Account,
+            max_amount: int
+        ) -> int:
+        """Checks `can_be_purchased` for each of the next levels of this item in turn, on a copy of the account at that
+        level, and returns how many levels in a row could be purchased, up to max_amount.
+        This is for items with different requirements at different levels, so it should only be used for ones with a
+        small max level."""
+        level = user_account.get(cls.name)
+        check_account = user_account.get_copy()
+
+        amount = 0
+        while amount < max_amount and cls.can_be_purchased(check_account):
+            amount += 1
+            check_account.set(cls.name, level + amount)
+        
+        return amount
+
+    @classmethod
+    def solve_purchase(
+            cls,
+            user_account: account.Bread_Account,
+            limit: int = None
+        ) -> typing.Optional[tuple[int, dict[str, int]]]:
+        """Finds the most of this item the given account can buy at once, up to `limit` if one is given.
+        Returns the amount and its total cost from `get_total_cost`, or None if the item doesn't have a total cost
+        and has to be bought one at a time."""
+        if cls.get_total_cost(user_account, 0) is None:
+            return None
+
+        high = cls.get_purchase_limit(user_account)
+        if high is None or (limit is not None and limit < high):
+            high = limit
+
+        def affordable(amount: int) -> bool:
+            return is_cost_affordable(user_account, cls.get_total_cost(user_account, amount))
+
+        low = 0
+
+        # With no limit, keep doubling the amount until it's too expensive.
+        if high is None:
+            high = 1
+            while affordable(high):
+                low = high
+                high *= 2
+
+                if high > MAX_PURCHASE_AMOUNT:
+                    high = MAX_PURCHASE_AMOUNT
+                    break
+
+        if affordable(high):
+            low = high
+
+        # `low` can be afforded and `high` can't, so binary search between them.
+        while high - low > 1:
+            middle = (low + high) // 2
+            if affordable(middle):
+                low = middle
+            else:
+                high = middle
+
+        return low, cls.get_total_cost(user_account, low)
 
     @classmethod
     def get_cost_types(
@@ -267,6 +377,37 @@ class Custom_price_item(Store_Item):
 
         return retval
 
+    @classmethod
+    def get_total_cost(
+            cls,
+            user_account: account.Bread_Account,
+            amount: int
+        ) -> typing.Optional[dict[str, int]]:
+        """The total cost of buying the given amount of levels of this item at once, from its cost table."""
+        level = user_account.get(cls.name)
+        table = get_cost_table(cls, user_account)
+
+        if level + amount >= len(table):
+            return None
+
+        before = table[level]
+        after = table[level + amount]
+
+        return {
+            cost_type: total - before.get(cost_type, 0)
+            for cost_type, total in after.items()
+            if total != before.get(cost_type, 0)
+        }
+
+    @classmethod
+    def get_purchase_limit(
+            cls,
+            user_account: account.Bread_Account
+        ) -> int:
+        """How many more levels of this item the given account is allowed to buy right now."""
+        # the requirements can be different for each level, but there aren't many levels
+        return cls.count_purchasable_levels(user_account, cls.max_level(user_account) - user_account.get(cls.name))
+
 # Mixin to be put on dynamic costs where the cost types are not changing.
 class Static_Cost_Mixin():
     @classmethod
@@ -337,6 +478,7 @@ class Daily_rolls(Store_Item):
     name = "max_daily_rolls"
     display_name = "Extra Daily Roll"
     aliases = ["daily roll", "extra roll"]
+    batch_purchase = True
 
     @classmethod
     def cost(cls, user_account: account.Bread_Account) -> int:
@@ -349,14 +491,29 @@ class Daily_rolls(Store_Item):
         adjusted_cost = naive_cost - (level_discount_card * 4)
         if level < 10:
             return 0
-        elif level == 11:
-            return 32
-        elif level == 12:
-            return 64
-        elif level == 13:
-            return 96
+        elif level in daily_rolls_introductory_prices:
+            return daily_rolls_introductory_prices[level]
         return adjusted_cost
 
+    @classmethod
+    def get_total_cost(cls, user_account: account.Bread_Account, amount: int) -> dict[str, int]:
+        first_level = user_account.get(cls.name) + 1
+        last_level = first_level + amount - 1
+        adjusted_cost = 128 - (user_account.get("max_daily_rolls_discount") * 4)
+
+        # levels below 10 are free, the introductory ones have their own prices, and the rest cost the same
+        total = sum(
+            price
+            for level, price in daily_rolls_introductory_prices.items()
+            if first_level <= level <= last_level
+        )
+
+        full_price_levels = max(0, last_level - max(first_level, 14) + 1)
+        if first_level <= 10 <= last_level:
+            full_price_levels += 1
+
+        return {"total_dough": total + full_price_levels * adjusted_cost}
+
     @classmethod
     def description(cls, user_account: account.Bread_Account) -> str:
         level = user_account.get(cls.name) + 1
@@ -372,20 +529,24 @@ class Daily_rolls(Store_Item):
         return 1000 + user_account.get_prestige_level() * 100
 
     @classmethod
-    def do_purchase(cls, user_account: account.Bread_Account):
-        super().do_purchase(user_account)
+    def do_purchase(cls, user_account: account.Bread_Account, amount: int = 1):
+        first_level = user_account.get(cls.name) + 1
+        super().do_purchase(user_account, amount)
         level = user_account.get(cls.name)
         prestige_level = user_account.get_prestige_level()
         if prestige_level >= 1:
             token_text = values.ascension_token.text
-            if level in ascension_token_levels:
-                user_account.increment(token_text, 1)
-                return f"In addition to buying a daily roll, you have acquired **1 {token_text}**! You now have **{user_account.get(token_text)} {token_text}**."
+            tokens = len([token_level for token_level in ascension_token_levels if first_level <= token_level <= level])
+            if tokens > 0:
+                user_account.increment(token_text, tokens)
+                bought = "a daily roll" if amount == 1 else utility.write_count(amount, "daily roll")
+                return f"In addition to buying {bought}, you have acquired **{tokens} {token_text}**! You now have **{user_account.get(token_text)} {token_text}**."
 
 class Loaf_Converter(Store_Item):
     name = "loaf_converter"
     display_name = "Loaf Converter"
     aliases = ["lc"]
+    batch_purchase = True
 
     @classmethod
     def cost(cls, user_account: account.Bread_Account) -> int:
@@ -401,6 +562,24 @@ class Loaf_Converter(Store_Item):
             
         return int(combined_cost)
 
+    @classmethod
+    def get_total_cost(cls, user_account: account.Bread_Account, amount: int) -> dict[str, int]:
+        first_level = user_account.get(cls.name) + 1
+        discounted_cost = 256 - (user_account.get("loaf_converter_discount") * 12)
+
+        # the ephemeral upgrades change the price by a tenth, rounded down like in `cost`
+        tenths = 10
+        if user_account.get_ephemeral_upgrade(Spirit.name):
+            tenths = 9
+        elif user_account.get_ephemeral_upgrade(Opportunity.name):
+            tenths = 11
+
+        # sum of (level * discounted_cost * tenths) // 10 over the levels being bought
+        step = discounted_cost * tenths
+        total = utility.floor_sum(amount, 10, step, first_level * step)
+
+        return {"total_dough": total}
+
     @classmethod
     def description(cls, user_account: account.Bread_Account) -> str:
         level = user_account.get(cls.name) + 1  
@@ -452,6 +631,7 @@ class Embiggener(Store_Item):
 class Multiroller(Store_Item):
     name = "multiroller"
     display_name = "Multiroller"
+    batch_purchase = True
 
     # this item rolls bread multiple times for each command sent
 
@@ -467,6 +647,21 @@ class Multiroller(Store_Item):
             #naive_cost = (max(0, level-1) * 256)
         #return naive_cost
 
+    @classmethod
+    def get_total_cost(cls, user_account: account.Bread_Account, amount: int) -> dict[str, int]:
+        first_level = user_account.get(cls.name) + 1
+
+        total = 256 * amount
+        if first_level <= 1 < first_level + amount:
+            total -= 128
+
+        return {"total_dough": total}
+
+    @classmethod
+    def get_purchase_limit(cls, user_account: account.Bread_Account) -> int:
+        # levels 5 to 10 need compound rollers, so each level has to be checked
+        return cls.count_purchasable_levels(user_account, cls.max_level(user_account) - user_account.get(cls.name))
+
     @classmethod
     def description(cls, user_account: account.Bread_Account) -> str:
         level = user_account.get(cls.name) + 1
@@ -513,6 +708,7 @@ class Compound_Roller(Store_Item):
 
     name = "compound_roller"
     display_name = "Compound Roller"
+    batch_purchase = True
 
     @classmethod
     def cost(cls, user_account: account.Bread_Account, level:int = None) -> int:
@@ -520,6 +716,14 @@ class Compound_Roller(Store_Item):
             level = user_account.get(cls.name) + 1
         return 128
 
+    @classmethod
+    def get_total_cost(cls, user_account: account.Bread_Account, amount: int) -> dict[str, int]:
+        return {"total_dough": 128 * amount}
+
+    @classmethod
+    def get_purchase_limit(cls, user_account: account.Bread_Account) -> int:
+        return max(0, min(user_account.get("multiroller"), cls.max_level(user_account)) - user_account.get(cls.name))
+
     @classmethod
     def description(cls, user_account: account.Bread_Account) -> str:
         level = user_account.get(cls.name) + 1
@@ -543,6 +747,7 @@ class Compound_Roller(Store_Item):
 class Random_Chess_Piece(Store_Item):
     name = "random_chess_piece"
     display_name = "Random Chess Piece"
+    uses_rng = True
 
     @classmethod
     def cost(cls, user_account: account.Bread_Account) -> int:
@@ -585,7 +790,12 @@ class Random_Chess_Piece(Store_Item):
         return super().can_be_purchased(user_account)
 
     @classmethod
-    def do_purchase(cls, user_account: account.Bread_Account, amount: int = 1):
+    def do_purchase(
+            cls,
+            user_account: account.Bread_Account,
+            amount: int = 1,
+            rng: random.Random = random
+        ):
         # subtract cost
         user_account.increment("total_dough", -cls.cost(user_account) * amount)
 
@@ -593,65 +803,39 @@ class Random_Chess_Piece(Store_Item):
 
         # increase count
         #user_account.increment("chess_pieces", 1)
-        full_chess_set = values.chess_pieces_black_biased + values.chess_pieces_white_biased
+        full_chess_set = utility.Multiset.from_list(values.chess_pieces_black_biased + values.chess_pieces_white_biased)
 
-        purchased_pieces = dict()
-        for chess_piece in values.all_chess_pieces:
-            purchased_pieces[chess_piece.text] = 0
+        purchased_pieces = utility.Multiset()
 
         # first we deal with full chess sets
         if amount > 32:
             chess_sets = amount // 32
-            for piece in full_chess_set:
-                user_account.add_item_attributes(piece, amount=chess_sets)
-                purchased_pieces[piece.text] += chess_sets
+            purchased_pieces += full_chess_set * chess_sets
             amount -= chess_sets * 32
 
         #then any remaining pieces afterward
-        
-        #first build a dict of all the pieces the user has
-        user_chess_pieces = dict()
-        for chess_piece in values.all_chess_pieces:
-            user_chess_pieces[chess_piece.text] = user_account.get(chess_piece.text)
 
-        # then build a dict for the pieces of a default chess set
-        default_chess_pieces = dict()
-        for chess_piece in full_chess_set:
-            default_chess_pieces[chess_piece.text] = default_chess_pieces.get(chess_piece.text, 0) + 1
+        # the pieces of a default chess set that the user doesn't have yet, which are bought first
+        unfound_pieces = full_chess_set - (user_account.get_items_counted("chess_pieces") + purchased_pieces)
+        missing_pieces = unfound_pieces.sample_without_replacement(amount, rng)
+        purchased_pieces += missing_pieces
+        amount -= missing_pieces.total()
 
-        # then subtract the user's pieces from the default set
-        unfound_pieces = utility.dict_subtract(default_chess_pieces, user_chess_pieces)
+        # now we have all our missing pieces, so buy random chess pieces
+        purchased_pieces += full_chess_set.sample(amount, rng)
 
-        # convert unfound pieces to an array
-        unfound_pieces_array = list()
-        for piece_text in unfound_pieces:
-            unfound_pieces_array.extend([piece_text] * unfound_pieces[piece_text])
-
-        # otherwise we are missing pieces and we need to buy them
-        while amount > 0:
-            if len(unfound_pieces_array) > 0:
-                piece_text = random.choice(unfound_pieces_array)
-                piece_emote = values.get_emote(piece_text)
-                user_account.add_item_attributes(piece_emote)
-                purchased_pieces[piece_text] += 1
-                unfound_pieces_array.remove(piece_text)
-                amount -= 1
-            else:
-                # now we have all our missing pieces, so buy random chess pieces
-                piece = random.choice(full_chess_set)
-                piece_text = piece.text
-                user_account.add_item_attributes(piece)
-                purchased_pieces[piece.text] += 1
-                amount -= 1
+        for piece, count in purchased_pieces:
+            user_account.add_item_attributes(piece, amount=count)
 
         out_str = ''
         if original_amount == 1:
-            out_str = f'Congratulations! You have purchased a {piece_text}!'
+            piece, _ = next(iter(purchased_pieces))
+            out_str = f'Congratulations! You have purchased a {piece.text}!'
         else:
             out_str = "Congratulations! You have purchased the following chess pieces:\n"
-            for piece in purchased_pieces:
-                if purchased_pieces[piece] > 0:
-                    out_str += f'{piece}: {purchased_pieces[piece]} \n'
+            for piece in values.all_chess_pieces:
+                if purchased_pieces.count(piece) > 0:
+                    out_str += f'{piece.text}: {purchased_pieces.count(piece)} \n'
 
         user_account.increment("random_chess_piece_bought", original_amount)
 
@@ -766,6 +950,7 @@ class Random_Special_Bread(Store_Item):
 class Special_Bread_Pack(Store_Item):
     name = "special_bread_pack"
     display_name = "Special Bread Pack"
+    uses_rng = True
 
     @classmethod
     def cost(cls, user_account: account.Bread_Account) -> int:
@@ -797,7 +982,12 @@ class Special_Bread_Pack(Store_Item):
         return super().can_be_purchased(user_account)
 
     @classmethod
-    def do_purchase(cls, user_account: account.Bread_Account, amount = 1):
+    def do_purchase(
+            cls,
+            user_account: account.Bread_Account,
+            amount = 1,
+            rng: random.Random = random
+        ):
         # subtract cost
         # can just do * amount bc the price doesn't change.
         user_account.increment("total_dough", -cls.cost(user_account) * amount)
@@ -805,53 +995,13 @@ class Special_Bread_Pack(Store_Item):
         count = 100 * amount
         bread_distribution = values.all_special_breads * 3 + values.all_rare_breads
 
-        # this might allow you to see special bread pack changes in full when buying multiple?
-
-                # bought_bread = rng.choice(bread_distribution, count)
-        # for item in set(bread_distribution):
-            #  user_account.add_item_attributes(item, amount=bought_bread.count(item))
-
-        # output = f"Congratulations! You got the following {count} special breads:\n"
-        # for item in set(bread_distribution):
-        #     item_text = item.text
-        #     if item_text in bought_bread:
-        #         #output += f"{all_purchased_items[item_text]} {item_text}\n"
-        #         output += f"{item_text} : +{bought_bread.count(item)}, -> {user_account.get(item_text)}\n"
-
-        # previous code
-        if count < 10000:
-            bought_bread_dict = dict()
-            for bread in bread_distribution:
-                bought_bread_dict[bread.text] = 0
-            for i in range(count):
-                bread = random.choice(bread_distribution)
-                bought_bread_dict[bread.text] += 1
-        else:
-            #step 1: create array of random numbers on a bell curve
-            pre_normalized_array = np.random.default_rng().normal(.5,.1, len(bread_distribution))
-            # make sure that the array contains numbers only between 0 and 1
-            for i in range(len(pre_normalized_array)):
-                pre_normalized_array[i] = max(0, pre_normalized_array[i])
-                pre_normalized_array[i] = min(1, pre_normalized_array[i])
-            # step 2: normalize array to the total count
-            normalized_array = utility.normalize_array_to_ints(pre_normalized_array, count)
-            # step 3: go through array and make sure the total is equal to the count
-            while sum(normalized_array) != count:
-                if sum(normalized_array) > count:
-                    normalized_array[np.random.randint(0, len(normalized_array))] -= 1
-                else:
-                    normalized_array[np.random.randint(0, len(normalized_array))] += 1
-            # we now have an array of which breads to get for the entire pack
-            # now we just need to convert it to a dict
-            bought_bread_dict = dict()
-            for bread in values.all_special_breads+values.all_rare_breads:
-                bought_bread_dict[bread.text] = 0
-            for i in range(len(bread_distribution)):
-                bought_bread_dict[bread_distribution[i].text] += normalized_array[i]
-
+        # every bread in the pack is drawn from the distribution, all at once
+        bought_breads = utility.Multiset.from_list(bread_distribution).sample(count, rng)
 
         # add the breads to our account
+        bought_bread_dict = dict()
         for bread_type in values.all_special_breads+values.all_rare_breads:
+            bought_bread_dict[bread_type.text] = bought_breads.count(bread_type)
             user_account.add_item_attributes(bread_type, amount=bought_bread_dict[bread_type.text])
 
         sn = utility.smart_number
@@ -877,6 +1027,10 @@ class Extra_Gamble(Store_Item):
     def cost(cls, user_account: account.Bread_Account) -> int:
         return 25
 
+    @classmethod
+    def get_total_cost(cls, user_account: account.Bread_Account, amount: int) -> dict[str, int]:
+        return {"total_dough": cls.cost(user_account) * amount}
+
     @classmethod
     def description(cls, user_account: account.Bread_Account) -> str:
         return "Five extra rolls of the dice, just this once."
@@ -2298,6 +2452,11 @@ class Gambit_shop_Item(Custom_price_item):
     def get_account_level(cls, user_account: account.Bread_Account) -> int:
         return round(user_account.get_dough_boost_for_item(cls.boost_item) / cls.boost_amount)
 
+    @classmethod
+    def get_total_cost(cls, user_account: account.Bread_Account, amount: int) -> None:
+        # the level is kept in the dough boosts rather than under the item's name, so the cost table can't be used
+        return None
+
     @classmethod
     def do_purchase(cls, user_account: account.Bread_Account):
         cost = cls.cost(user_account)
@@ -3336,3 +3495,201 @@ def find_catalyst(
     return None
 
 all_store_items = prestige_store_items + normal_store_items + gambit_shop_items + space_shop_items + all_salvage_shop_items + all_ephemeral_upgrades + all_catalysts
+
+####################################################################################################################
+##### AVAILABILITY.
+
+MISSING_VALUE = object() # Stands in for the value of stats an account doesn't have.
+
+class Availability_Tracker:
+    """Which store items a player can purchase, kept up to date without checking every item again each time.
+
+    The first time an item is checked, the account stats its `can_be_purchased` reads are traced. When the account is
+    given again later, only the items that read a stat that has changed since are checked again. Items that read
+    something that can't be traced, like the inventory index or the map, are checked every time.
+
+    For this to work `can_be_purchased` has to read the account through its methods rather than `values` directly,
+    and can't depend on anything besides the account other than through those methods."""
+
+    def __init__(self: typing.Self) -> None:
+        self.buyable = dict() # item -> whether it can be purchased, for items that are up to date
+        self.reads = dict() # item -> the keys it read when it was last checked
+        self.readers = dict() # key -> set of the items that read it
+        self.untraced = set() # items that read something that can't be traced, so are always checked
+        self.snapshot = dict() # key -> copy of its value when the items that read it were last checked
+        self.checks = 0
+
+    def forget(
+            self: typing.Self,
+            item: type[Store_Item]
+        ) -> None:
+        """Marks an item as needing to be checked again."""
+        self.buyable.pop(item, None)
+        self.untraced.discard(item)
+
+        for key in self.reads.pop(item, ()):
+            self.readers[key].discard(item)
+
+    def update(
+            self: typing.Self,
+            user_account: account.Bread_Account
+        ) -> None:
+        """Forgets every item that read a stat that's different in the given account."""
+        changed = [
+            key
+            for key, value in self.snapshot.items()
+            if user_account.values.get(key, MISSING_VALUE) != value
+        ]
+
+        for key in changed:
+            self.snapshot[key] = copy_value(user_account.values.get(key, MISSING_VALUE))
+            for item in list(self.readers.get(key, ())):
+                self.forget(item)
+
+        for item in list(self.untraced):
+            self.forget(item)
+
+    def can_be_purchased(
+            self: typing.Self,
+            item: type[Store_Item],
+            user_account: account.Bread_Account
+        ) -> bool:
+        """Returns the result of the item's `can_be_purchased`, checking it only if it isn't up to date.
+        `update` has to have been called with the same account first."""
+        if item in self.buyable:
+            return self.buyable[item]
+
+        self.checks += 1
+        result, reads = user_account.trace_reads(item.can_be_purchased, user_account)
+
+        if None in reads:
+            self.untraced.add(item)
+            reads.discard(None)
+
+        self.reads[item] = reads
+        for key in reads:
+            self.readers.setdefault(key, set()).add(item)
+            if key not in self.snapshot:
+                self.snapshot[key] = copy_value(user_account.values.get(key, MISSING_VALUE))
+
+        self.buyable[item] = result
+        return result
+
+class Availability_Cache:
+    """The availability tracker of each player, so checking which items can be purchased before and after a command,
+    or from one command to the next, only checks the items that were affected by what happened in between."""
+
+    def __init__(
+            self: typing.Self,
+            max_players: int = 1000
+        ) -> None:
+        self.trackers = dict() # (guild id, user id) -> Availability_Tracker, least recently used first
+        self.max_players = max_players
+
+    def get_buyable_items(
+            self: typing.Self,
+            user_account: account.Bread_Account,
+            item_list: list[type[Store_Item]]
+        ) -> list[type[Store_Item]]:
+        """Returns a list of every item in item_list that can be purchased by the given account."""
+        cache_key = (str(user_account.get("guild_id")), str(user_account.user_id))
+
+        tracker = self.trackers.pop(cache_key, None)
+        if tracker is None:
+            tracker = Availability_Tracker()
+        self.trackers[cache_key] = tracker
+
+        if len(self.trackers) > self.max_players:
+            del self.trackers[next(iter(self.trackers))]
+
+        tracker.update(user_account)
+        return [item for item in item_list if tracker.can_be_purchased(item, user_account)]
+
+    def invalidate(
+            self: typing.Self,
+            guild: typing.Union[int, str] = None,
+            user_id: typing.Union[int, str] = None
+        ) -> int:
+        """Forgets the trackers of the given guild and/or user, or every tracker if neither is given.
+        Returns the amount of trackers forgotten."""
+        remove = [
+            cache_key
+            for cache_key in self.trackers
+            if (guild is None or cache_key[0] == str(guild)) and (user_id is None or cache_key[1] == str(user_id))
+        ]
+        for cache_key in remove:
+            del self.trackers[cache_key]
+        
+        return len(remove)
+
+shop_availability = Availability_Cache()
+
+def copy_value(value: typing.Any) -> typing.Any:
+    """Returns a copy of an account value that won't change if the value is changed in place."""
+    if isinstance(value, (dict, list, set)):
+        return copy.deepcopy(value)
+    
+    return value
+
+####################################################################################################################
+##### BUYING IN BULK.
+
+COST_TABLES_PER_ITEM = 16 # How many cost tables to keep for each item, for different values of the stats they read.
+
+cost_tables = dict() # item -> list of (the stats read and their values, cost table), most recently built last
+
+def is_cost_affordable(
+        user_account: account.Bread_Account,
+        cost: dict[str, int]
+    ) -> bool:
+    """Returns a boolean for whether the given account has everything in a cost from `Store_Item.get_total_cost`."""
+    for cost_type, amount in cost.items():
+        if user_account.get(cost_type) < amount:
+            return False
+    
+    return True
+
+def get_cost_table(
+        item: type[Custom_price_item],
+        user_account: account.Bread_Account
+    ) -> list[dict[str, int]]:
+    """Returns the running total of the cost of every level of the given item, as a list where the entry at each level
+    is the total cost of going from level 0 to it. The cost of going from level a to level b is then the entry for b
+    minus the entry for a, so the most levels that can be afforded can be binary searched.
+
+    Tables are built on a copy of the account at each level, and are kept for as long as the stats their costs read,
+    besides the item's own level, stay the same. For most items that's none, so one table is shared by everyone."""
+    for reads, table in cost_tables.get(item, ()):
+        if all(user_account.values.get(key, MISSING_VALUE) == value for key, value in reads.items()):
+            return table
+
+    check_account = user_account.get_copy()
+    table, reads = check_account.trace_reads(build_cost_table, item, check_account)
+
+    if None not in reads:
+        reads.discard(item.name)
+        reads = {key: copy_value(user_account.values.get(key, MISSING_VALUE)) for key in reads}
+
+        item_tables = cost_tables.setdefault(item, [])
+        item_tables.append((reads, table))
+        if len(item_tables) > COST_TABLES_PER_ITEM:
+            del item_tables[0]
+
+    return table
+
+def build_cost_table(
+        item: type[Custom_price_item],
+        check_account: account.Bread_Account
+    ) -> list[dict[str, int]]:
+    """Builds the table for `get_cost_table` on the given copy of an account, changing the item's level in it."""
+    table = [dict()]
+
+    for level in range(item.max_level(check_account)):
+        check_account.set(item.name, level)
+
+        total = table[-1].copy()
+        for cost_type, amount in item.cost(check_account):
+            total[cost_type] = total.get(cost_type, 0) + amount
+        table.append(total)
+
+    return table
@@ -0,0 +1,312 @@
+"""A single loop that ticks every gambling game in progress, instead of every gamble and salvage sleeping in a loop.
+
+Commands hand their games to `Game_Ticker.play` once they've been set up, and wait for it to return when the games
+are over. The ticker keeps one task for all of them, which sleeps until the next game is due and then ticks every game
+that's due at about the same time together, so games running side by side share a clock.
+
+Every tick edits the game's message, so the edits in each channel are kept to Discord's rate limit with a bucket of
+`rate_limit` edits per `rate_period` seconds. Games that are due when their channel has used up its bucket wait for
+room instead of making Discord hold the edit back.
+
+The ticker is kept on the bot, and a reloaded cog adopts the games of the previous ticker, so games in progress carry
+on through an extension reload instead of being stuck with a lock held.
+
+How late ticks run compared to when they were due (the jitter) is kept as metrics, shown by `$bread admin games`.
+"""
+from __future__ import annotations
+
+import typing
+import asyncio
+import collections
+import traceback
+import time
+
+from discord.ext import commands
+
+if typing.TYPE_CHECKING:
+    import bread.gamble as gamble
+
+class Playing:
+    """Games being played together, which take turns ticking. Usually this is just one game."""
+
+    def __init__(
+            self: typing.Self,
+            ticker: Game_Ticker,
+            games: list[gamble.Game],
+            due: float
+        ) -> None:
+        self.ticker = ticker # The ticker these games are being played on.
+        self.games = games
+        self.channel_id = games[0].ctx.channel.id
+        self.tick_length = games[0].tick_length
+        self.due = due # time.monotonic() of when the next tick should happen.
+        self.turn = 0 # How many ticks have happened, to know whose turn it is.
+        self.ticking = False # Whether a tick is currently running.
+        self.future = asyncio.get_running_loop().create_future() # Resolved when every game is over.
+
+    def get_next_game(self: typing.Self) -> typing.Optional[gamble.Game]:
+        """Returns the game whose turn it is to tick, or None if they're all over."""
+        options = [game for game in self.games if game.in_progress]
+
+        if len(options) == 0:
+            return None
+
+        return options[self.turn % len(options)]
+
+class Game_Ticker:
+    """Ticks every game in progress from one task, keeping the edits in each channel within the rate limit."""
+
+    def __init__(
+            self: typing.Self,
+            rate_limit: int = 5,
+            rate_period: float = 5.0,
+            resolution: float = 0.1
+        ) -> None:
+        self.rate_limit = rate_limit # Edits that can be made in a channel in `rate_period` seconds.
+        self.rate_period = rate_period
+        self.resolution = resolution # Games due within this many seconds of each other are ticked together.
+
+        # Called with the context and the error when a tick fails. Errors are printed if this is None.
+        self.error_handler: typing.Optional[typing.Callable[[commands.Context, Exception], typing.Awaitable]] = None
+
+        self.playing = [] # type: list[Playing]
+        self.edit_times = dict() # channel id -> deque of time.monotonic() of the most recent edits
+        self.task = None # The ticking task, or None if nothing is being played.
+        self.ticks = set() # Tasks of the ticks currently running.
+        self.wakeup = None # Event set to wake the task early when games are added.
+        self.retired = False # Whether the games have been handed over to another ticker.
+        self.reset_metrics()
+
+    def reset_metrics(self: typing.Self) -> None:
+        """Resets the metrics."""
+        self.metrics = {
+            "started": 0, # Groups of games handed to `play`.
+            "finished": 0,
+            "ticks": 0,
+            "failed": 0, # Ticks that raised an error, which ends that game.
+            "deferred": 0, # Ticks that had to wait for their channel's rate limit.
+            "batches": 0, # Times the task woke up and ticked something.
+            "total_jitter": 0.0, # Seconds between when ticks were due and when they ran, over every tick.
+            "max_jitter": 0.0,
+            "max_playing": 0, # The most groups of games that have been in progress at once.
+        }
+
+    async def play(
+            self: typing.Self,
+            *games: gamble.Game,
+            delay: float = 2.0
+        ) -> None:
+        """Ticks the given games, which should already be set up, until they're all over. When there's more than one
+        game they take turns, so they tick once each `tick_length` between them.
+        The first tick is `delay` seconds from now. Games that fail to tick are ended and the error is reported, so
+        this doesn't raise, and the games should be finished by the caller afterwards like normal."""
+        games = [game for game in games if game.in_progress]
+        if len(games) == 0:
+            return
+
+        playing = Playing(self, games, time.monotonic() + delay)
+        self.add(playing)
+
+        self.metrics["started"] += 1
+
+        await asyncio.shield(playing.future)
+
+    def add(
+            self: typing.Self,
+            playing: Playing
+        ) -> None:
+        """Adds games to be ticked, and starts the task if it isn't running."""
+        playing.ticker = self
+        self.playing.append(playing)
+        self.metrics["max_playing"] = max(self.metrics["max_playing"], len(self.playing))
+
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        else:
+            self.wakeup.set()
+
+    def adopt(
+            self: typing.Self,
+            other: Game_Ticker
+        ) -> None:
+        """Takes over every game being played by another ticker, like the one from before the cog was reloaded."""
+        if other is None or other is self:
+            return
+
+        other.retired = True
+        if other.wakeup is not None:
+            other.wakeup.set()
+
+        playing, other.playing = other.playing, []
+
+        for channel_id, times in other.edit_times.items():
+            self.edit_times.setdefault(channel_id, times)
+
+        for entry in playing:
+            self.add(entry)
+
+    def get_depth(self: typing.Self) -> int:
+        """Returns how many games are in progress."""
+        return sum(len(playing.games) for playing in self.playing)
+
+    def get_rate_wait(
+            self: typing.Self,
+            channel_id: int,
+            now: float
+        ) -> float:
+        """Returns how many seconds until another edit can be made in the given channel."""
+        times = self.edit_times.get(channel_id)
+        if times is None or len(times) < self.rate_limit:
+            return 0.0
+
+        return max(times[0] + self.rate_period - now, 0.0)
+
+    def record_edit(
+            self: typing.Self,
+            channel_id: int,
+            now: float
+        ) -> None:
+        """Notes that an edit is being made in the given channel."""
+        times = self.edit_times.get(channel_id)
+        if times is None:
+            times = collections.deque(maxlen=self.rate_limit)
+            self.edit_times[channel_id] = times
+
+        times.append(now)
+
+    async def tick(
+            self: typing.Self,
+            playing: Playing,
+            now: float
+        ) -> None:
+        """Ticks the game whose turn it is, and schedules the next tick.
+        The games may have been adopted by another ticker by the time this is done, so that's the one told about it."""
+        game = playing.get_next_game()
+
+        if game is not None:
+            jitter = now - playing.due
+            self.metrics["ticks"] += 1
+            self.metrics["total_jitter"] += jitter
+            self.metrics["max_jitter"] = max(self.metrics["max_jitter"], jitter)
+
+            try:
+                await game.run_tick()
+            except Exception as error:
+                # A game that can't tick can't carry on, so it's ended here and left for the caller to finish.
+                game.in_progress = False
+                self.metrics["failed"] += 1
+
+                if self.error_handler is None:
+                    traceback.print_exception(error)
+                else:
+                    try:
+                        await self.error_handler(game.ctx, error)
+                    except Exception as handler_error:
+                        traceback.print_exception(handler_error)
+
+        playing.turn += 1
+        # Keep to the original schedule, unless it's fallen so far behind that it would have to catch up.
+        playing.due = max(playing.due + playing.tick_length, time.monotonic())
+        playing.ticking = False
+
+        owner = playing.ticker
+
+        if playing.get_next_game() is None:
+            if playing in owner.playing:
+                owner.playing.remove(playing)
+
+            owner.metrics["finished"] += 1
+
+            if not playing.future.done():
+                playing.future.set_result(None)
+
+        if owner.wakeup is not None:
+            owner.wakeup.set()
+
+    async def run(self: typing.Self) -> None:
+        """Ticks games as they become due until there are none left."""
+        try:
+            while len(self.playing) > 0 and not self.retired:
+                now = time.monotonic()
+
+                batch = []
+                channel_counts = collections.Counter()
+                next_due = now + self.rate_period
+
+                for playing in self.playing:
+                    if playing.ticking:
+                        continue
+
+                    due = playing.due
+                    if due <= now + self.resolution:
+                        # Only as many games in a channel as it has room for in its bucket.
+                        channel_id = playing.channel_id
+                        times = self.edit_times.get(channel_id)
+                        used = 0 if times is None else len([t for t in times if t > now - self.rate_period])
+
+                        if used + channel_counts[channel_id] < self.rate_limit:
+                            channel_counts[channel_id] += 1
+                            batch.append(playing)
+                            continue
+
+                        # The channel is full, so this waits until the oldest edit is out of the period.
+                        self.metrics["deferred"] += 1
+                        due = now + self.get_rate_wait(channel_id, now)
+                        playing.due = due
+
+                    next_due = min(next_due, due)
+
+                if len(batch) > 0:
+                    self.metrics["batches"] += 1
+
+                    # Each tick runs on its own, so a slow edit in one channel doesn't hold up the others.
+                    # Finishing a tick wakes this up again to schedule the next one.
+                    for playing in batch:
+                        playing.ticking = True
+                        self.record_edit(playing.channel_id, now)
+
+                        task = asyncio.create_task(self.tick(playing, now))
+                        self.ticks.add(task)
+                        task.add_done_callback(self.ticks.discard)
+
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), max(next_due - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.task = None
+
+            # Channels that haven't had an edit in a while don't need to be kept around.
+            now = time.monotonic()
+            for channel_id in [
+                    channel_id
+                    for channel_id, times in self.edit_times.items()
+                    if len(times) == 0 or now - times[-1] >= self.rate_period
+                ]:
+                del self.edit_times[channel_id]
+
+            # If this was cancelled without handing the games over, don't leave their commands waiting forever.
+            if not self.retired:
+                for playing in self.playing:
+                    for game in playing.games:
+                        game.in_progress = False
+
+                    if not playing.future.done():
+                        playing.future.set_result(None)
+
+                self.playing = []
+
+    def describe(self: typing.Self) -> str:
+        """Returns a description of the games in progress and the metrics."""
+        metrics = self.metrics
+        average_jitter = metrics["total_jitter"] / metrics["ticks"] if metrics["ticks"] > 0 else 0.0
+        channels = len({playing.channel_id for playing in self.playing})
+
+        return "\n".join([
+            f"Playing: {self.get_depth()} games in {channels} channels, most at once: {metrics['max_playing']}",
+            f"Started: {metrics['started']}, finished: {metrics['finished']}",
+            f"Ticks: {metrics['ticks']} in {metrics['batches']} batches, failed: {metrics['failed']}, deferred: {metrics['deferred']}",
+            f"Average jitter: {average_jitter * 1000:.0f}ms, worst jitter: {metrics['max_jitter'] * 1000:.0f}ms",
+        ])
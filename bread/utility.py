@@ -1,6 +1,9 @@
+from __future__ import annotations
+
 import random
 import math
 import typing
+import numpy as np
 import discord
 import hashlib
 import copy
@@ -84,22 +87,16 @@ def array_subtract(
         array1: list,
         array2: list
     ) -> list:
-    """Subtracts one list from another by returning all the items in array1 that are not in array2."""
-    #return [x for x in array1 if x not in array2]
+    """Subtracts one list from another by returning all the items in array1 that are not in array2.
+    Duplicate members are only removed one at a time, so [a, a, b] minus [a] is [a, b].
+    For amounts of items that are too big to put in a list, use `Multiset` instead."""
+    to_remove = Multiset.from_list(array2)
     output = list()
-    output.extend(array1)
-    #print(f"Array subtract: subtracting {array2} from {array1}")
-    #print(f"output: {output}")
-    for obj in array2:
-    #for i in range(len(array2)):
-        
-        #object = array2[i]
-        #print(f"Object {i} is {object}")
-        if obj in output:
-            #print(f"Object {i} is in output")
-            output.remove(obj)
-            #print(f"Removing. Output is now {output}")
-            #this is subtly different, but it means that duplicate members are only removed one at a time
+    for obj in array1:
+        if to_remove.count(obj) > 0:
+            to_remove.discard(obj)
+        else:
+            output.append(obj)
     return output
 
 def dict_subtract(
@@ -118,6 +115,212 @@ def dict_subtract(
     return output
 
 
+class Multiset:
+    """A collection of items with an amount of each, like a player's chess pieces.
+    
+    Amounts are never expanded into one entry per item, so this works just as well with a million of something as
+    with one. Only positive amounts are kept. Iterating gives `(item, amount)` pairs, in the order the items were
+    first added."""
+
+    def __init__(
+            self: typing.Self,
+            counts: typing.Union[dict, typing.Iterable[tuple[typing.Hashable, int]], None] = None
+        ) -> None:
+        """Makes a multiset from a dict of item -> amount or from `(item, amount)` pairs."""
+        self.counts = dict()
+        self._total = 0
+
+        if counts is None:
+            return
+        
+        if isinstance(counts, dict):
+            counts = counts.items()
+
+        for item, amount in counts:
+            self.add(item, amount)
+
+    @classmethod
+    def from_list(
+            cls: type[Multiset],
+            items: typing.Iterable[typing.Hashable]
+        ) -> Multiset:
+        """Makes a multiset with each item in the given list once per time it appears."""
+        output = cls()
+        for item in items:
+            output.add(item)
+        return output
+
+    def __iter__(self: typing.Self) -> typing.Iterator[tuple[typing.Hashable, int]]:
+        return iter(list(self.counts.items()))
+
+    def __len__(self: typing.Self) -> int:
+        """The amount of different items."""
+        return len(self.counts)
+
+    def __bool__(self: typing.Self) -> bool:
+        return self._total > 0
+
+    def __contains__(self: typing.Self, item: typing.Hashable) -> bool:
+        return item in self.counts
+
+    def __eq__(self: typing.Self, other: object) -> bool:
+        if not isinstance(other, Multiset):
+            return NotImplemented
+        return self.counts == other.counts
+
+    def __repr__(self: typing.Self) -> str:
+        return f"Multiset({self.counts!r})"
+
+    def copy(self: typing.Self) -> Multiset:
+        """Returns a copy of this multiset."""
+        return Multiset(self.counts)
+
+    def count(
+            self: typing.Self,
+            item: typing.Hashable
+        ) -> int:
+        """Returns the amount of the given item."""
+        return self.counts.get(item, 0)
+
+    def total(self: typing.Self) -> int:
+        """Returns the amount of items, counting every copy."""
+        return self._total
+
+    def add(
+            self: typing.Self,
+            item: typing.Hashable,
+            amount: int = 1
+        ) -> None:
+        """Adds an amount of the given item. Adding a negative amount removes it instead."""
+        if amount < 0:
+            self.discard(item, -amount)
+            return
+        
+        if amount == 0:
+            return
+        
+        self.counts[item] = self.counts.get(item, 0) + amount
+        self._total += amount
+
+    def discard(
+            self: typing.Self,
+            item: typing.Hashable,
+            amount: int = 1
+        ) -> int:
+        """Removes up to the given amount of the given item, and returns how many were removed."""
+        current = self.counts.get(item, 0)
+        removed = min(current, max(amount, 0))
+        if removed == 0:
+            return 0
+        
+        if removed == current:
+            del self.counts[item]
+        else:
+            self.counts[item] = current - removed
+
+        self._total -= removed
+        return removed
+
+    def choice(
+            self: typing.Self,
+            rng: random.Random = random
+        ) -> typing.Hashable:
+        """Picks a random item, weighted by the amounts.
+        This gives the same odds as `random.choice` on a list with every copy of every item in it."""
+        if self._total <= 0:
+            raise IndexError("Cannot choose from an empty multiset")
+        
+        position = rng.randrange(self._total)
+        for item, amount in self.counts.items():
+            if position < amount:
+                return item
+            position -= amount
+
+    def pop_random(
+            self: typing.Self,
+            rng: random.Random = random
+        ) -> typing.Hashable:
+        """Removes one random item, weighted by the amounts, and returns it."""
+        item = self.choice(rng)
+        self.discard(item)
+        return item
+
+    def sample(
+            self: typing.Self,
+            amount: int,
+            rng: random.Random = random
+        ) -> Multiset:
+        """Draws the given amount of items with replacement, weighted by the amounts, and returns what was drawn.
+        This gives the same odds as calling `choice` that many times, but takes as long for a billion as for one."""
+        if amount <= 0:
+            return Multiset()
+
+        if self._total <= 0:
+            raise IndexError("Cannot sample from an empty multiset")
+
+        items = list(self.counts.keys())
+        chances = np.array([self.counts[item] for item in items], dtype=float) / self._total
+        drawn = get_numpy_rng(rng).multinomial(amount, chances)
+        return Multiset(zip(items, drawn.tolist()))
+
+    def sample_without_replacement(
+            self: typing.Self,
+            amount: int,
+            rng: random.Random = random
+        ) -> Multiset:
+        """Draws the given amount of items without replacement, and returns what was drawn.
+        This gives the same odds as calling `pop_random` that many times, but doesn't change this multiset.
+        Drawing at least as many items as there are gives all of them."""
+        if amount >= self._total:
+            return self.copy()
+
+        if amount <= 0:
+            return Multiset()
+
+        items = list(self.counts.keys())
+        drawn = get_numpy_rng(rng).multivariate_hypergeometric([self.counts[item] for item in items], amount)
+        return Multiset(zip(items, drawn.tolist()))
+
+    def times_contains(
+            self: typing.Self,
+            other: Multiset
+        ) -> int:
+        """Returns how many copies of the other multiset can be made from the items in this one.
+        For example how many chessatrons can be made from a player's chess pieces."""
+        if not other:
+            raise ValueError("Cannot count copies of an empty multiset")
+        
+        return min(self.count(item) // amount for item, amount in other.counts.items())
+
+    def __add__(self: typing.Self, other: Multiset) -> Multiset:
+        """Sum of the amounts."""
+        output = self.copy()
+        for item, amount in other.counts.items():
+            output.add(item, amount)
+        return output
+
+    def __sub__(self: typing.Self, other: Multiset) -> Multiset:
+        """Difference of the amounts, where anything that goes to 0 or below is removed."""
+        output = self.copy()
+        for item, amount in other.counts.items():
+            output.discard(item, amount)
+        return output
+
+    def __and__(self: typing.Self, other: Multiset) -> Multiset:
+        """Intersection, the smaller of the two amounts of each item."""
+        return Multiset(
+            (item, min(amount, other.count(item)))
+            for item, amount in self.counts.items()
+        )
+
+    def __mul__(self: typing.Self, times: int) -> Multiset:
+        """Every amount multiplied by the given number."""
+        return Multiset((item, amount * times) for item, amount in self.counts.items())
+
+def get_numpy_rng(rng: random.Random = random) -> np.random.Generator:
+    """Returns a NumPy generator seeded from the given rng, so a seeded rng gives the same NumPy results as well."""
+    return np.random.default_rng(rng.getrandbits(64))
+
 def increment(
         dictionary: dict,
         key: str,
@@ -130,6 +333,36 @@ def increment(
         dictionary[key] = amount
     return dictionary
 
+def floor_sum(
+        count: int,
+        divisor: int,
+        slope: int,
+        offset: int = 0
+    ) -> int:
+    """Returns the sum of `(slope * i + offset) // divisor` for every i from 0 to count - 1, without going through them
+    one at a time. The slope and offset can't be negative.
+
+    >>> floor_sum(4, 10, 7) # 0 + 0 + 1 + 2
+    3"""
+    total = 0
+    while count > 0:
+        if slope >= divisor:
+            total += (count - 1) * count // 2 * (slope // divisor)
+            slope %= divisor
+        if offset >= divisor:
+            total += count * (offset // divisor)
+            offset %= divisor
+
+        last = slope * count + offset
+        if last < divisor:
+            break
+
+        # Count the points under the line by looking at it sideways.
+        count, offset = last // divisor, last % divisor
+        divisor, slope = slope, divisor
+
+    return total
+
 # returns a random number between 0 and 1, biased towards the edges
 def rand_sigmoid(x: typing.Optional[int] = None) -> float:
     """Returns a random number between 0 and 1, but biased towards the edges."""
@@ -1067,41 +1067,38 @@ all_emotes = [normal_bread,
     lottery_win,
     ] + all_chess_pieces + all_anarchy_pieces + misc_emotes + misc_bread_emotes + all_uniques + all_shinies + shadow_emotes + all_very_shinies
 
+def build_emote_index() -> dict[str, Emote]:
+    """Builds the lookup table used by `get_emote`, mapping every lowercased emoji, text, name and alternate name of
+    every emote, plus each of those with an "s" on the end, to the emote.
+    Where two emotes share a key the first one in `all_emotes` wins, and exact matches always win over plurals."""
+    index = dict()
+    for emote in all_emotes:
+        keys = [emote.text.lower()]
+        if emote.emoji is not None:
+            keys.append(emote.emoji)
+        if emote.name is not None:
+            keys.append(emote.name.lower())
+        keys.extend(alternate_name.lower() for alternate_name in emote.alternate_names)
+
+        for key in keys:
+            index.setdefault(key, emote)
+    
+    for key, emote in list(index.items()):
+        index.setdefault(key + "s", emote)
+    
+    return index
+
+# Rebuilt whenever this module is reloaded. If `all_emotes` is ever changed at runtime this has to be rebuilt too.
+emote_index = build_emote_index()
+
 def get_emote(text: str) -> typing.Optional[Emote]:
     """Returns an Emote object if the given text represents that emote, or None if no emote matches."""
     if text is None:
         return None
     if isinstance(text, Emote):
         return text
-    if len(text) == 0:
-        return None
-    # return None
-
-    text = text.lower()
-    for emote in all_emotes:
-        if (emote.emoji is not None) and (emote.emoji == text):
-            return emote
-        if text == emote.text.lower():
-            return emote
-        if text == emote.name.lower():
-            return emote
-        for alternate_name in emote.alternate_names:
-            if text == alternate_name.lower():
-                return emote
-    # now we check for the last character being an s
-    if text[-1] == "s":
-        text_minus_last_char = text[:-1]
-        for emote in all_emotes:
-            if (emote.emoji is not None) and (emote.emoji == text_minus_last_char):
-                return emote
-            if text_minus_last_char == emote.text.lower():
-                return emote
-            if text_minus_last_char == emote.name.lower():
-                return emote
-            for alternate_name in emote.alternate_names:
-                if text_minus_last_char == alternate_name.lower():
-                    return emote
-    return None
+    
+    return emote_index.get(text.lower())
 
 
 def get_emote_text(text: str) -> str:
@@ -1112,21 +1109,144 @@ def get_emote_text(text: str) -> str:
     else:
         return None
 
+class Emote_Matcher:
+    """Aho-Corasick automaton over every way of writing every emote, for finding emotes inside a piece of text in a
+    single pass, no matter how many emotes there are.
+
+    Matches have to stand on their own, so "bread" is found in "some bread please" and "two breads" but not in
+    "breadsticks".
+    Forms that start or end with punctuation, like ":bread:" or an emoji, can appear anywhere."""
+
+    def __init__(
+            self: typing.Self,
+            emotes: list[Emote]
+        ) -> None:
+        # Each surface form goes to the first emote in the list that has it, the same as `get_emote`.
+        patterns = dict()
+        for emote in emotes:
+            forms = [emote.text.lower()]
+            if emote.emoji is not None:
+                forms.append(emote.emoji)
+            if emote.name is not None:
+                forms.append(emote.name.lower())
+            forms.extend(alternate_name.lower() for alternate_name in emote.alternate_names)
+
+            for form in forms:
+                if len(form) > 0:
+                    patterns.setdefault(form, emote)
+
+        self.patterns = list(patterns.items())
+
+        # The trie. Node 0 is the root, `goto[node]` maps a character to the next node,
+        # and `outputs[node]` lists the patterns that end at that node, including through fail links.
+        self.goto = [dict()]
+        self.fail = [0]
+        self.outputs = [[]]
+
+        for pattern_id, (form, emote) in enumerate(self.patterns):
+            node = 0
+            for character in form:
+                next_node = self.goto[node].get(character)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto.append(dict())
+                    self.fail.append(0)
+                    self.outputs.append([])
+                    self.goto[node][character] = next_node
+                node = next_node
+            self.outputs[node].append(pattern_id)
+
+        # Breadth first, so every node's fail link points to a node that's already been finished.
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for character, next_node in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and character not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                
+                target = self.goto[fallback].get(character, 0)
+                self.fail[next_node] = target if target != next_node else 0
+                self.outputs[next_node] = self.outputs[next_node] + self.outputs[self.fail[next_node]]
+                queue.append(next_node)
+
+    def find_all(
+            self: typing.Self,
+            text: str
+        ) -> list[tuple[int, int, Emote]]:
+        """Returns every emote match in the text as `(start, end, emote)`, including overlapping ones, ordered by
+        where they end."""
+        text = text.lower()
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+
+        matches = []
+        node = 0
+        for index, character in enumerate(text):
+            while node and character not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(character, 0)
+
+            for pattern_id in outputs[node]:
+                form, emote = self.patterns[pattern_id]
+                start = index + 1 - len(form)
+                if self.stands_alone(text, form, start, index + 1):
+                    matches.append((start, index + 1, emote))
+        
+        return matches
+
+    def find_longest(
+            self: typing.Self,
+            text: str
+        ) -> list[tuple[int, int, Emote]]:
+        """Returns the emote matches in the text as `(start, end, emote)`, without overlaps and in order.
+        Where matches overlap the one that starts first wins, and then the longest one."""
+        output = []
+        end = 0
+        for match in sorted(self.find_all(text), key=lambda match: (match[0], -match[1])):
+            if match[0] >= end:
+                output.append(match)
+                end = match[1]
+        
+        return output
+
+    @staticmethod
+    def stands_alone(
+            text: str,
+            form: str,
+            start: int,
+            end: int
+        ) -> bool:
+        """Returns a boolean for whether a match of the given form isn't just part of a longer word."""
+        if start > 0 and is_word_character(form[0]) and is_word_character(text[start - 1]):
+            return False
+        
+        if end < len(text) and is_word_character(form[-1]) and is_word_character(text[end]):
+            # Plurals are fine, like "donuts".
+            if text[end] != "s" or (end + 1 < len(text) and is_word_character(text[end + 1])):
+                return False
+        
+        return True
+
+def is_word_character(character: str) -> bool:
+    """Returns a boolean for whether the character can be part of a word."""
+    return character.isalnum() or character == "_"
+
+# Rebuilt whenever this module is reloaded, along with `emote_index`.
+emote_matcher = Emote_Matcher(all_emotes)
+
 def extract_emote_from_text(text: str) -> typing.Optional[Emote]:
-    """Extracts a single emote from a piece of text."""
-    text = text.lower()
-    for emote in all_emotes:
-        if (emote.emoji is not None):
-            if emote.emoji in text:
-                return emote
-        if emote.text.lower() in text:
-            return emote
-        if emote.name.lower() in text:
-            return emote
-        for alternate_name in emote.alternate_names:
-            if alternate_name.lower() in text:
-                return emote
-    return None
+    """Extracts a single emote from a piece of text. If there's more than one the longest match is used, and then the
+    first one. Returns None if there aren't any."""
+    matches = emote_matcher.find_longest(text)
+    if len(matches) == 0:
+        return None
+    
+    return max(matches, key=lambda match: match[1] - match[0])[2]
+
+def extract_all_emotes_from_text(text: str) -> list[Emote]:
+    """Extracts every emote from a piece of text, in order. Overlapping matches are resolved in favor of the longest."""
+    return [emote for start, end, emote in emote_matcher.find_longest(text)]
 
 ########################################################################################
 
@@ -98,6 +98,11 @@ import bread.stonks as stonks
 import bread.space as space
 import bread.generation as generation
 import bread.projects as projects
+import bread.storage as storage
+import bread.locks as locks
+import bread.sending as sending
+import bread.ticker as ticker
+import bread.replay as replay
 
 # roles
 # average bread enjoyer
@@ -360,34 +365,60 @@ class JSON_interface:
         
     }
 
-    all_guilds = list()
-    data = dict()
     archived_bread_data = dict()
     accounts = dict()
 
+    # Either "json" to keep the bread data in the JSON cog's database, or "sqlite" to keep it in `sqlite_path`.
+    # When switching to "sqlite" the existing bread data is imported automatically if the SQLite database is empty.
+    # Guild data is loaded the first time it's needed, and guilds that haven't been used in `guild_idle_timeout`
+    # seconds are unloaded by the hourly loop.
+    storage_backend = "json"
+    sqlite_path = "bread.sqlite3"
+    guild_idle_timeout = 6 * 60 * 60
+    active_storage = None
+
     ####################################
     #####      FILE STUFF
 
+    def get_storage(self: typing.Self) -> storage.Storage_Backend:
+        """Returns the storage backend the bread data is kept in, creating it if needed."""
+        if self.active_storage is None or self.active_storage.name != self.storage_backend:
+            if self.active_storage is not None:
+                self.active_storage.close()
+
+            if self.storage_backend == "sqlite":
+                self.active_storage = storage.SQLite_Storage(self.sqlite_path)
+            else:
+                self.active_storage = storage.JSON_Storage(bot_ref)
+        
+        return self.active_storage
+
     def internal_load(self: typing.Self) -> None:
-        """Loads the Bread Game data from the JSON cog into the interface storage."""
+        """Loads the Bread Game data from the storage backend into the interface storage."""
         print("Bread JSON internal_load called")
 
 
         JSON_cog = bot_ref.get_cog("JSON")
         JSON_cog.load_all_data() 
 
-        all_json_guilds = JSON_cog.get_list_of_all_guilds()
+        backend = self.get_storage()
 
-        print("Loading data for all guilds")
-        for guild_id in all_json_guilds:
-            print(f"Loading data for guild {guild_id}")
-            data = JSON_cog.get_filing_cabinet("bread", create_if_nonexistent=False, guild=guild_id)
-            if data is None:
-                continue
-            self.data[guild_id] = data
-            if self.data[guild_id] is not None:
-                self.all_guilds.append(guild_id)
-                print(f"Loaded data for guild {guild_id}")
+        if isinstance(backend, storage.SQLite_Storage) and backend.is_empty():
+            print("SQLite database is empty, importing the bread data from the JSON cog")
+            guild_ids = JSON_cog.get_list_of_guilds_with_cabinet("bread")
+            imported = storage.import_json_database(
+                ((guild_id, JSON_cog.get_filing_cabinet("bread", guild=guild_id)) for guild_id in guild_ids),
+                backend
+            )
+            print(f"Imported {imported} files.")
+
+            # The bread data lives in SQLite now, so the JSON cog doesn't need to keep writing it out.
+            for guild_id in guild_ids:
+                JSON_cog.get_vault(guild_id).pop("bread", None)
+                JSON_cog.mark_dirty(guild_id, "bread")
+
+        # Guilds are loaded by the backend as they're needed.
+        backend.load()
             
         self.archived_bread_data = JSON_cog.get_filing_cabinet("archived_bread_count", create_if_nonexistent=False, guild=default_guild)
         # self.data["bread"] = JSON_cog.get_filing_cabinet("bread", create_if_nonexistent=True)
@@ -400,36 +431,54 @@ class JSON_interface:
             self: typing.Self,
             JSON_cog = None
         ) -> None:
-        """Saves the data in the interface storage to file via the JSON cog."""
+        """Saves the data in the interface storage via the storage backend.
+        This blocks until the data is written, `internal_save_async` should be used where possible."""
         print("saving bread data")
-        if JSON_cog is None:
-            JSON_cog = bot_ref.get_cog("JSON")
+        backend = self.get_storage()
 
-        for guild_id in self.data.keys():
-            JSON_cog.set_filing_cabinet("bread", self.data[guild_id], guild=guild_id)
-            # JSON_cog.set_filing_cabinet("archived_bread_count", self.data[guild_id]["archived_bread_count"], guild=guild_id)
-        # JSON_cog.set_filing_cabinet("bread", self.data)
-        # JSON_cog.set_filing_cabinet("archived_bread_count", self.data["archived_bread_count"])
-        JSON_cog.save_all_data()
-        
-        
+        if isinstance(backend, storage.JSON_Storage):
+            backend.save(JSON_cog)
+        else:
+            backend.save()
 
-    def create_backup(self: typing.Self) -> None:
-        """Creates a backup of the interface storage.
-        The JSON cog's create_backup function is preferred over this, as this will only save the bread data."""
-        #first, make sure there's a backup folder (relative path)
-        folder_path = "backup/"
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
+    async def internal_save_async(
+            self: typing.Self,
+            scheduled: bool = False
+        ) -> None:
+        """Saves the data in the interface storage via the storage backend, without blocking the event loop where possible.
+        If `scheduled` is True the JSON cog will only rewrite the snapshot if its journal is due for compaction."""
+        print("saving bread data")
+        await self.get_storage().save_async(scheduled=scheduled)
+
+    def evict_idle_guilds(self: typing.Self) -> int:
+        """Unloads the data of guilds that haven't been used in `guild_idle_timeout` seconds. Returns the amount unloaded."""
+        return self.get_storage().evict_idle(self.guild_idle_timeout)
+
+    def get_guild_data(
+            self: typing.Self,
+            guild: typing.Union[discord.Guild, int, str]
+        ) -> dict:
+        """Returns the bread data for a guild, loading it if it isn't loaded yet.
+        The returned dict can be unloaded later on, so it shouldn't be kept around between commands."""
+        return self.get_storage().get_guild(get_id_from_guild(guild))
+
+    def write_file(
+            self: typing.Self,
+            label: str,
+            guild: typing.Union[discord.Guild, int, str],
+            keys: typing.Optional[list[str]] = None
+        ) -> None:
+        """Passes the current contents of a file in the bread data to the storage backend.
+        If only some top-level keys of the file changed they can be given in `keys`, so the backend can write just those."""
+        guild_id = get_id_from_guild(guild)
+        self.get_storage().write_file(guild_id, label, self.get_guild_data(guild_id)[label], keys=keys)
+        
         
-        #then, we make the file
-        file_name = datetime.now().strftime('bread_data_backup_%y-%-m-%-d---%H-%M-%S.json')
-        with open(folder_path+file_name, 'w') as outfile:
-            print('created ', file_name)
-            #json_string = json.dumps(self.data, indent=2)
-            json.dump(self.data, outfile)
 
-        print("Backup Created.")
+    async def create_backup_async(self: typing.Self) -> None:
+        """Backs up the database into the JSON cog's backup store, see `JSON_cog.create_backup_async`.
+        The SQLite backend keeps the bread data in its own database file, which the backup store doesn't cover."""
+        await bot_ref.get_cog("JSON").create_backup_async()
 
 
 
@@ -469,7 +518,9 @@ class JSON_interface:
         guild_id = get_id_from_guild(guild)
 
         # self.accounts[index] = user_account
-        self.data[guild_id][index] = user_account.to_dict()
+        guild_data = self.get_guild_data(guild_id)
+        guild_data[index] = user_account.commit(guild_data.get(index))
+        self.write_file(index, guild_id)
 
     def has_account(
             self: typing.Self,
@@ -478,7 +529,7 @@ class JSON_interface:
         """Returns a boolean for whether the given member object has an account in the bread data."""
         index = str(user.id)
         guild = str(user.guild.id)
-        return index in self.data[guild]
+        return index in self.get_guild_data(guild)
 
     def get_all_user_accounts(
             self: typing.Self,
@@ -489,7 +540,7 @@ class JSON_interface:
         
         #return [account.Bread_Account.from_dict(index, self.data["bread"][index]) for index in self.data["bread"]]
         output = []
-        for index in self.data[guild_id]:
+        for index in self.get_guild_data(guild_id):
             if is_digit(index):
                 # Mysterious "0" key account appeared, this should protect it from the daily reset.
                 # If it is allowed in the daily reset it'll mess up existing account data to whatever is in it.
@@ -502,7 +553,7 @@ class JSON_interface:
 
     def get_list_of_all_guilds(self: typing.Self) -> list[str]:
         """Returns a list of all the guilds in the bread data."""
-        return list(self.all_guilds)
+        return self.get_storage().list_guilds()
     
     ####################################
     #####      BREAD SPACE
@@ -549,7 +600,7 @@ class JSON_interface:
         ascension_data["map_data"] = new_data
         space_data[f"ascension_{ascension_id}"] = ascension_data
 
-        self.set_custom_file("space", file_data=space_data, guild=guild)
+        self.set_custom_file("space", file_data=space_data, guild=guild, keys=[f"ascension_{ascension_id}"])
 
     def get_ascension_seed(
             self: typing.Self,
@@ -576,7 +627,7 @@ class JSON_interface:
         ascension_data["seed"] = new_seed
         space_data[f"ascension_{ascension_id}"] = ascension_data
 
-        self.set_custom_file("space", file_data=space_data, guild=guild)
+        self.set_custom_file("space", file_data=space_data, guild=guild, keys=[f"ascension_{ascension_id}"])
 
         return new_seed
     
@@ -650,8 +701,8 @@ class JSON_interface:
         ascension_data["trade_hubs"] = trade_hub_data
         space_data[f"ascension_{ascension}"] = ascension_data
 
-        self.set_custom_file("space", space_data, guild=guild)
-    
+        self.set_custom_file("space", space_data, guild=guild, keys=[f"ascension_{ascension}"])
+
     def update_trade_hub_levelling_data(
             self: typing.Self,
             guild: typing.Union[discord.Guild, int, str],
@@ -701,7 +752,7 @@ class JSON_interface:
         ascension_data["trade_hubs"] = trade_hub_data
         space_data[f"ascension_{ascension}"] = ascension_data
 
-        self.set_custom_file("space", space_data, guild=guild)
+        self.set_custom_file("space", space_data, guild=guild, keys=[f"ascension_{ascension}"])
         
         
             
@@ -717,10 +768,10 @@ class JSON_interface:
             guild: typing.Union[discord.Guild, int, str]
         ) -> dict:
         """Returns the specific data for the given custom file."""
-        guild_id = get_id_from_guild(guild)
+        guild_data = self.get_guild_data(guild)
 
-        if label in self.data[guild_id]:
-            return self.data[guild_id][label]
+        if label in guild_data:
+            return guild_data[label]
         else:
             return dict()
 
@@ -728,12 +779,23 @@ class JSON_interface:
             self: typing.Self,
             label: str,
             file_data: dict,
-            guild: typing.Union[discord.Guild, int, str]
+            guild: typing.Union[discord.Guild, int, str],
+            keys: typing.Optional[list[str]] = None
         ) -> None:
-        """Sets a custom file to the given dictionary."""
+        """Sets a custom file to the given dictionary.
+        If only some top-level keys of the file changed they can be given in `keys`, so only those are journalled.
+        This matters for large files like `space`, which are changed a little at a time."""
         guild_id = get_id_from_guild(guild)
 
-        self.data[guild_id][label] = file_data
+        if label == "space":
+            # Trade Hubs and the day seed affect rolls.
+            rolls.roll_contexts.invalidate(guild=guild_id)
+
+            # Whether players can use salvage depends on the trade hub upgrades.
+            store.shop_availability.invalidate(guild=guild_id)
+
+        self.get_guild_data(guild_id)[label] = file_data
+        self.write_file(label, guild_id, keys=keys)
 
     def get_guild_info(
             self: typing.Self,
@@ -741,14 +803,16 @@ class JSON_interface:
         ) -> dict:
         """Returns the data for a specific guild."""
         guild_id = get_id_from_guild(guild)
-        if "guild_info" not in self.data[guild_id].keys():
-            self.data[guild_id]["guild_info"] = dict()
+        guild_data = self.get_guild_data(guild_id)
+        if "guild_info" not in guild_data.keys():
+            guild_data["guild_info"] = dict()
 
             guild_name = get_name_from_guild(guild_id)
-            self.data[guild_id]["guild_info"]["name"] = guild_name
+            guild_data["guild_info"]["name"] = guild_name
 
+            self.write_file("guild_info", guild_id)
 
-        return self.data[guild_id]["guild_info"]
+        return guild_data["guild_info"]
 
     def set_guild_info(
             self: typing.Self,
@@ -757,7 +821,8 @@ class JSON_interface:
         ) -> None:
         """Sets a guild's data to the given dictionary."""
         guild_id = get_id_from_guild(guild)
-        self.data[guild_id]["guild_info"] = guild_info
+        self.get_guild_data(guild_id)["guild_info"] = guild_info
+        self.write_file("guild_info", guild_id)
 
     def get_rolling_channel(
             self: typing.Self,
@@ -790,18 +855,18 @@ class JSON_interface:
         ) -> dict: 
         """Gets the dictionary of the given member's stats."""
         guild_id = get_id_from_guild(guild)
-        if guild_id not in self.data.keys():
-            self.data[guild_id] = dict()
+        guild_data = self.get_guild_data(guild_id)
 
         key = get_id_from_user(user)
         #print("Searching database for file for "+user.display_name)
-        if key in self.data[guild_id]:
+        if key in guild_data:
             #print("Found")
             # set the guild_id if it's not already set
-            if "guild_id" not in self.data[guild_id][key].keys():
-                self.data[guild_id][key]["guild_id"] = guild_id
+            if "guild_id" not in guild_data[key].keys():
+                guild_data[key]["guild_id"] = guild_id
+                self.write_file(key, guild_id)
 
-            return self.data[guild_id][key]
+            return guild_data[key]
         else:
             print("Creating new data for "+str(user))
             guild = bot_ref.get_guild(int(guild_id))
@@ -815,7 +880,8 @@ class JSON_interface:
                 'id' : member.id,
                 'guild_id' : guild_id,
             }
-            self.data[guild_id][key] = new_file
+            guild_data[key] = new_file
+            self.write_file(key, guild_id)
             return new_file
         
 
@@ -831,7 +897,16 @@ class JSON_interface:
 class Bread_cog(commands.Cog, name="Bread"):
 
     json_interface = JSON_interface()
-    currently_interacting = list()
+
+    # Per-user locks, so nobody can have two rolls, gambles, gifts and so on running at once.
+    # Trade Hubs are locked under `("trade_hub", guild id, ascension, galaxy x, galaxy y)` while being contributed to.
+    interactions = locks.Keyed_Lock_Manager()
+
+    # Per-channel queues for commands that send several messages, so they don't have to wait for them to go out.
+    send_queue = sending.Send_Queue_Manager()
+
+    # Ticks every gambling game in progress. It's kept on the bot so a reload can carry on with the games in progress.
+    game_ticker = ticker.Game_Ticker()
 
     def __init__(
             self: typing.Self,
@@ -843,6 +918,12 @@ class Bread_cog(commands.Cog, name="Bread"):
         bot.json_interface = self.json_interface
         self.json_interface.bread_cog = self
 
+        self.send_queue.error_handler = self.output_error
+
+        self.game_ticker.error_handler = self.output_error
+        self.game_ticker.adopt(getattr(bot, "game_ticker", None))
+        bot.game_ticker = self.game_ticker
+
     def cog_unload(self: typing.Self):
         self.daily_task.cancel()
         pass
@@ -852,7 +933,7 @@ class Bread_cog(commands.Cog, name="Bread"):
         try:
             system_random = random.SystemRandom()
             
-            all_guilds = self.json_interface.all_guilds
+            all_guilds = self.json_interface.get_list_of_all_guilds()
 
             # Get the stonk data to use the shadow stonk values of a randomly selected guild.
             stonks_file = self.json_interface.get_custom_file("stonks", guild = system_random.choice(all_guilds))
@@ -878,11 +959,8 @@ class Bread_cog(commands.Cog, name="Bread"):
             self: typing.Self,
             user_id: int
         ) -> None:
-        """Attempts to remove the given user id from the interacting list, but catches the exception raised if it is not in the list to begin with."""
-        try:
-            self.currently_interacting.remove(user_id)
-        except ValueError:
-            pass
+        """Releases the given user's interaction lock, if they have it."""
+        self.interactions.release(user_id)
     
     def describe_added_shop_items(
             self: typing.Self,
@@ -978,9 +1056,10 @@ class Bread_cog(commands.Cog, name="Bread"):
         # The seed doesn't really need to be scrambled every hour, but it doesn't hurt.
         self.scramble_random_seed()
 
-        self.synchronize_usernames_internal()
-        self.json_interface.internal_save() # Save every hour
-        self.currently_interacting.clear() # Clear the list of users currently interacting
+        self.synchronize_usernames_internal(save=False)
+        await self.json_interface.internal_save_async(scheduled=True) # Save every hour
+        self.json_interface.evict_idle_guilds()
+        self.interactions.expire_stale() # Break any interaction locks that were never released
         
         hour = time.hour # This is in UTC.
         
@@ -1028,7 +1107,7 @@ class Bread_cog(commands.Cog, name="Bread"):
             # Set a new tick seed.
             space_data["tick_seed"] = space.generate_galaxy_seed()
 
-            self.json_interface.set_custom_file("space", file_data=space_data, guild=guild_id)
+            self.json_interface.set_custom_file("space", file_data=space_data, guild=guild_id, keys=["tick_seed"])
     
     @daily_task.before_loop
     async def before_daily(self: typing.Self):
@@ -1176,8 +1255,12 @@ class Bread_cog(commands.Cog, name="Bread"):
     ########################################################################################################################
     #####      SYNCHRONIZE_USERNAMES
 
-    def synchronize_usernames_internal(self: typing.Self) -> None:
-        """Syncronizes the internally stored usernames with the actual usernames of members."""
+    def synchronize_usernames_internal(
+            self: typing.Self,
+            save: bool = True
+        ) -> None:
+        """Syncronizes the internally stored usernames with the actual usernames of members.
+        The database is saved afterwards unless `save` is False."""
         # we get the guild and then all the members in it
         # guild = default_guild
 
@@ -1206,16 +1289,24 @@ class Bread_cog(commands.Cog, name="Bread"):
                     # get the account
                     account = self.json_interface.get_account(member, guild=guild_id)
 
-                    account.values["id"] = member.id
-                    account.values["username"] = member.name
-                    #account.values["display_name"] = member.display_name
-                    account.values["display_name"] = get_display_name(member)
+                    display_name = get_display_name(member)
+                    if account.values.get("id") == member.id \
+                            and account.values.get("username") == member.name \
+                            and account.values.get("display_name") == display_name:
+                        # Nothing changed, so don't mark the account as changed either.
+                        continue
+
+                    account.set("id", member.id)
+                    account.set("username", member.name)
+                    #account.set("display_name", member.display_name)
+                    account.set("display_name", display_name)
                     
                     # save the account
                     self.json_interface.set_account(member, account, guild=guild_id)
 
         # save the database      
-        self.json_interface.internal_save()
+        if save:
+            self.json_interface.internal_save()
         
         
 
@@ -1845,7 +1936,7 @@ loaf_converter""",
         leaderboard = dict()
         total = 0
 
-        all_files = self.json_interface.data[str(ctx.guild.id)]
+        all_files = self.json_interface.get_guild_data(ctx.guild.id)
         
         if search_all is True:
             def include_file(file):
@@ -2035,6 +2126,10 @@ loaf_converter""",
                         conditions.add(arg)
                     elif values.get_emote_text(arg) != None:
                         conditions.add(values.get_emote_text(arg))
+                    else:
+                        # Emojis pasted without spaces between them end up in one argument.
+                        for emote in values.extract_all_emotes_from_text(arg):
+                            conditions.add(emote.text)
             
             if len(conditions) == 0:
                 await ctx.reply("I could not recognize any item. Your black hole customization has not been changed.")
@@ -2115,11 +2210,9 @@ loaf_converter""",
     )
     async def roll(self, ctx):
 
-        #check if they're already rolling
-        if ctx.author.id in self.currently_interacting:
+        #check if they're already rolling, if so this roll waits for that one to finish
+        if not await self.interactions.acquire(ctx.author.id, queue=True):
             return
-        #otherwise we add them to the list
-        self.currently_interacting.append(ctx.author.id)
 
         try:
             user_account = self.json_interface.get_account(ctx.author, guild=ctx.guild.id)
@@ -2162,15 +2255,30 @@ loaf_converter""",
                 stored_rolls_remaining = 0
             
             before_buyable = self.get_buyable_items(user_account, store.all_store_items)
+
+            # if black hole is active, only the rolls it shows need messages
+            black_hole_filter = None
+            if user_account.get("black_hole") == 2 and get_channel_permission_level(ctx) == PERMISSION_LEVEL_MAX:
+                black_hole_filter = rolls.Black_Hole_Filter(user_account.get("black_hole_conditions"))
             
             ######
             ############################################################
 
+            roll_rng = replay.command_log.seed_command(
+                command = "roll",
+                guild_id = ctx.guild.id,
+                user_id = ctx.author.id,
+                arguments = {"roll_luck": user_luck, "roll_count": user_multiroll, "black_hole": black_hole_filter is not None},
+                user_account = user_account
+            )
+
             result = rolls.bread_roll(
                 roll_luck= user_luck, 
                 roll_count= user_multiroll,
                 user_account=user_account,
-                json_interface=self.json_interface
+                json_interface=self.json_interface,
+                message_filter=black_hole_filter,
+                rng=roll_rng
             )
 
             ############################################################
@@ -2311,20 +2419,9 @@ loaf_converter""",
             compound_rolls = 2 ** user_account.get("compound_roller")
             #compound_rolls = 100
 
+            # if black hole is active, "unimportant" rolls have already been left out by the filter
             roll_messages = result["roll_messages"]
 
-            # if black hole is active
-            if user_account.get("black_hole") == 2 and get_channel_permission_level(ctx) == PERMISSION_LEVEL_MAX:
-                # we clear out any "unimportant" rolls
-                new_roll_messages = []
-                conditions = user_account.get("black_hole_conditions")
-                for message in roll_messages:
-                    if any(item in message for item in conditions) or \
-                    (("14+" in conditions) and len(message.split()) >= 14 and len(message.split()) < 50) or \
-                    ((("lottery_win" in conditions) or (":fingers_crossed:" in conditions)) and len(message.split()) >= 50):
-                        new_roll_messages.append(message)
-                roll_messages = new_roll_messages
-
 
             # for a non-compound roll, the output is just the input
             if compound_rolls == 1:
@@ -2358,20 +2455,12 @@ loaf_converter""",
                 
             # check if black hole is activated and if we're in #bread-rolls
             if user_account.get("black_hole") == 2 and get_channel_permission_level(ctx) == PERMISSION_LEVEL_MAX:
-                await ctx.reply(":cyclone:")
+                self.send_queue.send(ctx, ":cyclone:")
             
             # black hole is not activated, send messages normally
-            try:
-                for roll in output_messages:
-                    await ctx.reply(roll)
-                    if len(output_messages) > 1:
-                        await asyncio.sleep(.75)
-            except Exception as e:
-                await self.output_error(
-                    ctx = ctx,
-                    error = e,
-                    also_print = True
-                )
+            # Compound rolls are already grouped how they should be, so these aren't packed together any further.
+            for roll in output_messages:
+                self.send_queue.send(ctx, roll)
                     
             output_commentary = ""
 
@@ -2394,34 +2483,26 @@ loaf_converter""",
             after_buyable = self.get_buyable_items(user_account, store.all_store_items)
             output_commentary += self.describe_added_shop_items(before_buyable, after_buyable)
 
-            try:
-                if output_commentary != "" and not output_commentary.isspace():
-                    messages = [output_commentary]
-                    if len(output_commentary) > 1900:
-                        messages = []
-                        split = output_commentary.split("\n")
-
-                        add = []
-
-                        for split_item in split:
-                            if len("\n".join(add + [split_item])) > 1900:
-                                messages.append("\n".join(add))
-                                add = ["Summary continued:", split_item]
-                            else:
-                                add.append(split_item)
-                        
-                        if len(add) > 0:
+            if output_commentary != "" and not output_commentary.isspace():
+                messages = [output_commentary]
+                if len(output_commentary) > 1900:
+                    messages = []
+                    split = output_commentary.split("\n")
+
+                    add = []
+
+                    for split_item in split:
+                        if len("\n".join(add + [split_item])) > 1900:
                             messages.append("\n".join(add))
+                            add = ["Summary continued:", split_item]
+                        else:
+                            add.append(split_item)
                     
-                    for message in messages:
-                        await ctx.reply(message)
-                    
-            except:
-                await self.output_error(
-                    ctx = ctx,
-                    error = e,
-                    also_print = True
-                )
+                    if len(add) > 0:
+                        messages.append("\n".join(add))
+                
+                for message in messages:
+                    self.send_queue.send(ctx, message)
 
             await self.do_chessboard_completion(ctx)
             await self.anarchy_chessatron_completion(ctx)
@@ -2453,16 +2534,16 @@ loaf_converter""",
         
         # print ("doing chessatron creation")
 
-        # user_chess_pieces = user_account.get_all_items_with_attribute_unrolled("chess_pieces")
-        full_chess_set = values.chess_pieces_black_biased+values.chess_pieces_white_biased
+        user_chess_pieces = user_account.get_items_counted("chess_pieces")
+        full_chess_set = utility.Multiset.from_list(values.chess_pieces_black_biased+values.chess_pieces_white_biased)
 
-        # leftover_pieces = utility.array_subtract((full_chess_set), user_chess_pieces )
-        #print(f"{ctx.author} has {len(leftover_pieces)} pieces left to collect.")
+        # leftover_pieces = full_chess_set - user_chess_pieces
+        #print(f"{ctx.author} has {leftover_pieces.total()} pieces left to collect.")
         #print(f"Those pieces are: {leftover_pieces}")
 
 
         # pointwise integer division between the full chess set and the set of the user's pieces.
-        valid_trons = min([user_account.get(x.text) // full_chess_set.count(x) for x in values.all_chess_pieces])
+        valid_trons = user_chess_pieces.times_contains(full_chess_set)
 
         # iteration ends at the minimum value, make sure amount is never the minimum. 'amount is None' should mean no max ...
         # ... has been specified, so make as many trons as possible.
@@ -2479,8 +2560,8 @@ loaf_converter""",
         #     user_account.increment(emote.text, -1)
 
         # clear out the chess pieces from the account all at once
-        for chess_piece in full_chess_set:
-            user_account.increment(chess_piece, -trons_to_make)
+        for chess_piece, count in full_chess_set:
+            user_account.increment(chess_piece, -trons_to_make * count)
 
         
 
@@ -2492,54 +2573,44 @@ loaf_converter""",
         self.json_interface.set_account(ctx.author, user_account, ctx.guild.id)
 
         # then we send the tron messages
+        # The first few chessatrons get a proper animation, so those messages are given a pause, the rest just go out
+        # as fast as the channel allows.
         if trons_to_make == 0:
             return
         elif not user_account.get("tron_animation"):
             # If the tron animation is disabled run this instead.
             output = f"Congratulations! You have made {utility.write_count(trons_to_make, 'chessatron')}! Here is your reward of **{utility.smart_number(total_dough_value)} dough**.\n\n{values.chessatron.text} x {utility.smart_number(trons_to_make)}"
-            await ctx.reply(output)
+            self.send_queue.send(ctx, output)
         elif user_account.get("full_chess_set") <= 5:
             messages_to_send = trons_to_make
             while messages_to_send > 0:
-                await ctx.reply(f"You have collected all the chess pieces! Congratulations!\n\nWhat a beautiful collection!")
-                await asyncio.sleep(1)
-
-                await ctx.reply(f"{board}")
-                await asyncio.sleep(1)
-
-                await ctx.reply(f"You will now be awarded the most prestigious of chess pieces: The Mega Chessatron!")
-                await asyncio.sleep(1)
-
-                await ctx.reply(f"{values.chessatron.text}")
-                await asyncio.sleep(1)
-                await ctx.reply(f"May it serve you well. You also have been awarded **{utility.smart_number(total_dough_value//trons_to_make)} dough** for your efforts.")
+                self.send_queue.send(ctx, f"You have collected all the chess pieces! Congratulations!\n\nWhat a beautiful collection!", pause=1)
+                self.send_queue.send(ctx, f"{board}", pause=1)
+                self.send_queue.send(ctx, f"You will now be awarded the most prestigious of chess pieces: The Mega Chessatron!", pause=1)
+                self.send_queue.send(ctx, f"{values.chessatron.text}", pause=1)
+                self.send_queue.send(ctx, f"May it serve you well. You also have been awarded **{utility.smart_number(total_dough_value//trons_to_make)} dough** for your efforts.", pause=1)
                 messages_to_send -= 1
         elif trons_to_make < 10:
             messages_to_send = trons_to_make
             while messages_to_send > 0:
-                await asyncio.sleep(1)
-                await ctx.reply(f"Congratulations! You've collected all the chess pieces! This will be chessatron **#{utility.smart_number(user_account.get('full_chess_set')+1-messages_to_send)}** for you.\n\n{board}\nHere is your award of **{utility.smart_number(total_dough_value//trons_to_make)} dough**, and here's your new chessatron!")
-                await asyncio.sleep(1)
-                await ctx.reply(f"{values.chessatron.text}")
+                self.send_queue.send(ctx, f"Congratulations! You've collected all the chess pieces! This will be chessatron **#{utility.smart_number(user_account.get('full_chess_set')+1-messages_to_send)}** for you.\n\n{board}\nHere is your award of **{utility.smart_number(total_dough_value//trons_to_make)} dough**, and here's your new chessatron!", pause=1)
+                self.send_queue.send(ctx, f"{values.chessatron.text}", pause=1)
                 messages_to_send -= 1
         elif trons_to_make < 5000:
             output = f"Congratulations! More chessatrons! You've made {utility.smart_number(user_account.get('full_chess_set'))} of them in total and {utility.smart_number(trons_to_make)} right now! Here's your reward of **{utility.smart_number(total_dough_value)} dough**."
-            await ctx.reply(output)
-            await asyncio.sleep(1)
+            self.send_queue.send(ctx, output)
             
             output = ""
             for _ in range(trons_to_make):
                 output += f"{values.chessatron.text} "
                 if len(output) > 1800:
-                    await ctx.reply(output)
+                    self.send_queue.send(ctx, output, coalesce=True)
                     output = ""
-                    await asyncio.sleep(1)
-            await ctx.reply(output)
+            self.send_queue.send(ctx, output, coalesce=True)
         else:
             output = f"Wow. You have created a **lot** of chessatrons. {utility.smart_number(trons_to_make)} to be exact. I will not even attempt to list them all. Here is your reward of **{utility.smart_number(total_dough_value)} dough**."
-            await ctx.reply(output)
-            await asyncio.sleep(1)
-            await ctx.reply(f"{values.chessatron.text} x {utility.smart_number(trons_to_make)}")
+            self.send_queue.send(ctx, output)
+            self.send_queue.send(ctx, f"{values.chessatron.text} x {utility.smart_number(trons_to_make)}", coalesce=True)
 
     
 
@@ -3227,7 +3298,7 @@ loaf_converter""",
         if remaining <= 0:
             return True
         
-        if ctx.author.id in self.currently_interacting:
+        if self.interactions.is_locked(ctx.author.id):
             return False
         
         # If it gets here we need to prompt the user to make sure they
@@ -3239,7 +3310,8 @@ loaf_converter""",
         await ctx.reply(f"You already have a catalyst active, **{active.display_name}**, with **{utility.write_count(remaining, 'salvage')}** remaining."
                         f"\nAre you sure you want to purchase the **{item.display_name}** catalyst and overwrite your existing one? Yes or no.")
         
-        self.currently_interacting.append(ctx.author.id)
+        if not await self.interactions.acquire(ctx.author.id):
+            return False
         
         try:
             msg = await self.bot.wait_for('message', check = check, timeout = 60.0)
@@ -3290,7 +3362,7 @@ loaf_converter""",
         if len(upgrade_file) < max_amount:
             return True
 
-        if ctx.author.id in self.currently_interacting:
+        if self.interactions.is_locked(ctx.author.id):
             return False
         
         if item.name in upgrade_file:
@@ -3305,7 +3377,8 @@ loaf_converter""",
             + "\nAre you sure you want to continue? Yes or no." \
             + ("\n*You can cancel an upgrade you currently have with '$bread ephemeral cancel [upgrade name]'*" if max_amount >= 2 else ""))
         
-        self.currently_interacting.append(ctx.author.id)
+        if not await self.interactions.acquire(ctx.author.id):
+            return False
         
         try:
             msg = await self.bot.wait_for('message', check = check, timeout = 60.0)
@@ -3357,6 +3430,7 @@ loaf_converter""",
 
         # split the first word of the item name and check if it's a number
         item_count = 1
+        buy_max = False
         item_name_split = item_name.split(" ")
         if len(item_name_split) > 1:
             if item_name_split[0][0] == '-':
@@ -3365,9 +3439,10 @@ loaf_converter""",
             if is_digit(item_name_split[0]):
                 item_name = " ".join(item_name_split[1:])
                 item_count = parse_int(item_name_split[0])
-            if item_name_split[0] == "all":
+            if item_name_split[0] in ("all", "max"):
                 item_name = " ".join(item_name_split[1:])
                 item_count = 100000
+                buy_max = True
 
         # remove trailing 's' from the item name
         if len(item_name) > 1 and item_name[-1] == "s":
@@ -3503,7 +3578,7 @@ loaf_converter""",
             print(f"{ctx.author.display_name} bought {item.display_name} for {item.cost(user_account)} dough")
 
             #print(f"item is {item}, user account is {user_account}, tuple is {(item, user_account)}")
-            text = item.do_purchase(user_account)
+            text = item.do_purchase(user_account, **self.get_purchase_arguments(ctx, item, user_account, 1))
             #user_account.increment(item.name, 1)
             self.json_interface.set_account(ctx.author,user_account, guild = ctx.guild.id)
 
@@ -3559,12 +3634,27 @@ loaf_converter""",
 
                 # purchase the item! do_purchase modified to allow for item counts.
                 # only items with the purchase_upper method should have the modified code.
-                text = item.do_purchase(user_account,amount = purchase_num)
+                text = item.do_purchase(user_account,amount = purchase_num, **self.get_purchase_arguments(ctx, item, user_account, purchase_num))
+
+                purchased_count = purchase_num
+
+            elif item.batch_purchase:
+                # the total price has a closed form, so work out how many can be bought and buy them all at once.
+                # with "max" there's no upper limit, since it doesn't take any longer to buy more.
+                purchase_num, _ = item.solve_purchase(user_account, None if buy_max else item_count)
+
+                text = item.do_purchase(user_account, amount = purchase_num)
 
                 purchased_count = purchase_num
 
             else:
                 # old code, for use with items that don't have find_max_purchasable_count
+
+                # if the item has a total cost, only try buying as many as it can afford
+                solution = item.solve_purchase(user_account, item_count)
+                if solution is not None:
+                    item_count = solution[0]
+
                 purchased_count = 0
                 for i in range(item_count):
 
@@ -3616,9 +3706,8 @@ loaf_converter""",
         await ctx.reply(text)
 
         # complete chessatron on this command
-        if ctx.author.id in self.currently_interacting:
+        if not await self.interactions.acquire(ctx.author.id):
             return
-        self.currently_interacting.append(ctx.author.id)
         await self.do_chessboard_completion(ctx)
         await self.anarchy_chessatron_completion(ctx)
         self.remove_from_interacting(ctx.author.id)
@@ -3626,21 +3715,37 @@ loaf_converter""",
         return
 
 
+    def get_purchase_arguments(
+            self: typing.Self,
+            ctx: commands.Context,
+            item: store.Store_Item,
+            user_account: account.Bread_Account,
+            amount: int
+        ) -> dict:
+        """Returns the extra arguments to give `do_purchase` for the given item.
+        Items with random results get their own logged rng, so the purchase can be replayed."""
+        if not item.uses_rng:
+            return {}
+
+        return {
+            "rng": replay.command_log.seed_command(
+                command = "buy",
+                guild_id = ctx.guild.id,
+                user_id = ctx.author.id,
+                arguments = {"item": item.name, "amount": amount},
+                user_account = user_account
+            )
+        }
+
     # this function finds all the items the user is allowed to purchase
     def get_buyable_items(
             self: typing.Self,
             user_account: account.Bread_Account,
             item_list: list[store.Store_Item]
         ) -> list[store.Store_Item]:
-        """Returns a list of every item in item_list that passes the can_be_purchased store item method."""
-        # user_account = self.json_interface.get_account(ctx.author)
-        output = []
-        #for item in store.all_store_items:
-        for item in item_list:
-            # level = user_account.get(item.name)
-            if item.can_be_purchased(user_account):
-                output.append(item)
-        return output
+        """Returns a list of every item in item_list that passes the can_be_purchased store item method.
+        Only the items affected by what changed in the account since the player's last check are checked again."""
+        return store.shop_availability.get_buyable_items(user_account, item_list)
 
     
 
@@ -3672,9 +3777,8 @@ For example, "$bread gift Melodie all chess_pieces" would gift all your chess pi
                     arg1: typing.Optional[typing.Union[parse_int, str]] = commands.parameter(description = "The amount you want to gift.", displayed_name = "amount"), 
                     arg2: typing.Optional[typing.Union[parse_int, str]] = commands.parameter(description = "The item you're gifting.", displayed_name = "item")):
 
-        if ctx.author.id in self.currently_interacting:
+        if not await self.interactions.acquire(ctx.author.id, queue=True):
             return
-        self.currently_interacting.append(ctx.author.id)
         # await ctx.reply("This function isn't ready yet.")
 
         if target is None: #then it's empty and we'll tell them how to use it.
@@ -3872,10 +3976,9 @@ For example, "$bread gift Melodie all chess_pieces" would gift all your chess pi
                     item = item.text,
                     amount =gift_amount
                 )
-                await ctx.send(f"{utility.smart_number(gift_amount)} {item.text} has been gifted to {target.mention}.")
-                await asyncio.sleep(1)
+                self.send_queue.send(ctx, f"{utility.smart_number(gift_amount)} {item.text} has been gifted to {target.mention}.", reply=False, coalesce=True)
                 
-            await ctx.reply(f"Gifted {utility.write_count(item_amount, 'chess set')} to {receiver_account.get_display_name()}.")
+            self.send_queue.send(ctx, f"Gifted {utility.write_count(item_amount, 'chess set')} to {receiver_account.get_display_name()}.")
             self.remove_from_interacting(ctx.author.id)
             return
         elif emoji in {"anarchy_piece_set", "anarchy_set"}:
@@ -3906,10 +4009,9 @@ For example, "$bread gift Melodie all chess_pieces" would gift all your chess pi
                     item = item.text,
                     amount =gift_amount
                 )
-                await ctx.send(f"{utility.smart_number(gift_amount)} {item.text} has been gifted to {target.mention}.")
-                await asyncio.sleep(1)
+                self.send_queue.send(ctx, f"{utility.smart_number(gift_amount)} {item.text} has been gifted to {target.mention}.", reply=False, coalesce=True)
                 
-            await ctx.reply(f"Gifted {utility.write_count(item_amount, 'anarchy piece set')} to {receiver_account.get_display_name()}.")
+            self.send_queue.send(ctx, f"Gifted {utility.write_count(item_amount, 'anarchy piece set')} to {receiver_account.get_display_name()}.")
             self.remove_from_interacting(ctx.author.id)
             return
 
@@ -3932,11 +4034,10 @@ For example, "$bread gift Melodie all chess_pieces" would gift all your chess pi
                     gifted_count += item_amount
                     gift(ctx.author, target, item.text, item_amount)
 
-                    await ctx.send(f"{utility.smart_number(item_amount)} {item.text} has been gifted to {target.mention}.")
-                    await asyncio.sleep(1)
+                    self.send_queue.send(ctx, f"{utility.smart_number(item_amount)} {item.text} has been gifted to {target.mention}.", reply=False, coalesce=True)
                 
             if gifted_count > 0:
-                await ctx.reply(f"Gifted {utility.smart_number(gifted_count)} {emoji} to {receiver_account.get_display_name()}.")
+                self.send_queue.send(ctx, f"Gifted {utility.smart_number(gifted_count)} {emoji} to {receiver_account.get_display_name()}.")
             else:
                 await ctx.reply(f"Sorry, you don't have any {emoji} to gift.")
             
@@ -3953,6 +4054,9 @@ For example, "$bread gift Melodie all chess_pieces" would gift all your chess pi
         else:
             # print(f"checking for gift with text {emoji}")
             emote = values.get_emote(emoji)
+            if emote is None:
+                # Emojis copied from elsewhere can have the right name but a different id.
+                emote = values.extract_emote_from_text(emoji)
             if (emote is None) or (emote.can_be_gifted() == False):
                 # print("failed to find emote")
                 await ctx.reply("Sorry, that's not a giftable item.")
@@ -4135,10 +4239,9 @@ anarchy - 1000% of your wager.
         
         # Checks list of people currently gambling to prevent spam.
         # if they're already on the list
-        if ctx.author.id in self.currently_interacting:
+        if not await self.interactions.acquire(ctx.author.id):
             print(f"rejecting duplicate request from {ctx.author.display_name}")
             return
-        self.currently_interacting.append(ctx.author.id)
 
         # if user_account.has("total_dough", amount):
         #     pass
@@ -4183,23 +4286,19 @@ anarchy - 1000% of your wager.
         self.json_interface.set_account(ctx.author, user_account, ctx.guild.id)
 
         if reply != "":
-            await ctx.reply(reply)
-            await asyncio.sleep(1)
+            # The game sends its own messages, so wait for this one to be out first.
+            await self.send_queue.send(ctx, reply)
             
         game = gamble.BaseGame(
             wager = amount,
             json_interface = self.json_interface,
-            ctx = ctx
+            ctx = ctx,
+            rng = replay.command_log.seed_command("gamble", ctx.guild.id, ctx.author.id, {"wager": amount}, user_account)
         )
         
         await game.setup()
         
-        await asyncio.sleep(2)
-        
-        while game.in_progress:
-            await game.run_tick()
-            
-            await asyncio.sleep(1.5)
+        await self.game_ticker.play(game)
 
         user_account = self.json_interface.get_account(ctx.author, guild = ctx.guild.id)
         after_buyable = self.get_buyable_items(user_account, store.all_store_items)
@@ -4542,12 +4641,8 @@ anarchy - 1000% of your wager.
         if fraction_numerator is not None:
             amount = (account_dough * fraction_numerator) // (fraction_denominator * stonk_value)
 
-        # now we buy the stonks
-
-        buy_amount = min(amount, account_dough // stonk_value)
-        user_account.increment('total_dough',(-buy_amount * stonk_value))
-        user_account.increment(emote.text, buy_amount)
-        user_account.increment('investment_profit', (-buy_amount * stonk_value))
+        # now we buy the stonks, as many as we can afford
+        buy_amount = user_account.invest_stonk(emote.text, amount, stonk_value)
 
         self.json_interface.set_account(ctx.author, user_account, guild = ctx.guild.id)
         
@@ -4701,13 +4796,10 @@ anarchy - 1000% of your wager.
                         continue
                     stonk_cost = round(stonks_file[stonk])
 
-                    profit = stonk_cost*user_account.get(stonk)
-                    amount_divested += profit
-                    user_account.increment('total_dough', profit)
-                    user_account.increment("investment_profit", profit)
-                    user_account.set(stonk, 0) # sell all the stonk by definition
+                    # sell all the stonk by definition
+                    amount_divested += stonk_cost * user_account.divest_stonk(stonk, user_account.get(stonk), stonk_cost)
 
-                    self.json_interface.set_account(ctx.author, user_account, guild = ctx.guild.id)
+                self.json_interface.set_account(ctx.author, user_account, guild = ctx.guild.id)
                 await ctx.reply(f"You divested all of your stonks for **{utility.smart_number(amount_divested)} dough**.\n\nYou now have **{utility.smart_number(user_account.get_dough())} dough**.")
                 return
         
@@ -4781,7 +4873,7 @@ anarchy - 1000% of your wager.
         stonk_value = round(stonks_file[emote.text])
         #check if we're selling a certain amount of dough worth of a stonk, rather than a certain amount of stonks
         if dough_value is True and not amount == -1:
-            amount = math.ceil(amount/stonk_value)
+            amount = -(-amount // stonk_value) # rounded up, without going through a float for huge amounts
 
         # now we adjust the amount to make sure we don't sell more than we have
         if amount > user_account.get(emote.text) or amount == -1:
@@ -4791,10 +4883,7 @@ anarchy - 1000% of your wager.
             amount = (user_account.get(emote.text) * fraction_numerator) // fraction_denominator
         
         # sell the stonks
-        amount = min(amount, user_account.get(emote.text))
-        user_account.increment('total_dough', stonk_value*amount)
-        user_account.increment(emote.text, -amount)
-        user_account.increment('investment_profit', stonk_value*amount)
+        amount = user_account.divest_stonk(emote.text, amount, stonk_value)
             
         self.json_interface.set_account(ctx.author, user_account, guild = ctx.guild.id)
 
@@ -5067,11 +5156,9 @@ anarchy - 1000% of your wager.
             await ctx.reply(f"Thank you for your interest in bread alchemy. Please find the alchemical circle is present in {self.json_interface.get_rolling_channel(ctx.guild.id)}.")
             return
 
-        #check if they're already alchemizing
-        if ctx.author.id in self.currently_interacting:
+        #check if they're already alchemizing, if so this waits for that to finish
+        if not await self.interactions.acquire(ctx.author.id, queue=True):
             return
-        #otherwise we add them to the list
-        self.currently_interacting.append(ctx.author.id)
 
 
         user_account = self.json_interface.get_account(ctx.author, guild = ctx.guild.id)
@@ -5106,6 +5193,10 @@ anarchy - 1000% of your wager.
             # now we turn the target item into a useful emote
             target_emote = values.get_emote(target_item)
 
+            # If it isn't exactly an item, look for one in what was said, like "a <:gem_red:...> please".
+            if target_emote is None:
+                target_emote = values.extract_emote_from_text(target_item)
+
             if (target_emote is None):
                 await ctx.reply(f"I do not recognize that item. Please start over.")
                 self.remove_from_interacting(ctx.author.id)
@@ -6077,7 +6168,8 @@ anarchy - 1000% of your wager.
                 progress_data = level_progress
             )
             
-            self.currently_interacting.append(ctx.author.id)
+            if not await self.interactions.acquire(ctx.author.id):
+                return
             # Item is the confirmation, so treat it as such.
             if not item:
                 message = [f"To level up the Trade Hub, you have the following items out of what is needed:\n"]
@@ -6281,11 +6373,53 @@ anarchy - 1000% of your wager.
             actions: tuple[str]
         ) -> None:
         """Contributes items to a trade hub project, or the trade hub level."""
-        if ctx.author.id in self.currently_interacting:
+        if self.interactions.is_locked(ctx.author.id):
             return
         
         galaxy_x, galaxy_y = user_account.get_galaxy_location(json_interface=self.json_interface, correct_center=True)
 
+        # Only one contribution to a Trade Hub at a time, so two can't both complete the same level or project.
+        hub_key = ("trade_hub", ctx.guild.id, user_account.get_prestige_level(), galaxy_x, galaxy_y)
+        if not await self.interactions.acquire(hub_key, queue=True):
+            await ctx.reply("Someone else is contributing to this Trade Hub right now, please try again in a moment.")
+            return
+        
+        try:
+            # The account and the projects may have changed while waiting for the Trade Hub.
+            user_account = self.json_interface.get_account(ctx.author, guild = ctx.guild.id)
+            hub_projects = space.get_trade_hub_projects(
+                json_interface = self.json_interface,
+                user_account = user_account,
+                system_tile = hub
+            )
+
+            await self.trade_hub_contribute_locked(
+                ctx = ctx,
+                user_account = user_account,
+                day_seed = day_seed,
+                hub_projects = hub_projects,
+                hub = hub,
+                actions = actions,
+                galaxy_x = galaxy_x,
+                galaxy_y = galaxy_y
+            )
+        finally:
+            self.interactions.release(hub_key)
+
+    async def trade_hub_contribute_locked(
+            self: typing.Self,
+            ctx: commands.Context,
+            user_account: account.Bread_Account,
+            day_seed: str,
+            hub_projects: list[dict],
+            hub: space.SystemTradeHub,
+            actions: tuple[str],
+
+            galaxy_x: int,
+            galaxy_y: int
+        ) -> None:
+        """Contributes items to a trade hub project, or the trade hub level, while the Trade Hub is locked."""
+
         actions += [" ", " ", " ", " "]
         
         project_number = None
@@ -6434,7 +6568,8 @@ anarchy - 1000% of your wager.
         project_name = project.name(day_seed, hub)
 
         if not confirmation:
-            self.currently_interacting.append(ctx.author.id)
+            if not await self.interactions.acquire(ctx.author.id):
+                return
             
             confirm_text = ["yes", "y", "confirm"]
             cancel_text = ["no", "n", "cancel"]
@@ -7394,12 +7529,9 @@ anarchy - 1000% of your wager.
             confirm: typing.Optional[str] = commands.parameter(description = "Whether to confirm automatically."),
             other: typing.Optional[str] = commands.parameter(description = "Other arguments specific to how you're moving.")
         ):
-        # Check if the player is in the interacting list.
-        if ctx.author.id in self.currently_interacting:
+        # Lock the player, unless they're already doing something.
+        if not await self.interactions.acquire(ctx.author.id):
             return
-        
-        # Add the player to the interacting list.
-        self.currently_interacting.append(ctx.author.id)
 
 
         if get_channel_permission_level(ctx) < PERMISSION_LEVEL_ACTIVITIES:
@@ -8113,13 +8245,10 @@ anarchy - 1000% of your wager.
             await ctx.reply("\n".join(lines))
             return
         
-        # Check if the player is in the interacting list.
-        if ctx.author.id in self.currently_interacting:
+        # Lock the player, unless they're already doing something.
+        if not await self.interactions.acquire(ctx.author.id):
             return
         
-        # Add the player to the interacting list.
-        self.currently_interacting.append(ctx.author.id)
-        
         # Time to actually run the salvage machine.
         print(f"{ctx.author} is requesting to salvage {item}, they have {user_account.get(item.text)} of it.")
         
@@ -8151,18 +8280,23 @@ anarchy - 1000% of your wager.
         except:
             active_catalyst = None
             
-        if active_catalyst == store.Hydra.name and random.randint(1, 4) == 1:
+        # The catalysts draw from the same stream as the game, so the whole salvage can be replayed from one seed.
+        rng = replay.command_log.seed_command("salvage", ctx.guild.id, ctx.author.id, {"item": item.text}, user_account)
+            
+        if active_catalyst == store.Hydra.name and rng.randint(1, 4) == 1:
             # Double time.
             
             game_1 = gamble.LasersGame(
                 wager = item,
                 json_interface = self.json_interface,
-                ctx = ctx
+                ctx = ctx,
+                rng = random.Random(rng.getrandbits(64))
             )
             game_2 = gamble.LasersGame(
                 wager = item,
                 json_interface = self.json_interface,
-                ctx = ctx
+                ctx = ctx,
+                rng = random.Random(rng.getrandbits(64))
             )
             game_1.run_finish = False
             game_2.run_finish = False
@@ -8189,24 +8323,8 @@ anarchy - 1000% of your wager.
             user_account.increment(item, 1)
             self.json_interface.set_account(ctx.author.id, user_account, ctx.guild.id)
                     
-            await asyncio.sleep(2)
-            
-            tick = 0
-            
-            while game_1.in_progress or game_2.in_progress:
-                options = [g for g in (game_1, game_2) if g.in_progress]
-                
-                chosen = options[tick % len(options)]
-                
-                try:
-                    await chosen.run_tick()
-                except:
-                    chosen.run_finish = True
-                    await chosen.finish()
-                
-                await asyncio.sleep(1.5)
-                
-                tick += 1
+            # The two games take turns ticking.
+            await self.game_ticker.play(*[game for game in (game_1, game_2) if not game.run_finish])
             
             if not game_1.run_finish:
                 await game_1.finish()
@@ -8222,23 +8340,19 @@ anarchy - 1000% of your wager.
             game = gamble.LasersGame(
                 wager = item,
                 json_interface = self.json_interface,
-                ctx = ctx
+                ctx = ctx,
+                rng = rng
             )
         
             try:
                 await game.setup()
                     
-                await asyncio.sleep(2)
-            
-                while game.in_progress:
-                    await game.run_tick()
-                    
-                    await asyncio.sleep(1.5)
+                await self.game_ticker.play(game)
             finally:
                 # Even if the game fails, at least run the `.finish()` method.
                 await game.finish()
                 
-                if active_catalyst == store.Sagitta.name and random.randint(1, 2) == 1:
+                if active_catalyst == store.Sagitta.name and rng.randint(1, 2) == 1:
                     # Wait! It isn't dead! Salvage suprise!
                     # There's another ahead, and items likewise
                     # But you can do `$bread space stats`
@@ -8268,18 +8382,14 @@ anarchy - 1000% of your wager.
                     game = gamble.LasersGame(
                         wager = item,
                         json_interface = self.json_interface,
-                        ctx = ctx
+                        ctx = ctx,
+                        rng = replay.command_log.seed_command("salvage", ctx.guild.id, ctx.author.id, {"item": item.text}, user_account)
                     )
                 
                     try:
                         await game.setup()
 
-                        await asyncio.sleep(2)
-                    
-                        while game.in_progress:
-                            await game.run_tick()
-                            
-                            await asyncio.sleep(1.5)
+                        await self.game_ticker.play(game)
                     finally:
                         # Even if the game fails, at least run the `.finish()` method.
                         await game.finish()
@@ -8468,7 +8578,7 @@ anarchy - 1000% of your wager.
             await ctx.reply("You are planning to c- No? Uh, okay, I guess.")
             return
         elif confirmation.lower() not in confirm_text:
-            if ctx.author.id in self.currently_interacting:
+            if self.interactions.is_locked(ctx.author.id):
                 return
             
             # If it gets here we need to prompt the user to make sure they
@@ -8481,7 +8591,8 @@ anarchy - 1000% of your wager.
                             + "\nThis action is irreversable, so if you would like to have it again you will need to purchase it again." \
                             + f"\nAre you sure you want to proceed? Yes or no.")
             
-            self.currently_interacting.append(ctx.author.id)
+            if not await self.interactions.acquire(ctx.author.id):
+                return
             
             try:
                 msg = await self.bot.wait_for('message', check = check, timeout = 60.0)
@@ -8628,10 +8739,10 @@ anarchy - 1000% of your wager.
         if user_account.get("auto_chessatron") is False and force is False:
             return
         
-        full_chess_set = values.anarchy_pieces_black_biased + values.anarchy_pieces_white_biased
+        full_chess_set = utility.Multiset.from_list(values.anarchy_pieces_black_biased + values.anarchy_pieces_white_biased)
 
         # pointwise integer division between the full chess set and the set of the user's pieces.
-        valid_trons = min([user_account.get(x.text) // full_chess_set.count(x) for x in values.all_anarchy_pieces])
+        valid_trons = user_account.get_items_counted("anarchy_pieces").times_contains(full_chess_set)
 
         # iteration ends at the minimum value, make sure amount is never the minimum. 'amount is None' should mean no max ...
         # ... has been specified, so make as many trons as possible.
@@ -8648,8 +8759,8 @@ anarchy - 1000% of your wager.
         board = board = self.format_anarchy_pieces(user_account.values)
 
         # Remove the anarchy pieces from the account.
-        for anarchy_piece in full_chess_set:
-            user_account.increment(anarchy_piece, -trons_to_make)
+        for anarchy_piece, count in full_chess_set:
+            user_account.increment(anarchy_piece, -trons_to_make * count)
 
         
 
@@ -8662,36 +8773,23 @@ anarchy - 1000% of your wager.
 
         # then we send the tron messages
         if not user_account.get("tron_animation"):
-            await ctx.reply(f"Congratuations! You have made {utility.write_count(trons_to_make, 'Anarchy Chessatron')}! For this you have been awarded **{utility.smart_number(total_dough_value)} dough**!\n\n{values.anarchy_chessatron.text} x {utility.smart_number(trons_to_make)}")
+            self.send_queue.send(ctx, f"Congratuations! You have made {utility.write_count(trons_to_make, 'Anarchy Chessatron')}! For this you have been awarded **{utility.smart_number(total_dough_value)} dough**!\n\n{values.anarchy_chessatron.text} x {utility.smart_number(trons_to_make)}")
             
         elif trons_to_make < 3:
             for _ in range(trons_to_make):
-                await ctx.reply(f"You've collected all the anarchy pieces! Congratulations!")
-                await asyncio.sleep(1)
-
-                await ctx.reply(board)
-                await asyncio.sleep(1)
-
-                await ctx.reply(f"For an incredible feat like this, you have been awarded the Anarchy Chessatron!")
-                await asyncio.sleep(1)
-
-                await ctx.reply(values.anarchy_chessatron.text)
-                await asyncio.sleep(1)
-
-                await ctx.reply(f"Amazing work! You have also been awarded **{utility.smart_number(total_dough_value//trons_to_make)} dough!**")
-                await asyncio.sleep(1)
+                self.send_queue.send(ctx, f"You've collected all the anarchy pieces! Congratulations!", pause=1)
+                self.send_queue.send(ctx, board, pause=1)
+                self.send_queue.send(ctx, f"For an incredible feat like this, you have been awarded the Anarchy Chessatron!", pause=1)
+                self.send_queue.send(ctx, values.anarchy_chessatron.text, pause=1)
+                self.send_queue.send(ctx, f"Amazing work! You have also been awarded **{utility.smart_number(total_dough_value//trons_to_make)} dough!**", pause=1)
 
         elif trons_to_make < 20:
             for _ in range(trons_to_make):
-                await ctx.reply(f"Very well done! You have collected all the anarchy pieces!\n\n{board}")
-                await asyncio.sleep(1)
-
-                await ctx.reply(f"Not only have you been awarded the prestigious {values.anarchy_chessatron.text}, but you also have been awarded **{utility.smart_number(total_dough_value//trons_to_make)} dough**!")
-                await asyncio.sleep(1)
+                self.send_queue.send(ctx, f"Very well done! You have collected all the anarchy pieces!\n\n{board}", pause=1)
+                self.send_queue.send(ctx, f"Not only have you been awarded the prestigious {values.anarchy_chessatron.text}, but you also have been awarded **{utility.smart_number(total_dough_value//trons_to_make)} dough**!", pause=1)
 
         elif trons_to_make < 5000:
-            await ctx.reply(f"You've collected all the anarchy pieces again! Great job! You have enough pieces to make {utility.smart_number(trons_to_make)} Anarchy Chessatrons! Here's your reward of **{utility.smart_number(total_dough_value)} dough**!")
-            await asyncio.sleep(1)
+            self.send_queue.send(ctx, f"You've collected all the anarchy pieces again! Great job! You have enough pieces to make {utility.smart_number(trons_to_make)} Anarchy Chessatrons! Here's your reward of **{utility.smart_number(total_dough_value)} dough**!")
 
             max_per = 1800 // len(values.anarchy_chessatron.text)
             
@@ -8701,20 +8799,15 @@ anarchy - 1000% of your wager.
             if full_messages >= 1:
                 send = values.anarchy_chessatron.text * max_per
                 for _ in range(full_messages):
-                    await ctx.reply(send)
-                    await asyncio.sleep(1)
+                    self.send_queue.send(ctx, send, coalesce=True)
             
             if extra >= 1:
-                await ctx.reply(values.anarchy_chessatron.text * extra)
-                await asyncio.sleep(1)
+                self.send_queue.send(ctx, values.anarchy_chessatron.text * extra, coalesce=True)
 
 
         else:
-            await ctx.reply(f"Wow! You have so many anarchy pieces! In fact, you have enough to make a shocking {utility.smart_number(trons_to_make)} Anarchy Chessatrons!")
-            await asyncio.sleep(1)
-
-            await ctx.reply(f"Here are your new Anarchy Chessatrons:\n{values.anarchy_chessatron.text} x {utility.smart_number(trons_to_make)}\n\nAnd here is your **{utility.smart_number(total_dough_value)} dough**!")
-            await asyncio.sleep(1)
+            self.send_queue.send(ctx, f"Wow! You have so many anarchy pieces! In fact, you have enough to make a shocking {utility.smart_number(trons_to_make)} Anarchy Chessatrons!")
+            self.send_queue.send(ctx, f"Here are your new Anarchy Chessatrons:\n{values.anarchy_chessatron.text} x {utility.smart_number(trons_to_make)}\n\nAnd here is your **{utility.smart_number(total_dough_value)} dough**!", coalesce=True)
 
     #############################################################################################################################
     ##########      ADMIN   #################
@@ -8766,6 +8859,51 @@ anarchy - 1000% of your wager.
         else:
             return True
 
+    ########################################################################################################################
+    #####      ADMIN LOCKS
+
+    @admin.command(
+        name = "locks",
+        brief="Shows interaction lock metrics.",
+        help = "Usage: bread admin locks [optional 'reset']"
+    )
+    @commands.check(verification.is_admin_check)
+    async def locks_command(self, ctx, reset: typing.Optional[str] = None):
+        await ctx.reply(self.interactions.describe())
+
+        if reset == "reset":
+            self.interactions.reset_metrics()
+
+    ########################################################################################################################
+    #####      ADMIN SENDS
+
+    @admin.command(
+        name = "sends",
+        brief="Shows message queue metrics.",
+        help = "Usage: bread admin sends [optional 'reset']"
+    )
+    @commands.check(verification.is_admin_check)
+    async def sends_command(self, ctx, reset: typing.Optional[str] = None):
+        await ctx.reply(self.send_queue.describe())
+
+        if reset == "reset":
+            self.send_queue.reset_metrics()
+
+    ########################################################################################################################
+    #####      ADMIN GAMES
+
+    @admin.command(
+        name = "games",
+        brief="Shows gambling game ticker metrics.",
+        help = "Usage: bread admin games [optional 'reset']"
+    )
+    @commands.check(verification.is_admin_check)
+    async def games_command(self, ctx, reset: typing.Optional[str] = None):
+        await ctx.reply(self.game_ticker.describe())
+
+        if reset == "reset":
+            self.game_ticker.reset_metrics()
+
     ########################################################################################################################
     #####      ADMIN SET
 
@@ -8817,14 +8955,13 @@ anarchy - 1000% of your wager.
         if key_name not in file.keys():
             await ctx.send("Key does not exist.")
             if (do_force is not None and do_force.lower() == "force") or (await self.await_confirmation(ctx, True) is True):
-                file[key_name] = 0
+                account.set(key_name, 0)
             else:
                 output += "Aborting.\n"
                 await ctx.send(output)
                 return
 
-        file[key_name] = value
-        account.values = file
+        account.set(key_name, value)
         self.json_interface.set_account(user, account, guild = ctx.guild.id)
         
         await ctx.send(output+"Done.")
@@ -8878,16 +9015,14 @@ anarchy - 1000% of your wager.
         if key_name not in file.keys():
             await ctx.send("Key does not exist.")
             if (do_force is not None and do_force.lower() == "force") or (await self.await_confirmation(ctx, True) is True):
-                file[key_name] = 0
+                account.set(key_name, 0)
             else:
                 output += "Aborting.\n"
                 await ctx.send(output)
                 return
                 
 
-        file[key_name] = value + file[key_name]
-
-        account.values = file
+        account.set(key_name, value + account.values[key_name])
         self.json_interface.set_account(user, account, guild = ctx.guild.id)
 
         await ctx.send(output+"Done.")
@@ -8949,10 +9084,10 @@ anarchy - 1000% of your wager.
         # self.json_interface.set_account(target_user, target_account)
         
         # target_account = self.json_interface.get_account(target_user)
-        target_account.values["id"] = target_user.id
-        target_account.values["username"] = target_user.name
-        #target_account.values["display_name"] = target_user.display_name
-        target_account.values["display_name"] =  get_display_name(target_user)
+        target_account.set("id", target_user.id)
+        target_account.set("username", target_user.name)
+        #target_account.set("display_name", target_user.display_name)
+        target_account.set("display_name", get_display_name(target_user))
 
         self.json_interface.set_account(target_user, target_account, guild = ctx.guild.id)
 
@@ -9198,7 +9333,12 @@ anarchy - 1000% of your wager.
     @commands.is_owner()
     async def backup(self, ctx):
         print("backing up")
-        self.json_interface.create_backup()
+        await self.json_interface.create_backup_async()
+
+        if isinstance(self.json_interface.get_storage(), storage.SQLite_Storage):
+            await ctx.send("Done. The bread data is stored in SQLite, so it isn't part of the backup.")
+            return
+        
         await ctx.send("Done.")
 
     ########################################################################################################################
@@ -9292,7 +9432,7 @@ anarchy - 1000% of your wager.
         """Runs the daily reset."""
 
         print("Internal daily reset called")
-        self.currently_interacting.clear()
+        self.interactions.clear()
 
         self.reset_space_all()
 
@@ -9365,7 +9505,7 @@ anarchy - 1000% of your wager.
             for account in self.json_interface.get_all_user_accounts(guild_id):
                 if starting_name in account.values.keys():
                     account.set(ending_name, account.get(starting_name))
-                    del account.values[starting_name]
+                    account.delete(starting_name)
                     self.json_interface.set_account(account.get("id"), account, guild_id)
 
 
@@ -9389,7 +9529,7 @@ anarchy - 1000% of your wager.
         #         self.json_interface.set_account(member, account)
 
         # save the database      
-        self.json_interface.internal_save()
+        await self.json_interface.internal_save_async()
 
 
         await ctx.send("Done.")
@@ -9507,15 +9647,15 @@ anarchy - 1000% of your wager.
                 # get the account
                 account = self.json_interface.get_account(member, guild = ctx.guild.id)
 
-                account.values["id"] = member.id
-                account.values["username"] = member.name
-                account.values["display_name"] = get_display_name(member)
+                account.set("id", member.id)
+                account.set("username", member.name)
+                account.set("display_name", get_display_name(member))
                 
                 # save the account
                 self.json_interface.set_account(member, account, guild = ctx.guild.id)
 
         # save the database      
-        self.json_interface.internal_save()
+        await self.json_interface.internal_save_async()
         
         await ctx.send("Done.")
 
@@ -9784,7 +9924,7 @@ anarchy - 1000% of your wager.
     )
     @commands.is_owner()
     async def save(self, ctx):
-        self.json_interface.internal_save()
+        await self.json_interface.internal_save_async()
         await ctx.send("Done.")
 
     def internal_save(self, json_cog = None):
@@ -10243,6 +10383,7 @@ async def setup(bot: commands.Bot):
     
     importlib.reload(emoji)
     importlib.reload(verification)
+    importlib.reload(serialization)
     importlib.reload(values)
     importlib.reload(account)
     importlib.reload(gamble)
@@ -10254,6 +10395,9 @@ async def setup(bot: commands.Bot):
     importlib.reload(space)
     importlib.reload(generation)
     importlib.reload(projects)
+    importlib.reload(storage)
+    importlib.reload(locks)
+    importlib.reload(ticker)
 
     bread_cog = Bread_cog(bot)
     await bot.add_cog(bread_cog)
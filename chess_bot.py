@@ -1560,7 +1560,7 @@ class Chess_bot(commands.Cog, name="Chess"):
         JSON_cog = bot_ref.get_cog("JSON")
         JSON_cog.load_all_data() 
 
-        all_guilds = JSON_cog.get_list_of_all_guilds()
+        all_guilds = JSON_cog.get_list_of_guilds_with_cabinet("chess")
         for guild in all_guilds:
             cabinet = JSON_cog.get_filing_cabinet("chess", guild=guild, create_if_nonexistent=False)
             if cabinet is not None:
@@ -5,17 +5,85 @@ import importlib
 import asyncio
 import typing
 import time
+import marshal
+import hashlib
+import shutil
+import multiprocessing
+import concurrent.futures
 
 import discord
 from discord.ext import commands
 from discord.ext import tasks
 
 import verification
+import serialization
+import backup_store
 
 ####################################################
 ##############   JSON INTERFACE   ##################
 ####################################################
 
+def write_snapshot(
+        payload: bytes,
+        file_path: str,
+        serializer: str = "json"
+    ) -> tuple[float, float]:
+    """Serializes a marshalled snapshot of the data with the given serializer and atomically writes it to the given file.
+    This runs in the save worker, so it has to stay a plain module level function.
+    Returns how long the serialization and the writing took, in seconds."""
+    start = time.perf_counter()
+    raw = serialization.serialize(marshal.loads(payload), serializer)
+    serialized = time.perf_counter()
+
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'wb') as outfile:
+        outfile.write(raw)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    
+    os.replace(temp_path, file_path)
+
+    # Make sure the rename itself makes it to disk.
+    folder = os.open(os.path.dirname(os.path.abspath(file_path)), os.O_RDONLY)
+    try:
+        os.fsync(folder)
+    finally:
+        os.close(folder)
+
+    return serialized - start, time.perf_counter() - serialized
+
+def write_segments(
+        segments: dict[str, tuple[str, bytes]],
+        folder_path: str
+    ) -> tuple[float, float]:
+    """Writes several marshalled snapshots into the given folder with `write_snapshot`, one file each and in order.
+    The segments are given as `file name -> (serializer, marshalled snapshot)`.
+    Returns the total time taken by the serialization and the writing, in seconds."""
+    os.makedirs(folder_path, exist_ok=True)
+
+    serialize_time = 0.0
+    write_time = 0.0
+    for file_name, (serializer, payload) in segments.items():
+        serialized, written = write_snapshot(payload, os.path.join(folder_path, file_name), serializer)
+        serialize_time += serialized
+        write_time += written
+    
+    return serialize_time, write_time
+
+def back_up_segments(
+        segment_folder: str,
+        store_path: str,
+        index_file_name: str,
+        journal_paths: list[str]
+    ) -> tuple[int, int]:
+    """Backs up the segments on disk and the journal of changes since them into the backup store, and then applies the
+    retention policy.
+    This runs in the save worker, so it has to stay a plain module level function.
+    Returns the amount of chunks written and reused."""
+    manifest = backup_store.create_snapshot(segment_folder, store_path, index_file_name, journal_paths)
+    backup_store.prune(store_path)
+    return manifest["written"], manifest["reused"]
+
 
 class JSON_cog(commands.Cog, name="JSON"):
     
@@ -23,7 +91,22 @@ class JSON_cog(commands.Cog, name="JSON"):
     ####################################
     #####      SETUP
 
-    file_path = "database.json"
+    file_path = "database.json" # Only read if there's no segmented database yet.
+
+    # The database is stored as one segment file per guild vault in `segment_folder`, plus an index file with the
+    # list of guilds and everything that isn't a guild. Changes made through the setters mark the vault, cabinet
+    # and file they touch as dirty, and saves only rewrite the segments of dirty vaults.
+    # Anything that's changed in place without going through a setter should be marked with `mark_dirty`. In case it
+    # isn't, a digest of every loaded vault is kept from when it was last read or written, and vaults that no longer
+    # match theirs are treated as dirty by saves and aren't unloaded.
+    segment_folder = "database/"
+    index_file_name = "index.json"
+
+    # Lazy loading. Only the index is read at startup, and a guild's vault is read from its segment the first time
+    # `get_vault` asks for it. Vaults that haven't been asked for in `vault_idle_timeout` seconds and have no unsaved
+    # changes are dropped from memory again by the hourly loop.
+    lazy_loading = True
+    vault_idle_timeout = 6 * 60 * 60
 
     default_guild = '958392331671830579'
 
@@ -44,16 +127,68 @@ class JSON_cog(commands.Cog, name="JSON"):
 
     data = dict()
 
+    # Journal mode. Every change made through `set_filing_cabinet`, `set_file_in_filing_cabinet`,
+    # `delete_file_in_filing_cabinet` and `journal_file_change` is appended to the journal as one compact line,
+    # so a crash only loses changes that were made in place without going through one of those.
+    # Large files that only have a few top-level keys changed at a time can journal just those keys.
+    # The snapshot in `file_path` is only rewritten when the journal is compacted.
+    journal_enabled = True
+    journal_path = "database.journal"
+    pending_journal_path = "database.journal.pending" # The journal covered by a save that's still being written.
+    journal_compaction_interval = 6 * 60 * 60 # Seconds between scheduled compactions.
+    journal_compaction_size = 64 * 1024 * 1024 # Compact early once the journal is larger than this many bytes.
+
+    journal_file = None
+    last_compaction = 0.0
+
+    # Saving. The data is copied on the event loop, then serialized and written out in a worker so the bot
+    # can keep going in the meantime. The file is written to a temporary file first and then renamed over the
+    # old one, so a crash mid-save can't leave a truncated database behind.
+    save_in_process = True
+
+    save_executor = None
+    running_save = None
+    save_generation = 0
+    last_save_timings = dict()
+
+    # Serialization. The serializer used for the segments and backups, one of `serialization.SERIALIZERS`:
+    # "json" (pretty printed, like the database has always been written), "json_compact", "orjson" (if installed)
+    # or "pickle" (binary). The index is always written as compact JSON and records which serializer the segments
+    # were written with, so it can be changed at any time. Switching between JSON and pickle rewrites every segment
+    # on the next save.
+    serializer = "json_compact"
+    index_serializer = "json_compact"
+    segment_serializer = "json" # The serializer the segments on disk were written with.
+
+    last_load_time = 0.0
+    last_backup_time = 0.0
+
+    # Backups. Backups go into a content addressed store (see `backup_store.py`) that only keeps the cabinets that
+    # changed since the previous backup, so one is taken every hour. In journal mode the journal is backed up along with
+    # the segments, so hourly backups don't need a save. Old backups are pruned by the store's retention
+    # policy, and any of them can be restored with `$JSON restore` or `python3 backup_store.py restore`.
+    backup_store_path = backup_store.DEFAULT_STORE_PATH
+
     ########################################################################################################################
     #####      INIT / DE-INIT
 
     def __init__(self, bot):
         #print("bread __init__ called")
         self.bot = bot
+        self.save_lock = asyncio.Lock()
+        self.dirty = dict() # guild id -> {cabinet name -> set of changed file names, or None if the whole cabinet changed}
+        self.guild_index = dict() # guild id -> names of the cabinets in its vault, for every guild with a segment on disk
+        self.last_access = dict() # guild id -> when `get_vault` last returned its vault
+        self.vault_digests = dict() # guild id -> digest of its vault when it was last read from or written to its segment
         self.daily_task.start()
 
     def cog_unload(self):
         self.daily_task.cancel()
+        self.close_journal()
+
+        if self.save_executor is not None:
+            self.save_executor.shutdown(wait=True) # Don't drop a save that's still being written.
+            self.save_executor = None
         pass
 
     ########################################################################################################################
@@ -65,13 +200,16 @@ class JSON_cog(commands.Cog, name="JSON"):
         # NOTE: THIS LOOP CANNOT BE ALTERED ONCE STARTED, EVEN BY RELOADING. MUST BE STOPPED MANUALLY
         time = datetime.now()
 
-        self.save_all_data() # save every hour
+        await self.scheduled_save() # save every hour, or just compact the journal when it's due in journal mode
         print("doing hourly save of JSON data")
+
+        evicted = self.evict_idle_vaults()
+        print(f"Unloaded {evicted} idle guild vaults.")
+        
+        # The hourly backups take what's on disk along with the journal, the daily one saves everything first.
+        await self.create_backup_async(save = time.hour == 15)
         
         if time.hour == 15:
-            self.create_backup()
-            
-
             print("Daily JSON backup called")
 
     @daily_task.before_loop
@@ -115,7 +253,7 @@ class JSON_cog(commands.Cog, name="JSON"):
             print("Unable to do so.")
             print(err)
 
-        self.save_all_data()
+        self.save_all_data(full=True)
         print("JSON cog: all data saved.")
         pass
 
@@ -135,21 +273,36 @@ class JSON_cog(commands.Cog, name="JSON"):
     
     @JSON.command()
     @commands.is_owner()
-    async def save(self, ctx):
-        self.internal_save()
-        await ctx.send("Done.")
+    async def save(self, ctx, full: typing.Optional[str] = None):
+        await self.internal_save_async(full = full == "full")
+
+        timings = self.last_save_timings
+        await ctx.send("Done. Snapshot: {:.1f} ms, serialization ({}): {:.1f} ms, write: {:.1f} ms.".format(
+            timings["snapshot"] * 1000, self.serializer, timings["serialize"] * 1000, timings["write"] * 1000
+        ))
 
     @JSON.command()
     @commands.is_owner()
     async def load(self, ctx):
         try:
             self.internal_load()
-            await ctx.send("Done.")
+            await ctx.send("Done. Load took {:.1f} ms.".format(self.last_load_time * 1000))
         except:
             await ctx.send("Failed.")
             raise
 
 
+    @JSON.command()
+    @commands.is_owner()
+    async def journal(self, ctx):
+        if not self.journal_enabled:
+            await ctx.send("Journal mode is disabled.")
+            return
+        
+        size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        since = round((time.time() - self.last_compaction) / 60, 1)
+        await ctx.send(f"Journal is {size:,} bytes, last compacted {since} minutes ago.")
+
     @JSON.command()
     @commands.is_owner()
     async def show(self, ctx):
@@ -161,8 +314,38 @@ class JSON_cog(commands.Cog, name="JSON"):
     @commands.is_owner()
     async def backup(self, ctx):
         print("Creating backup")
-        self.create_backup()
-        await ctx.send("Done.")
+        await self.create_backup_async()
+        await ctx.send("Done. Backup took {:.1f} ms.".format(self.last_backup_time * 1000))
+
+    @JSON.command()
+    @commands.is_owner()
+    async def backups(self, ctx):
+        snapshots = backup_store.list_snapshots(self.backup_store_path)
+        if len(snapshots) == 0:
+            await ctx.send("There are no backups.")
+            return
+        
+        names = [manifest["name"] for manifest in snapshots[-20:]]
+        await ctx.send(f"{len(snapshots)} backups, the most recent are:\n" + "\n".join(names))
+
+    @JSON.command()
+    @commands.is_owner()
+    async def restore(self, ctx, *, when: typing.Optional[str] = None):
+        if when is None:
+            await ctx.send("Please give a backup name, a date and time like `2024-05-01 14:00`, or `latest`.")
+            return
+        
+        manifest = backup_store.find_snapshot(when, self.backup_store_path)
+        if manifest is None:
+            await ctx.send(f"No backup found for {when}.")
+            return
+        
+        # Back up the current data first, so the restore can be undone.
+        # The lock is held throughout so no save can write over the restored files.
+        async with self.save_lock:
+            await self.back_up_async()
+            self.internal_restore(manifest)
+        await ctx.send(f"Restored backup {manifest['name']}.")
 
     ####################################
     #####      FILE STUFF
@@ -174,11 +357,41 @@ class JSON_cog(commands.Cog, name="JSON"):
     def internal_load(self: typing.Self) -> None:
         """Loads the data from the database file."""
         print("JSON internal_load called")
+        start = time.perf_counter()
+        self.dirty = dict()
+        self.guild_index = dict()
+        self.last_access = dict()
+        self.vault_digests = dict()
+
         try:
-            with open(self.file_path) as json_file:
-                self.data = json.load(json_file)
-                #print("Loaded "+self.file_path+", contents are:")
-                #print(self.data)
+            index = self.read_index()
+
+            if index is None:
+                print(f"No segmented database found, loading {self.file_path} instead")
+                with open(self.file_path, 'rb') as json_file:
+                    self.data = serialization.deserialize(json_file.read(), "json")
+                    #print("Loaded "+self.file_path+", contents are:")
+                    #print(self.data)
+                
+                # Every guild needs its segment written on the next save.
+                for guild_id in self.get_list_of_all_guilds():
+                    self.mark_dirty(guild_id)
+            else:
+                self.data = dict(index["meta"])
+                self.guild_index = index["guilds"]
+                self.segment_serializer = index.get("serializer", "json")
+
+                # Segments written in another file format have to be read now, so they can all be rewritten.
+                convert = serialization.get_extension(self.segment_serializer) != serialization.get_extension(self.serializer)
+                if convert:
+                    print(f"Converting the database from {self.segment_serializer} to {self.serializer}")
+
+                if convert or not self.lazy_loading:
+                    for guild_id in self.guild_index:
+                        self.load_vault(guild_id)
+
+                        if convert:
+                            self.mark_dirty(guild_id)
             
             #self.data = json.loads(raw_data)
             self.data['load_count'] += 1
@@ -186,9 +399,21 @@ class JSON_cog(commands.Cog, name="JSON"):
         except:
             print("Error loading "+self.file_path)
             self.data = self.default_data
+            for guild_id in self.get_list_of_all_guilds():
+                self.mark_dirty(guild_id)
 
         self.transfer_data_if_nonexistent()
 
+        if self.journal_enabled:
+            self.close_journal()
+            # A journal left pending by an unfinished save is older than the current one, so it goes first.
+            self.replay_journal(self.pending_journal_path)
+            self.replay_journal(self.journal_path)
+            self.open_journal()
+        
+        self.last_load_time = time.perf_counter() - start
+        print("JSON data loaded in {:.1f} ms.".format(self.last_load_time * 1000))
+
     def transfer_data_if_nonexistent(self: typing.Self) -> None:
         """Transfers data from the old format to the new one."""
         # originallly the format was to have everything stored in a flat heirarchy, but now we have guilds and vaults
@@ -196,11 +421,12 @@ class JSON_cog(commands.Cog, name="JSON"):
         # first we check if we have already done it
         default_guild = '958392331671830579'
 
-        if default_guild in self.data.keys():
+        if default_guild in self.data.keys() or default_guild in self.guild_index:
             return
         # then we go through the old data and transfer it
         print("Transferring old data to new format")
         self.data[default_guild] = dict()
+        self.mark_dirty(default_guild)
         if 'bread' in self.data.keys():
             self.data[default_guild]['bread'] = self.data['bread']
             del self.data['bread']
@@ -216,40 +442,586 @@ class JSON_cog(commands.Cog, name="JSON"):
         print("Done.")
 
         
-    def save_all_data(self: typing.Self) -> None:
+    def read_index(self: typing.Self) -> typing.Union[dict, None]:
+        """Reads the index of the segmented database, or returns None if there isn't one."""
+        index_path = os.path.join(self.segment_folder, self.index_file_name)
+        if not os.path.exists(index_path):
+            return None
+        
+        with open(index_path, 'rb') as index_file:
+            return serialization.deserialize(index_file.read(), self.index_serializer)
+
+    def load_vault(
+            self: typing.Self,
+            guild_id: str
+        ) -> dict:
+        """Reads a guild's vault from its segment into the data."""
+        start = time.perf_counter()
+        with open(os.path.join(self.segment_folder, self.get_segment_file_name(guild_id)), 'rb') as segment_file:
+            vault = serialization.deserialize(segment_file.read(), self.segment_serializer)
+        
+        self.data[guild_id] = vault
+        self.vault_digests[guild_id] = self.get_vault_digest(marshal.dumps(vault, 2))
+        print("Loaded vault for guild {} in {:.1f} ms.".format(guild_id, (time.perf_counter() - start) * 1000))
+        return vault
+
+    def get_vault_digest(
+            self: typing.Self,
+            payload: bytes
+        ) -> bytes:
+        """Returns the digest of a vault marshalled with version 2, which has no back references, so the same data
+        always gives the same digest."""
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def changed_in_place(
+            self: typing.Self,
+            guild_id: str
+        ) -> bool:
+        """Returns a boolean for whether a loaded vault no longer matches the digest from when it was last read or
+        written, meaning it was changed in place without being marked dirty."""
+        digest = self.vault_digests.get(guild_id)
+        return digest is None or digest != self.get_vault_digest(marshal.dumps(self.data[guild_id], 2))
+
+    def evict_idle_vaults(self: typing.Self) -> int:
+        """Drops every vault that's been idle for longer than `vault_idle_timeout` and has no unsaved changes from
+        memory. They'll be read from their segments again when they're next needed.
+        Returns the amount of vaults dropped."""
+        if not self.lazy_loading or self.running_save is not None:
+            return 0
+        
+        now = time.time()
+        evicted = 0
+        for guild_id in self.get_list_of_all_guilds():
+            if guild_id not in self.data or guild_id in self.dirty:
+                continue
+
+            # Vaults that have never been saved don't have a segment to be read back from.
+            if guild_id not in self.guild_index:
+                continue
+
+            if now - self.last_access.get(guild_id, 0) < self.vault_idle_timeout:
+                continue
+
+            # Changes made in place without marking the vault dirty would be lost, so it's saved before going.
+            if self.changed_in_place(guild_id):
+                print(f"Vault for guild {guild_id} was changed without being marked dirty, keeping it until it's saved.")
+                self.mark_dirty(guild_id)
+                continue
+
+            del self.data[guild_id]
+            self.last_access.pop(guild_id, None)
+            self.vault_digests.pop(guild_id, None)
+            evicted += 1
+        
+        return evicted
+
+    def save_all_data(
+            self: typing.Self,
+            full: bool = False
+        ) -> None:
         """Saves all the data to file, this just runs `self.internal_save()`."""
-        self.internal_save()
+        self.internal_save(full)
+
+    async def save_all_data_async(
+            self: typing.Self,
+            full: bool = False
+        ) -> None:
+        """Saves all the data to file without blocking the event loop, this just runs `self.internal_save_async()`."""
+        await self.internal_save_async(full)
+
+    async def scheduled_save(self: typing.Self) -> None:
+        """Saves the data on the hourly schedule.
+        In journal mode the journal is only flushed, and the snapshot is rewritten once a compaction is due."""
+        if self.journal_enabled and not self.compaction_due():
+            self.flush_journal()
+            return
+        
+        await self.save_all_data_async()
     
-    def internal_save(self: typing.Self) -> None:
-        """Saves all the data to file."""
+    def internal_save(
+            self: typing.Self,
+            full: bool = False
+        ) -> None:
+        """Saves the segments of every dirty guild to file, or of every guild if `full` is True.
+        In journal mode this also compacts the journal into the snapshot.
+        This blocks until the files are written, `internal_save_async` should be used where possible."""
         print("saving JSON data")
-        #json_string = json.dumps(self.data, indent=2)
 
-        # "Directly" from dictionary
-        with open(self.file_path, 'w') as outfile:
-            json.dump(self.data, outfile, indent=2)
+        # Let any save that's already running finish first, so it can't overwrite this one.
+        self.wait_for_running_save()
+
+        start = time.perf_counter()
+        generation, segments, changed = self.capture_snapshot(full)
+        snapshot_time = time.perf_counter() - start
+
+        try:
+            timings = write_segments(segments, self.segment_folder)
+        except:
+            self.restore_dirty(changed)
+            raise
+
+        self.finish_save(generation, changed, snapshot_time, *timings)
+    
+    async def internal_save_async(
+            self: typing.Self,
+            full: bool = False
+        ) -> None:
+        """Saves the segments of every dirty guild to file, or of every guild if `full` is True.
+        Only the snapshot is taken on the event loop, the serialization and writing are done in a worker process
+        (or thread if `save_in_process` is False)."""
+        print("saving JSON data in the background")
+
+        async with self.save_lock:
+            await self.save_async(full)
+
+    async def save_async(
+            self: typing.Self,
+            full: bool = False
+        ) -> None:
+        """Does the work of `internal_save_async`. The caller has to hold `save_lock`."""
+        start = time.perf_counter()
+        generation, segments, changed = self.capture_snapshot(full)
+        snapshot_time = time.perf_counter() - start
+
+        try:
+            timings = await self.run_in_save_executor(write_segments, segments, self.segment_folder)
+        except:
+            self.restore_dirty(changed)
+            raise
+
+        self.finish_save(generation, changed, snapshot_time, *timings)
+
+    async def run_in_save_executor(
+            self: typing.Self,
+            function: typing.Callable,
+            *args
+        ) -> typing.Any:
+        """Runs a function that works on the files in the save worker and returns its result.
+        The job is kept in `running_save` until it's done, so synchronous saves can wait for it."""
+        # A concurrent future rather than an asyncio one, since synchronous saves have to wait on it without the loop.
+        self.running_save = self.get_save_executor().submit(function, *args)
+        try:
+            return await asyncio.wrap_future(self.running_save)
+        finally:
+            self.running_save = None
+
+    def wait_for_running_save(self: typing.Self) -> None:
+        """Blocks until the save or backup running in the save worker, if any, is done.
+        Whether it worked is up to the coroutine that started it, so errors are ignored here."""
+        running_save = self.running_save
+        if running_save is not None:
+            concurrent.futures.wait([running_save])
 
-    def create_backup(self: typing.Self) -> None:
-        """Creates a backup file and saves the current database to it."""
+    def capture_snapshot(
+            self: typing.Self,
+            full: bool = False
+        ) -> tuple[int, dict[str, bytes], dict]:
+        """Takes a consistent copy of every dirty guild vault and the index, and clears the dirty markers.
+        In journal mode this also moves the journal aside so changes made while the snapshot is being written go to
+        a fresh journal.
+        Returns the save generation, the marshalled segments keyed by file name and the dirty markers that were cleared."""
+        all_guilds = self.get_list_of_all_guilds()
 
-        #first, make sure there's a backup folder (relative path)
-        folder_path = "backup/"
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
+        changed = self.dirty
+        self.dirty = dict()
+        if full:
+            for guild_id in all_guilds:
+                changed.setdefault(guild_id, dict())
         
-        #then, we make the file
-        file_name = datetime.now().strftime('database_backup_%Y:%m:%d_%X.json').replace(":", "-") # Switch colons to hyphens to avoid filename restrictions.
-        with open(folder_path+file_name, 'w') as outfile:
-            print('created ', file_name)
-            #json_string = json.dumps(self.data, indent=2)
-            json.dump(self.data, outfile, indent=2)
+        self.segment_serializer = self.serializer
+
+        # marshal copies the whole tree in C without releasing the GIL, so nothing can change the data midway through.
+        # Every loaded vault is marshalled, so the ones that were changed in place without being marked dirty are
+        # found by their digest and written too.
+        segments = dict()
+        for guild_id in all_guilds:
+            if guild_id not in self.data:
+                continue
+
+            payload = marshal.dumps(self.data[guild_id], 2)
+            digest = self.get_vault_digest(payload)
 
-        print("Backup Created.")
+            if guild_id not in changed:
+                if digest == self.vault_digests.get(guild_id):
+                    continue
+
+                print(f"Vault for guild {guild_id} was changed without being marked dirty.")
+                changed[guild_id] = dict()
+            
+            self.vault_digests[guild_id] = digest
+            segments[self.get_segment_file_name(guild_id)] = (self.serializer, payload)
+
+        # The index goes last, so it's never written before the segments it lists.
+        self.guild_index = {
+            guild_id: list(self.data[guild_id].keys()) if guild_id in self.data else self.guild_index[guild_id]
+            for guild_id in all_guilds
+        }
+        index = {
+            "meta": {key: value for key, value in self.data.items() if key not in self.guild_index},
+            "guilds": self.guild_index,
+            "serializer": self.serializer
+        }
+        segments[self.index_file_name] = (self.index_serializer, marshal.dumps(index))
+
+        self.save_generation += 1
+
+        if self.journal_enabled:
+            self.close_journal()
+            
+            # If an earlier save failed its journal is still pending, so add to the end of it instead of replacing it.
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, 'rb') as journal, open(self.pending_journal_path, 'ab') as pending:
+                    shutil.copyfileobj(journal, pending)
+            
+            self.open_journal(truncate=True)
+        
+        return self.save_generation, segments, changed
+
+    def restore_dirty(
+            self: typing.Self,
+            changed: dict
+        ) -> None:
+        """Puts back the dirty markers of a save that failed, so the next save tries again."""
+        for guild_id, cabinets in changed.items():
+            if not cabinets:
+                self.mark_dirty(guild_id)
+            
+            for cabinet_name, file_names in cabinets.items():
+                if file_names is None:
+                    self.mark_dirty(guild_id, cabinet_name)
+                    continue
+
+                for file_name in file_names:
+                    self.mark_dirty(guild_id, cabinet_name, file_name)
+
+    def finish_save(
+            self: typing.Self,
+            generation: int,
+            changed: dict,
+            snapshot_time: float,
+            serialize_time: float,
+            write_time: float
+        ) -> None:
+        """Records a completed save, and clears the pending journal if no newer save has been started since."""
+        if generation == self.save_generation:
+            # Everything in the pending journal is now in the snapshot. Replaying it again would be harmless since every
+            # record is a plain overwrite, so a crash between the save and this removal loses nothing.
+            try:
+                os.remove(self.pending_journal_path)
+            except FileNotFoundError:
+                pass
+            
+            self.last_compaction = time.time()
+        
+        self.last_save_timings = {
+            "snapshot": snapshot_time,
+            "serialize": serialize_time,
+            "write": write_time
+        }
+        print("JSON data saved. Snapshot took {:.1f} ms, serialization took {:.1f} ms, writing took {:.1f} ms.".format(
+            snapshot_time * 1000, serialize_time * 1000, write_time * 1000
+        ))
+
+        cabinet_count = sum(len(cabinets) for cabinets in changed.values())
+        file_count = sum(len(file_names) for cabinets in changed.values() for file_names in cabinets.values() if file_names is not None)
+        print(f"Wrote {len(changed)} of {len(self.get_list_of_all_guilds())} guild segments, covering {cabinet_count} changed cabinets and {file_count} changed files.")
+
+    def get_save_executor(self: typing.Self) -> concurrent.futures.Executor:
+        """Returns the executor used for saving, creating it if needed."""
+        if self.save_executor is None:
+            if self.save_in_process:
+                # Fork rather than spawn, spawning would import and run main.py again in the worker.
+                self.save_executor = concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork"))
+            else:
+                self.save_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="json_save")
+        
+        return self.save_executor
+
+    def get_segment_file_name(
+            self: typing.Self,
+            guild_id: str
+        ) -> str:
+        """Returns the file name of a guild's segment."""
+        return guild_id + serialization.get_extension(self.segment_serializer)
+
+    def get_segment_file_names(self: typing.Self) -> list[str]:
+        """Returns the file names of every segment, including the index."""
+        return [self.get_segment_file_name(guild_id) for guild_id in self.get_list_of_all_guilds()] + [self.index_file_name]
+
+    def get_backup_journal_paths(self: typing.Self) -> list[str]:
+        """Returns the journal files that have changes the segments on disk don't, oldest first, to be backed up with
+        them. Outside of journal mode every save writes the segments, so there aren't any."""
+        if not self.journal_enabled:
+            return []
+        
+        # Every record is flushed as it's appended, so the save worker can read them all.
+        return [self.pending_journal_path, self.journal_path]
+
+    def create_backup(
+            self: typing.Self,
+            save: bool = False
+        ) -> None:
+        """Backs up the segments and the journal into the backup store, then prunes old backups.
+        If `save` is True the data is saved first, which compacts the journal in journal mode."""
+        start = time.perf_counter()
+        if save:
+            self.internal_save()
+        
+        if self.read_index() is None:
+            print("Nothing to back up yet.")
+            return
+
+        self.wait_for_running_save()
+        back_up_segments(self.segment_folder, self.backup_store_path, self.index_file_name, self.get_backup_journal_paths())
+
+        self.last_backup_time = time.perf_counter() - start
+        print("Backup Created in {:.1f} ms.".format(self.last_backup_time * 1000))
+
+    async def create_backup_async(
+            self: typing.Self,
+            save: bool = False
+        ) -> None:
+        """Backs up the segments and the journal into the backup store, then prunes old backups, without blocking the
+        event loop. If `save` is True the data is saved first, which compacts the journal in journal mode."""
+        async with self.save_lock:
+            await self.back_up_async(save)
+
+    async def back_up_async(
+            self: typing.Self,
+            save: bool = False
+        ) -> None:
+        """Does the work of `create_backup_async`. The caller has to hold `save_lock`, so no save can change the
+        segments or move the journal aside while they're being backed up."""
+        start = time.perf_counter()
+        if save:
+            await self.save_async()
+        
+        if self.read_index() is None:
+            print("Nothing to back up yet.")
+            return
+
+        await self.run_in_save_executor(
+            back_up_segments, self.segment_folder, self.backup_store_path, self.index_file_name, self.get_backup_journal_paths()
+        )
+
+        self.last_backup_time = time.perf_counter() - start
+        print("Backup Created in {:.1f} ms.".format(self.last_backup_time * 1000))
+
+    def internal_restore(
+            self: typing.Self,
+            manifest: dict
+        ) -> None:
+        """Replaces the database with the given backup from the backup store and loads it.
+        Anything in the journal is newer than the backup, so it's replaced by the journal from the backup, which is
+        replayed on top of the restored segments.
+        From the event loop this should be called while holding `save_lock`, so no save can write over the restore."""
+        print(f"Restoring backup {manifest['name']}")
+        self.wait_for_running_save()
+        self.close_journal()
+        for journal_path in (self.journal_path, self.pending_journal_path):
+            try:
+                os.remove(journal_path)
+            except FileNotFoundError:
+                pass
+        
+        backup_store.restore_snapshot(
+            manifest, self.segment_folder, self.backup_store_path, self.serializer, self.index_file_name,
+            journal_path = self.journal_path if self.journal_enabled else None
+        )
+        self.internal_load()
 
 
+    ####################################
+    #####      JOURNAL
+
+    def open_journal(
+            self: typing.Self,
+            truncate: bool = False
+        ) -> None:
+        """Opens the journal file for appending, optionally clearing it first."""
+        if self.journal_file is not None:
+            return
+        
+        self.journal_file = open(self.journal_path, 'w' if truncate else 'a', encoding="utf-8")
+
+    def close_journal(self: typing.Self) -> None:
+        """Flushes and closes the journal file, if it's open."""
+        if self.journal_file is None:
+            return
+        
+        try:
+            self.journal_file.close()
+        finally:
+            self.journal_file = None
+
+    def flush_journal(self: typing.Self) -> None:
+        """Flushes the journal file to disk."""
+        if self.journal_file is None:
+            return
+        
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+
+    def compaction_due(self: typing.Self) -> bool:
+        """Returns a boolean for whether the journal should be folded into the snapshot."""
+        if time.time() - self.last_compaction >= self.journal_compaction_interval:
+            return True
+        
+        try:
+            return os.path.getsize(self.journal_path) >= self.journal_compaction_size
+        except OSError:
+            return False
+
+    def append_journal(
+            self: typing.Self,
+            record: dict
+        ) -> None:
+        """Appends a single record to the journal as one line of compact JSON."""
+        if not self.journal_enabled:
+            return
+        
+        if self.journal_file is None:
+            self.open_journal()
+        
+        self.journal_file.write(serialization.serialize(record, "orjson").decode("utf-8") + "\n")
+        self.journal_file.flush()
+
+    def journal_file_change(
+            self: typing.Self,
+            cabinet_name: str,
+            file_name: str,
+            file: dict,
+            guild: typing.Union[discord.Guild, int, str] = None,
+            keys: typing.Optional[typing.Iterable[str]] = None
+        ) -> None:
+        """Records a change to a file that was made directly on a filing cabinet, without modifying the data.
+        The file is marked as dirty and the change is journalled.
+        If only some top-level keys of the file changed they can be given in `keys`, and only those are journalled
+        instead of the whole file. Keys that are no longer in the file are journalled as removed.
+        This is for cogs like Bread that hold on to their cabinets and write into them themselves."""
+        self.mark_dirty(guild, cabinet_name, file_name)
+
+        if keys is None:
+            self.append_journal({
+                "op": "file",
+                "guild": self.get_guild_key(guild),
+                "cabinet": cabinet_name,
+                "file": file_name,
+                "data": file
+            })
+            return
+        
+        keys = list(keys)
+        self.append_journal({
+            "op": "keys",
+            "guild": self.get_guild_key(guild),
+            "cabinet": cabinet_name,
+            "file": file_name,
+            "data": {key: file[key] for key in keys if key in file},
+            "removed": [key for key in keys if key not in file]
+        })
+
+    def apply_journal_record(
+            self: typing.Self,
+            record: dict
+        ) -> None:
+        """Applies a single journal record to the data."""
+        vault = self.get_vault(record["guild"])
+
+        if record["op"] == "cabinet":
+            vault[record["cabinet"]] = record["data"]
+            self.mark_dirty(record["guild"], record["cabinet"])
+            return
+        
+        self.mark_dirty(record["guild"], record["cabinet"], record["file"])
+        
+        cabinet = vault.get(record["cabinet"])
+        if cabinet is None:
+            cabinet = vault[record["cabinet"]] = dict()
+        
+        if record["op"] == "file":
+            cabinet[record["file"]] = record["data"]
+        elif record["op"] == "keys":
+            file = cabinet.get(record["file"])
+            if not isinstance(file, dict):
+                file = cabinet[record["file"]] = dict()
+            
+            file.update(record["data"])
+            for key in record["removed"]:
+                file.pop(key, None)
+        elif record["op"] == "delete":
+            cabinet.pop(record["file"], None)
+
+    def replay_journal(
+            self: typing.Self,
+            journal_path: str
+        ) -> int:
+        """Replays the journal on top of the loaded snapshot and returns the number of records applied.
+        A partially written final record, from a crash mid-write, is discarded and cut off the file."""
+        if not os.path.exists(journal_path):
+            return 0
+        
+        replayed = 0
+        good_length = 0
+
+        with open(journal_path, 'rb') as journal:
+            for line in journal:
+                if not line.endswith(b"\n"):
+                    break
+
+                try:
+                    record = serialization.deserialize(line, "json")
+                except ValueError:
+                    break
+
+                if line.strip():
+                    self.apply_journal_record(record)
+                    replayed += 1
+                
+                good_length += len(line)
+        
+        if good_length != os.path.getsize(journal_path):
+            print(f"Discarding a damaged journal tail after {replayed} records.")
+            with open(journal_path, 'r+b') as journal:
+                journal.truncate(good_length)
+        
+        print(f"Replayed {replayed} journal records.")
+        return replayed
+
     ####################################
     #####      INTERFACE NEW
 
+    def get_guild_key(
+            self: typing.Self,
+            guild: typing.Union[discord.Guild, int, str]
+        ) -> str:
+        """Returns the key of a guild's vault in the data."""
+        if isinstance(guild, discord.Guild):
+            return str(guild.id)
+        elif isinstance(guild, int):
+            return str(guild)
+        elif guild is None:
+            return self.default_guild
+        return guild
+
+    def mark_dirty(
+            self: typing.Self,
+            guild: typing.Union[discord.Guild, int, str],
+            cabinet_name: typing.Optional[str] = None,
+            file_name: typing.Optional[str] = None
+        ) -> None:
+        """Marks a guild's vault as changed so the next save writes it.
+        Pass a cabinet name and optionally a file name to record more precisely what changed."""
+        cabinets = self.dirty.setdefault(self.get_guild_key(guild), dict())
+
+        if cabinet_name is None:
+            return
+        
+        if file_name is None:
+            cabinets[cabinet_name] = None
+        elif cabinets.setdefault(cabinet_name, set()) is not None:
+            cabinets[cabinet_name].add(file_name)
+
     # every server has a vault. In each vault there is a "bread" and a "chess" among other things
     def get_vault(
             self: typing.Self,
@@ -261,19 +1033,21 @@ class JSON_cog(commands.Cog, name="JSON"):
             # print ("No guild was passed, using default vault")
             # vault = self.data.get(self.default_guild, None)
             raise Exception("No guild was passed")
-        elif isinstance(guild, discord.Guild):
-            vault = self.data.get(str(guild.id), None)
-        elif isinstance(guild, int):
-            vault = self.data.get(str(guild), None)
-        elif isinstance(guild, str):
-            vault = self.data.get(guild, None)
-        else:
+        elif not isinstance(guild, (discord.Guild, int, str)):
             return None
+        
+        guild_id = self.get_guild_key(guild)
+        vault = self.data.get(guild_id, None)
+
+        if vault is None and guild_id in self.guild_index:
+            vault = self.load_vault(guild_id)
     
         if vault is None:
             print ("guild not found, creating new vault")
             vault = dict()
             self.set_vault(guild, vault)
+        
+        self.last_access[guild_id] = time.time()
 
         return vault
 
@@ -291,6 +1065,8 @@ class JSON_cog(commands.Cog, name="JSON"):
             self.data[guild] = vault
         elif guild is None:
             self.data[self.default_guild] = vault
+        
+        self.mark_dirty(guild)
             
     
     def get_filing_cabinet(
@@ -307,6 +1083,7 @@ class JSON_cog(commands.Cog, name="JSON"):
         elif create_if_nonexistent:
             vault[name] = dict()
             self.set_vault(guild, vault)
+            self.mark_dirty(guild, name)
             return vault[name]
         else:
             return None
@@ -315,12 +1092,23 @@ class JSON_cog(commands.Cog, name="JSON"):
             self: typing.Self,
             name: str,
             cabinet: dict,
-            guild: typing.Union[discord.Guild, int, str] = None
+            guild: typing.Union[discord.Guild, int, str] = None,
+            journal: bool = True
         ) -> None:
-        """Sets a filing cabinet within a guild's vault to the given data."""
+        """Sets a filing cabinet within a guild's vault to the given data.
+        Passing `journal = False` skips the journal, for when the changes have already been journalled file by file."""
         vault = self.get_vault(guild)
         vault[name] = cabinet
         self.set_vault(guild, vault)
+        self.mark_dirty(guild, name)
+
+        if journal:
+            self.append_journal({
+                "op": "cabinet",
+                "guild": self.get_guild_key(guild),
+                "cabinet": name,
+                "data": cabinet
+            })
     
     def set_file_in_filing_cabinet(
             self: typing.Self,
@@ -332,7 +1120,7 @@ class JSON_cog(commands.Cog, name="JSON"):
         """Sets a file within a filing cabinet within a guild's vault."""
         cabinet = self.get_filing_cabinet(cabinet_name, guild, create_if_nonexistent=True)
         cabinet[file_name] = file
-        self.set_filing_cabinet(cabinet_name, cabinet, guild)
+        self.journal_file_change(cabinet_name, file_name, file, guild)
     
     def delete_file_in_filing_cabinet(
             self: typing.Self,
@@ -344,18 +1132,41 @@ class JSON_cog(commands.Cog, name="JSON"):
         cabinet = self.get_filing_cabinet(cabinet_name, guild, create_if_nonexistent=True)
         if file_name in cabinet.keys():
             del cabinet[file_name]
-        self.set_filing_cabinet(cabinet_name, cabinet, guild)
+        self.mark_dirty(guild, cabinet_name, file_name)
+        self.append_journal({
+            "op": "delete",
+            "guild": self.get_guild_key(guild),
+            "cabinet": cabinet_name,
+            "file": file_name
+        })
 
     def get_list_of_all_guilds(self: typing.Self) -> list[str]:
-        """Returns a list of every guild id in the database, each in the form of a string."""
-        output = []
+        """Returns a list of every guild id in the database, each in the form of a string. This includes guilds whose
+        vaults haven't been loaded."""
+        output = list(self.guild_index)
         for key in self.data.keys():
             if key == 'load_count':
                 continue
             if key.isnumeric() is False:
                 continue
+            if key in self.guild_index:
+                continue
             output.append(key)
         return output
+    
+    def get_list_of_guilds_with_cabinet(
+            self: typing.Self,
+            name: str
+        ) -> list[str]:
+        """Returns a list of the guild ids whose vaults contain the given filing cabinet, without loading any vaults."""
+        output = []
+        for guild_id in self.get_list_of_all_guilds():
+            if guild_id in self.data:
+                if name in self.data[guild_id]:
+                    output.append(guild_id)
+            elif name in self.guild_index[guild_id]:
+                output.append(guild_id)
+        return output
     """
     # cheeky name for the meta-groups such as bread and enforcement
     def get_filing_cabinet(self, name: str, create_if_nonexistent=False):
@@ -406,6 +1217,8 @@ async def setup(bot):
     json_cog = JSON_cog(bot)
 
     importlib.reload(verification)
+    importlib.reload(serialization)
+    importlib.reload(backup_store)
 
     
     global json_cog_ref 
@@ -0,0 +1,152 @@
+"""Serializers for the database segments, the journal and the backups.
+
+Available serializers:
+    "json"          Pretty printed JSON with an indent of 2, exactly like the database has always been written.
+    "json_compact"  Minified JSON.
+    "orjson"        Minified JSON written with orjson, if it's installed. Falls back to "json_compact" if it isn't.
+    "pickle"        Python's binary pickle format. The fastest and smallest, but not human readable.
+
+Every format except "json" stores very large ints (like the space bitboards, see `space.py`) as
+{"__bitboard__": "<base64>"} instead of thousands of decimal digits. Loading turns them back into ints,
+and loading always understands both forms, so the serializer can be changed at any time.
+"""
+from __future__ import annotations
+
+import typing
+import json
+import pickle
+import base64
+import sys
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Databases written with the "json" serializer, or before there was a choice, store bitboards as decimal digits.
+sys.set_int_max_str_digits(2 ** 31 - 1)
+
+SERIALIZERS = ("json", "json_compact", "orjson", "pickle")
+
+BITBOARD_KEY = "__bitboard__"
+
+# orjson can't write ints outside of these bounds, so anything bigger is written as a bitboard.
+SMALLEST_PLAIN_INT = -2 ** 63
+LARGEST_PLAIN_INT = 2 ** 64 - 1
+
+class Int_Overflow(ValueError):
+    """Raised when orjson has read a number outside of the plain int bounds, which it turns into a float."""
+
+def get_extension(serializer: str) -> str:
+    """Returns the file extension to use for files written with the given serializer."""
+    if serializer == "pickle":
+        return ".pickle"
+
+    return ".json"
+
+def encode_bitboards(data: typing.Any) -> typing.Any:
+    """Returns the given data with every very large int replaced by a base64 bitboard.
+    Containers are only copied if something inside them had to be replaced."""
+    if isinstance(data, dict):
+        output = None
+        for key, value in data.items():
+            encoded = encode_bitboards(value)
+            if encoded is not value:
+                if output is None:
+                    output = dict(data)
+                output[key] = encoded
+
+        return data if output is None else output
+
+    if isinstance(data, (list, tuple)):
+        output = None
+        for index, value in enumerate(data):
+            encoded = encode_bitboards(value)
+            if encoded is not value:
+                if output is None:
+                    output = list(data)
+                output[index] = encoded
+
+        return data if output is None else output
+
+    if type(data) is int and not (SMALLEST_PLAIN_INT <= data <= LARGEST_PLAIN_INT):
+        raw = data.to_bytes(data.bit_length() // 8 + 1, "little", signed=True)
+        return {BITBOARD_KEY: base64.b64encode(raw).decode("ascii")}
+
+    return data
+
+def decode_bitboards(
+        data: typing.Any,
+        check_overflow: bool = False
+    ) -> typing.Any:
+    """Turns every base64 bitboard in the given data back into an int, modifying the data in place.
+    Returns the data, or the int if the data itself was a bitboard.
+    With `check_overflow` this raises `Int_Overflow` if there's a float outside of the plain int bounds."""
+    if isinstance(data, dict):
+        if len(data) == 1 and BITBOARD_KEY in data:
+            return int.from_bytes(base64.b64decode(data[BITBOARD_KEY]), "little", signed=True)
+
+        for key, value in data.items():
+            if isinstance(value, (dict, list)):
+                data[key] = decode_bitboards(value, check_overflow)
+            elif check_overflow and type(value) is float and not SMALLEST_PLAIN_INT < value < LARGEST_PLAIN_INT:
+                raise Int_Overflow(key)
+
+    elif isinstance(data, list):
+        for index, value in enumerate(data):
+            if isinstance(value, (dict, list)):
+                data[index] = decode_bitboards(value, check_overflow)
+            elif check_overflow and type(value) is float and not SMALLEST_PLAIN_INT < value < LARGEST_PLAIN_INT:
+                raise Int_Overflow(index)
+
+    elif check_overflow and type(data) is float and not SMALLEST_PLAIN_INT < data < LARGEST_PLAIN_INT:
+        raise Int_Overflow()
+
+    return data
+
+def serialize(
+        data: typing.Any,
+        serializer: str = "json"
+    ) -> bytes:
+    """Serializes the given data with the given serializer."""
+    if serializer == "pickle":
+        return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+    if serializer == "json":
+        return json.dumps(data, indent=2).encode("utf-8")
+
+    data = encode_bitboards(data)
+
+    if serializer == "orjson" and orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+def deserialize(
+        raw: typing.Union[bytes, str],
+        serializer: str = "json"
+    ) -> typing.Any:
+    """Deserializes data written by `serialize`. All the JSON based serializers can read each other's output.
+    Very large ints come back as ints, whichever way they were written:
+
+    >>> value = {"total_dough": 2 ** 64 + 1, "bitboard": -3 ** 200}
+    >>> all(deserialize(serialize(value, name), name) == value for name in SERIALIZERS)
+    True
+    >>> deserialize(b'{"total_dough": 18446744073709551617}')
+    {'total_dough': 18446744073709551617}
+    """
+    if serializer == "pickle":
+        return pickle.loads(raw)
+
+    if orjson is not None:
+        # orjson reads ints outside of the plain int bounds as floats instead of raising an error (and only raises for
+        # ones too big for a float). Data written with the "json" serializer or from before very large ints were written
+        # as bitboards (old segments, database.json, old SQLite rows) can have them, so if anything that big turns up
+        # the data is read with the json module instead. Floats that really are that big get read again too, which is
+        # slower but gives the same result.
+        try:
+            return decode_bitboards(orjson.loads(raw), check_overflow=True)
+        except (Int_Overflow, orjson.JSONDecodeError):
+            pass
+
+    return decode_bitboards(json.loads(raw))